@@ -0,0 +1,113 @@
+# action_results.py
+import threading
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+# תוצאות מובנות של פעולות הסוכן. כל פעולה מחזירה אובייקט תוצאה (במקום להדפיס ל-stdout),
+# והתוצאות נאספות ב-ResultCollector של הבקשה – כך בקשות ו-workers במקביל לא מתערבבים.
+
+
+@dataclass
+class ActionResult:
+    command: str
+    ok: bool = True
+    error: Optional[str] = None
+    messages: List[str] = field(default_factory=list)  # שורות הלוג הקריאות (כמו ה-print הישן)
+
+    def log(self, *args: Any) -> None:
+        self.messages.append(" ".join(str(a) for a in args))
+
+    def include(self, other: "ActionResult") -> None:
+        """Appends the log lines of a nested operation (e.g. the delete performed by a query)."""
+        self.messages.extend(other.messages)
+        if not other.ok:
+            self.ok = False
+            self.error = self.error or other.error
+
+    @property
+    def text(self) -> str:
+        return "".join(m + "\n" for m in self.messages)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {"command": self.command, "ok": self.ok, "messages": list(self.messages)}
+        if self.error is not None:
+            data["error"] = self.error
+        return data
+
+
+@dataclass
+class AddEventResult(ActionResult):
+    command: str = "add_event"
+    events: List[Dict[str, Any]] = field(default_factory=list)  # summary, ok, link | error
+
+    @property
+    def created(self) -> int:
+        return sum(1 for e in self.events if e["ok"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**super().to_dict(), "events": self.events}
+
+
+@dataclass
+class DeleteResult(ActionResult):
+    command: str = "delete_event"
+    events: List[Dict[str, Any]] = field(default_factory=list)  # id, summary, ok, error?
+    answer: Optional[str] = None
+
+    @property
+    def deleted(self) -> int:
+        return sum(1 for e in self.events if e["ok"])
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**super().to_dict(), "events": self.events, "answer": self.answer}
+
+
+@dataclass
+class QueryResult(ActionResult):
+    command: str = "query_event"
+    answer: Optional[str] = None
+    deleted: Optional[DeleteResult] = None  # כשה-LLM ביקש למחוק (delete_titles)
+
+    def to_dict(self) -> Dict[str, Any]:
+        data = {**super().to_dict(), "answer": self.answer}
+        if self.deleted is not None:
+            data["deleted"] = self.deleted.events
+        return data
+
+
+@dataclass
+class AnswerResult(ActionResult):
+    command: str = "general_answer"
+    answer: str = ""
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {**super().to_dict(), "answer": self.answer}
+
+
+class ResultCollector:
+    """
+    Per-request sink for action results. Workers may finish in any order; results are kept
+    by the index of their action so logs() is always in the planned order.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results: Dict[int, ActionResult] = {}
+
+    def add(self, index: int, result: ActionResult) -> None:
+        with self._lock:
+            self._results[index] = result
+
+    @property
+    def results(self) -> List[ActionResult]:
+        with self._lock:
+            return [self._results[i] for i in sorted(self._results)]
+
+    def logs(self) -> str:
+        return "".join(r.text for r in self.results)
+
+    def succeeded(self) -> int:
+        return sum(1 for r in self.results if r.ok)
+
+    def to_list(self) -> List[Dict[str, Any]]:
+        return [r.to_dict() for r in self.results]
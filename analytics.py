@@ -0,0 +1,207 @@
+# analytics.py
+import bisect
+import os
+import re
+from collections import OrderedDict
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+# חישובים דטרמיניסטיים על האירועים שנשלפו (התנגשויות, חלונות פנויים, ספירות ומשכים),
+# כדי שה-LLM יקבל מספרים מדויקים ורק ינסח את התשובה.
+
+# שעות היום שבהן מחפשים חלונות פנויים
+WORK_DAY_START = time.fromisoformat(os.getenv("FREE_SLOTS_DAY_START", "08:00"))
+WORK_DAY_END = time.fromisoformat(os.getenv("FREE_SLOTS_DAY_END", "20:00"))
+MIN_FREE_MINUTES = int(os.getenv("FREE_SLOTS_MIN_MINUTES", "30"))
+MAX_FREE_SLOT_DAYS = 31
+MAX_LISTED = 40  # כמה התנגשויות/כותרות לכל היותר נכנסות לטקסט ל-LLM
+
+# המילים באנגלית מעוגנות בגבולות מילה ("count" לא יתפוס את "account"); בעברית אין עיגון
+# בתחילת המילה כי אותיות השימוש (ו, ה, ב...) נצמדות אליה
+_INTENT_PATTERNS = {
+    "conflicts": re.compile(r"\b(?:conflict\w*|overlap\w*|clash\w*|double[- ]?book\w*)|התנגש|חופף|חופפ",
+                            re.IGNORECASE),
+    "free_slots": re.compile(r"\b(?:free|available|availability|open slots?|gaps?)\b|פנוי|פנויה|זמן פנוי",
+                             re.IGNORECASE),
+    "count": re.compile(r"\b(?:how many|number of|count|counts)\b|כמה", re.IGNORECASE),
+    "duration": re.compile(r"\b(?:how long|how much time|total|hours?|minutes?|busy)\b|כמה זמן|סה\"כ|שעות",
+                           re.IGNORECASE),
+}
+
+
+def detect_intents(question: str) -> List[str]:
+    return [name for name, pattern in _INTENT_PATTERNS.items() if pattern.search(question or "")]
+
+
+def _fmt_minutes(minutes: float) -> str:
+    minutes = int(round(minutes))
+    return f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+class Interval:
+    __slots__ = ("start", "end", "title", "event")
+
+    def __init__(self, start: datetime, end: datetime, title: str, event: Dict[str, Any]):
+        self.start = start
+        self.end = end
+        self.title = title
+        self.event = event
+
+    @property
+    def minutes(self) -> float:
+        return (self.end - self.start).total_seconds() / 60
+
+
+class IntervalIndex:
+    """
+    Timed events sorted by start. Overlap lookups bisect the starts between (lo - longest event)
+    and hi, so only a short slice is scanned. All-day events are kept aside (they don't block time slots).
+    """
+
+    def __init__(self, items: List[Dict[str, Any]], time_zone: str = "Asia/Jerusalem"):
+        self.tz = ZoneInfo(time_zone)
+        self.intervals: List[Interval] = []
+        self.all_day: List[Dict[str, Any]] = []
+        for ev in items:
+            start, end = ev.get("start") or {}, ev.get("end") or {}
+            if not start.get("dateTime") or not end.get("dateTime"):
+                self.all_day.append(ev)
+                continue
+            s = self._local(start["dateTime"])
+            e = self._local(end["dateTime"])
+            self.intervals.append(Interval(s, max(s, e), ev.get("summary") or "", ev))
+        self.intervals.sort(key=lambda iv: (iv.start, iv.end))
+        self._starts = [iv.start for iv in self.intervals]
+        self._longest = max((iv.end - iv.start for iv in self.intervals), default=timedelta(0))
+
+    def _local(self, value: str) -> datetime:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=self.tz)
+        return dt.astimezone(self.tz)
+
+    def overlapping(self, lo: datetime, hi: datetime) -> List[Interval]:
+        """Intervals that intersect [lo, hi)."""
+        left = bisect.bisect_left(self._starts, lo - self._longest)
+        right = bisect.bisect_left(self._starts, hi)
+        return [iv for iv in self.intervals[left:right] if iv.end > lo]
+
+    def conflicts(self) -> List[Tuple[Interval, Interval]]:
+        """Every pair of overlapping timed events (sweep line over the sorted starts)."""
+        pairs = []
+        active: List[Interval] = []
+        for iv in self.intervals:
+            active = [a for a in active if a.end > iv.start]
+            pairs.extend((a, iv) for a in active)
+            active.append(iv)
+        return pairs
+
+    def busy_blocks(self) -> List[Tuple[datetime, datetime]]:
+        """Union of all timed intervals."""
+        blocks: List[List[datetime]] = []
+        for iv in self.intervals:
+            if blocks and iv.start <= blocks[-1][1]:
+                blocks[-1][1] = max(blocks[-1][1], iv.end)
+            else:
+                blocks.append([iv.start, iv.end])
+        return [(s, e) for s, e in blocks]
+
+    def free_slots(self, lo: datetime, hi: datetime,
+                   day_start: time = WORK_DAY_START, day_end: time = WORK_DAY_END,
+                   min_minutes: int = MIN_FREE_MINUTES) -> List[Tuple[datetime, datetime]]:
+        """Gaps of at least min_minutes between day_start and day_end on every day of [lo, hi)."""
+        slots = []
+        day = lo.date()
+        while day <= hi.date():
+            window_lo = max(lo, datetime.combine(day, day_start, tzinfo=self.tz))
+            window_hi = min(hi, datetime.combine(day, day_end, tzinfo=self.tz))
+            cursor = window_lo
+            for iv in self.overlapping(window_lo, window_hi):
+                if iv.start - cursor >= timedelta(minutes=min_minutes):
+                    slots.append((cursor, iv.start))
+                cursor = max(cursor, iv.end)
+            if window_hi - cursor >= timedelta(minutes=min_minutes):
+                slots.append((cursor, window_hi))
+            day += timedelta(days=1)
+        return slots
+
+
+def compute_facts(items: List[Dict[str, Any]], from_time: str, to_time: str,
+                  time_zone: str = "Asia/Jerusalem") -> Dict[str, Any]:
+    index = IntervalIndex(items, time_zone)
+    tz = index.tz
+    lo = datetime.fromisoformat(from_time.replace("Z", "+00:00")).astimezone(tz)
+    hi = datetime.fromisoformat(to_time.replace("Z", "+00:00")).astimezone(tz)
+
+    per_day: "OrderedDict[date, List[float]]" = OrderedDict()
+    per_title: Dict[str, List[Any]] = {}
+    for iv in index.intervals:
+        day_stats = per_day.setdefault(iv.start.date(), [0, 0.0])
+        day_stats[0] += 1
+        day_stats[1] += iv.minutes
+        title_stats = per_title.setdefault(iv.title.casefold(), [iv.title, 0, 0.0])
+        title_stats[1] += 1
+        title_stats[2] += iv.minutes
+    for ev in index.all_day:
+        title = ev.get("summary") or ""
+        per_title.setdefault(title.casefold(), [title, 0, 0.0])[1] += 1
+
+    busy = index.busy_blocks()
+    facts: Dict[str, Any] = {
+        "events": len(items),
+        "timed": len(index.intervals),
+        "all_day": len(index.all_day),
+        "scheduled_minutes": sum(iv.minutes for iv in index.intervals),
+        "busy_minutes": sum((e - s).total_seconds() / 60 for s, e in busy),
+        "per_day": [(d, n, m) for d, (n, m) in per_day.items()],
+        "per_title": sorted(per_title.values(), key=lambda t: (-t[1], t[0])),
+        "earliest": index.intervals[0] if index.intervals else None,
+        "latest": max(index.intervals, key=lambda iv: iv.end) if index.intervals else None,
+        "conflicts": index.conflicts(),
+        "free_slots": None,
+    }
+    if 0 < (hi.date() - lo.date()).days + 1 <= MAX_FREE_SLOT_DAYS:
+        facts["free_slots"] = index.free_slots(lo, hi)
+    return facts
+
+
+def facts_text(facts: Dict[str, Any], intents: Optional[List[str]] = None) -> str:
+    """Renders the facts as short lines for the LLM prompt."""
+    fmt = lambda dt: dt.strftime("%Y-%m-%d %H:%M")
+    lines = [
+        "Precomputed facts (exact – use these numbers, do not recount):",
+        f"events: {facts['events']} (timed {facts['timed']}, all-day {facts['all_day']}); "
+        f"scheduled time: {_fmt_minutes(facts['scheduled_minutes'])}; "
+        f"busy time (overlaps merged): {_fmt_minutes(facts['busy_minutes'])}",
+    ]
+    if facts["per_day"] and len(facts["per_day"]) <= MAX_FREE_SLOT_DAYS * 2:
+        lines.append("per day: " + "; ".join(
+            f"{d.isoformat()} {n}x {_fmt_minutes(m)}" for d, n, m in facts["per_day"]))
+    elif facts["per_day"]:
+        per_month: "OrderedDict[str, List[float]]" = OrderedDict()
+        for d, n, m in facts["per_day"]:
+            month = per_month.setdefault(d.strftime("%Y-%m"), [0, 0.0])
+            month[0] += n
+            month[1] += m
+        lines.append("per month: " + "; ".join(
+            f"{month} {n}x {_fmt_minutes(m)}" for month, (n, m) in per_month.items()))
+    if facts["per_title"]:
+        lines.append("per title: " + "; ".join(
+            f"\"{title}\" {n}x {_fmt_minutes(m)}" for title, n, m in facts["per_title"][:MAX_LISTED]))
+    if facts["earliest"] is not None:
+        lines.append(f"earliest start: {fmt(facts['earliest'].start)} \"{facts['earliest'].title}\"; "
+                     f"latest end: {fmt(facts['latest'].end)} \"{facts['latest'].title}\"")
+    conflicts = facts["conflicts"]
+    lines.append(f"conflicts: {len(conflicts)}" + (": " + "; ".join(
+        f"{fmt(a.start)}–{a.end.strftime('%H:%M')} \"{a.title}\" overlaps "
+        f"{fmt(b.start)}–{b.end.strftime('%H:%M')} \"{b.title}\""
+        for a, b in conflicts[:MAX_LISTED]) if conflicts else ""))
+    if facts["free_slots"] is not None and (intents is None or "free_slots" in intents):
+        slots = facts["free_slots"]
+        lines.append(
+            f"free slots ({WORK_DAY_START.strftime('%H:%M')}–{WORK_DAY_END.strftime('%H:%M')}, "
+            f"at least {MIN_FREE_MINUTES} min): "
+            + ("; ".join(f"{fmt(s)}–{e.strftime('%H:%M')}" for s, e in slots) if slots else "none")
+        )
+    return "\n".join(lines)
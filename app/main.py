@@ -1,19 +1,85 @@
 # app/main.py
-from fastapi import FastAPI, HTTPException
+from fastapi import Depends, FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Any, Dict, List
-import io
-from contextlib import redirect_stdout
+import json
+import asyncio
+from contextlib import asynccontextmanager
+from datetime import datetime
+from fastapi.responses import JSONResponse, StreamingResponse
+from urllib.parse import quote
+import traceback
 
 # ייבוא הקובץ agent.py שנמצא בתיקייה הראשית
 import sys, os
 sys.path.append(os.path.dirname(os.path.dirname(__file__)))  # מאפשר גישה לקובץ agent.py
 import agent
+import plan_cache
+import event_compaction
+import calendar_watch
+import rate_limiter
+import job_queue
+import model_router
+import prompt_builder
+import event_prefetch
+import session_auth
+from credential_store import DEFAULT_USER
+from action_results import ResultCollector
 from tools import get_calendar_service, get_auth_url, exchange_code_for_token  # ← חשוב
 
 
-app = FastAPI(title="Google Calendar Agent API", version="1.0")
+def _run_job(actions: List[Dict[str, Any]], user_id: str, collector: ResultCollector):
+    # רץ ב-thread של תור העבודות (ראה job_queue.py)
+    return agent.execute_actions(actions, get_calendar_service(user_id),
+                                 service_factory=lambda: get_calendar_service(user_id), collector=collector)
+
+
+def _jobs() -> job_queue.JobQueue:
+    return job_queue.get_queue(_run_job)
+
+
+@asynccontextmanager
+async def _lifespan(app: FastAPI):
+    # REQUIRE_SESSION=1 בלי SESSION_SECRET – השרת לא עולה
+    session_auth.check_config()
+    # חידוש ערוצי events.watch לפני שתוקפם פג (רק אם push notifications מופעלים)
+    stop_renewal = calendar_watch.start_renewal_thread(get_calendar_service) if calendar_watch.WATCH_ENABLED else None
+    # עבודות שנשארו בתור מהרצה קודמת ממשיכות מיד
+    _jobs().start()
+    yield
+    _jobs().stop(timeout=5)
+    if stop_renewal is not None:
+        stop_renewal.set()
+
+
+app = FastAPI(title="Google Calendar Agent API", version="1.0", lifespan=_lifespan)
+
+
+def _session_user(authorization: str | None) -> str | None:
+    scheme, _, token = (authorization or "").partition(" ")
+    if not token:
+        return None
+    if scheme.lower() != "bearer":
+        raise HTTPException(status_code=401, detail="expected a Bearer session token",
+                            headers={"WWW-Authenticate": "Bearer"})
+    try:
+        return session_auth.verify_session(token.strip())
+    except session_auth.AuthError as e:
+        raise HTTPException(status_code=401, detail=str(e), headers={"WWW-Authenticate": "Bearer"})
+
+
+def current_user(authorization: str | None = Header(None)) -> str:
+    """
+    המשתמש של הבקשה – מה-session token (ראה session_auth.py), לעולם לא משדה שהלקוח בוחר.
+    """
+    user_id = _session_user(authorization)
+    if user_id is not None:
+        return user_id
+    if session_auth.REQUIRE_SESSION:
+        raise HTTPException(status_code=401, detail="missing session token – log in via /oauth2/start",
+                            headers={"WWW-Authenticate": "Bearer"})
+    return DEFAULT_USER
 
 # הרשה קריאות מהאפליקציה (CORS)
 app.add_middleware(
@@ -36,38 +102,81 @@ class ParseResponse(BaseModel):
 
 class ExecuteRequest(BaseModel):
     actions: List[Dict[str, Any]]
+    background: bool = False  # true → 202 + job_id מיד, הביצוע בתור העבודות (GET /jobs/{job_id})
 
 class ExecuteResponse(BaseModel):
     ok: bool
     executed: int
     logs: str | None = None
+    results: List[Dict[str, Any]] | None = None  # תוצאה מובנית לכל פעולה, לפי הסדר
 
 
 # ----------------------------------------------------
 # Endpoints
 # ----------------------------------------------------
 @app.get("/health")
-def health_check():
+async def health_check():
     return {"status": "ok"}
 
 
+@app.get("/metrics")
+async def metrics():
+    """
+    מוני ביצועים פנימיים (מטמון תוכניות וכו').
+    """
+    cache = plan_cache.get_plan_cache()
+    return {
+        "plan_cache": cache.stats() if cache else None,
+        "query_compaction": event_compaction.compaction_stats(),
+        "calendar_watch": calendar_watch.get_registry().stats() if calendar_watch.WATCH_ENABLED else None,
+        "calendar_rate_limiter": rate_limiter.get_scheduler().stats(),
+        "jobs": await asyncio.to_thread(_jobs().stats),
+        "llm_routing": model_router.get_stats().stats(),
+        "llm_tokens": prompt_builder.get_usage().stats(),
+    }
+
+
 @app.post("/parse", response_model=ParseResponse)
-def parse_prompt(req: ParseRequest):
+async def parse_prompt(req: ParseRequest):
     """
     שלב 1 – פירוק הפרומפט לרשימת פעולות בלבד (ללא ביצוע)
     """
     try:
-        actions = agent.plan_actions(req.prompt)
+        actions = await agent.plan_actions_async(req.prompt)
         return ParseResponse(ok=True, actions=actions)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
-@app.post("/execute", response_model=ExecuteResponse)
-def execute_actions(req: ExecuteRequest):
-    import io
-    from contextlib import redirect_stdout
+def _sse(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
 
+
+@app.post("/parse/stream")
+async def parse_prompt_stream(req: ParseRequest):
+    """
+    כמו /parse, אבל בזרם Server-Sent Events: כל פעולה נשלחת ללקוח (event: action)
+    ברגע שה-LLM סגר אותה, ובסוף event: done (או event: error).
+    """
+    async def _events():
+        count = 0
+        try:
+            async for action in agent.stream_actions_async(req.prompt):
+                count += 1
+                yield _sse("action", action)
+            yield _sse("done", {"ok": True, "count": count})
+        except Exception as e:
+            yield _sse("error", {"ok": False, "detail": str(e)})
+
+    return StreamingResponse(
+        _events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/execute", response_model=ExecuteResponse)
+async def execute_actions(req: ExecuteRequest, user_id: str = Depends(current_user)):
     # פונקציה פנימית שמוציאה את ה-payload (אם קיים) לרמה העליונה
     def _unwrap_payload(a: dict) -> dict:
         """מאחד payload לרמה העליונה אם קיים."""
@@ -80,14 +189,101 @@ def execute_actions(req: ExecuteRequest):
     # ננקה את כל האובייקטים כדי שיתאימו למה ש-agent מצפה
     normalized_actions = [_unwrap_payload(a) for a in req.actions]
 
-    buf = io.StringIO()
+    if req.background:
+        job_id = await asyncio.to_thread(_jobs().submit, normalized_actions, user_id)
+        return JSONResponse(status_code=202, content={
+            "ok": True, "job_id": job_id, "status": job_queue.QUEUED,
+            "total": len(normalized_actions), "status_url": f"/jobs/{job_id}",
+        })
+
+    # כל בקשה אוספת את התוצאות שלה (בלי להחליף את sys.stdout של כל התהליך)
+    collector = ResultCollector()
     try:
-        service = get_calendar_service()
-        with redirect_stdout(buf):
-            agent.execute_actions(normalized_actions, service=service)
-        return ExecuteResponse(ok=True, executed=len(normalized_actions), logs=buf.getvalue())
+        # ה-LLM וה-Calendar לא תופסים את ה-event loop: העבודה החוסמת רצה ב-threads
+        await agent.execute_actions_async(normalized_actions,
+                                          service_factory=lambda: get_calendar_service(user_id),
+                                          collector=collector)
+        return ExecuteResponse(ok=True, executed=collector.succeeded(), logs=collector.logs(),
+                               results=collector.to_list())
     except Exception as e:
-        return ExecuteResponse(ok=False, executed=0, logs=f"Error: {e}\n{buf.getvalue()}")
+        return ExecuteResponse(ok=False, executed=collector.succeeded(),
+                               logs=f"Error: {e}\n{collector.logs()}", results=collector.to_list())
+
+
+@app.get("/jobs/{job_id}")
+async def job_status(job_id: str, user_id: str = Depends(current_user)):
+    """
+    מצב של עבודת /execute ברקע: status (queued / running / succeeded / failed),
+    כמה פעולות הסתיימו מתוך total, והתוצאה של כל פעולה שהסתיימה (לפי הסדר).
+    """
+    job = await asyncio.to_thread(_jobs().get, job_id)
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="job not found")
+    return {"ok": True, **job}
+
+# ----------------------------------------------------
+# /run – תכנון + ביצוע בבקשה אחת
+# ----------------------------------------------------
+class RunRequest(BaseModel):
+    prompt: str
+    dry_run: bool = False  # true → רק תכנון (בלי ביצוע ובלי גישה ליומן)
+
+class RunResponse(BaseModel):
+    ok: bool
+    actions: List[Dict[str, Any]]
+    executed: int = 0
+    logs: str | None = None
+    results: List[Dict[str, Any]] | None = None
+    prefetch: Dict[str, Any] | None = None  # הטווח שנשלף מראש וכמה פעולות השתמשו בו
+
+
+# prefetch שלא נדרש ממשיך ברקע (ומחמם את מטמון האירועים) – שומרים הפניה עד שיסתיים
+_background_tasks: set = set()
+
+
+@app.post("/run", response_model=RunResponse)
+async def run_prompt(req: RunRequest, user_id: str = Depends(current_user)):
+    """
+    מתכנן ומבצע את הפרומפט בבקשה אחת.
+    בזמן שה-LLM מתכנן, הטווח הסביר של התאריכים כבר נשלף מהיומן (ראה event_prefetch.py),
+    ושאילתות / מחיקות שהטווח שלהן בתוכו לא מחכות לסבב נוסף מול Google Calendar.
+    """
+    if req.dry_run:
+        try:
+            actions = await agent.plan_actions_async(req.prompt)
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+        logs = "Dry run – planned actions (not executed):\n" + "".join(
+            json.dumps(a, ensure_ascii=False) + "\n" for a in actions)
+        return RunResponse(ok=True, actions=actions, logs=logs)
+
+    today = datetime.strptime(agent.get_today(), "%Y-%m-%d").date()
+    prefetch = event_prefetch.Prefetch(*event_prefetch.guess_range(req.prompt, today))
+    task = asyncio.create_task(asyncio.to_thread(
+        prefetch.run, lambda time_min, time_max: agent.list_events(get_calendar_service(user_id), time_min, time_max)
+    ))
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+
+    try:
+        actions = await agent.plan_actions_async(req.prompt)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+    # מחכים לשליפה רק אם היא באמת תענה על אחת הקריאות; אחרת היא ממשיכה ברקע ולא מעכבת את הביצוע
+    if agent.prefetch_covers_a_read(prefetch, actions):
+        await task
+
+    collector = ResultCollector()
+    try:
+        await agent.execute_actions_async(actions, service_factory=lambda: get_calendar_service(user_id),
+                                          collector=collector, prefetched=prefetch)
+        return RunResponse(ok=True, actions=actions, executed=collector.succeeded(), logs=collector.logs(),
+                           results=collector.to_list(), prefetch=prefetch.stats())
+    except Exception as e:
+        return RunResponse(ok=False, actions=actions, executed=collector.succeeded(),
+                           logs=f"Error: {e}\n{collector.logs()}",
+                           results=collector.to_list(), prefetch=prefetch.stats())
 
 # ---- הוספה ל-Schemas (ליד שאר ה-Pydantic) ----
 from typing import Optional
@@ -96,7 +292,9 @@ class EventsQuery(BaseModel):
     from_datetime: str  # "YYYY-MM-DDTHH:MM:SS"
     to_datetime: str    # "YYYY-MM-DDTHH:MM:SS"
     time_zone: str = "Asia/Jerusalem"
-    page_size: int = 50
+    page_size: int = Field(50, ge=1, le=agent.MAX_PAGE_SIZE)
+    page_token: Optional[str] = None  # next_page_token מתשובה קודמת
+    stream: bool = False              # true → כל האירועים בטווח כ-NDJSON (שורה לכל אירוע)
 
 class EventItem(BaseModel):
     id: str
@@ -108,41 +306,52 @@ class EventItem(BaseModel):
 class EventsResponse(BaseModel):
     ok: bool
     events: List[EventItem]
+    next_page_token: Optional[str] = None
+
+
+def _event_item(it: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "id": it.get("id"),
+        "summary": it.get("summary"),
+        "start": it.get("start"),
+        "end": it.get("end"),
+        "recurringEventId": it.get("recurringEventId"),
+    }
 
 # ---- הוסף את ה-endpoint עצמו ----
 @app.post("/events", response_model=EventsResponse)
-def list_events(req: EventsQuery):
+async def list_events(req: EventsQuery, user_id: str = Depends(current_user)):
     """
     מחזיר אירועים גולמיים מהיומן בטווח תאריכים נתון.
     השרת ממיר את ה-local datetime ל-RFC3339 עם offset נכון (כולל DST).
+    עם stream=true מוחזר זרם NDJSON של כל האירועים בטווח; אחרת עמוד אחד + next_page_token.
     """
     try:
-        service = get_calendar_service()
+        service = await asyncio.to_thread(get_calendar_service, user_id)
         time_min = agent._to_rfc3339_with_tz(req.from_datetime, req.time_zone)
         time_max = agent._to_rfc3339_with_tz(req.to_datetime, req.time_zone)
 
-        result = service.events().list(
-            calendarId='primary',
-            timeMin=time_min,
-            timeMax=time_max,
-            singleEvents=True,
-            orderBy='startTime',
-            maxResults=req.page_size,
-        ).execute()
-
-        items = result.get("items", [])
-        events: List[Dict[str, Any]] = []
-        for it in items:
-            events.append({
-                "id": it.get("id"),
-                "summary": it.get("summary"),
-                "start": it.get("start"),
-                "end": it.get("end"),
-                "recurringEventId": it.get("recurringEventId"),
-            })
-
-        return EventsResponse(ok=True, events=events)
-
+        if req.stream:
+            def _ndjson():
+                try:
+                    for it in agent.iter_events(service, time_min, time_max):
+                        yield json.dumps(_event_item(it), ensure_ascii=False) + "\n"
+                except Exception as e:
+                    yield json.dumps({"ok": False, "error": str(e)}) + "\n"
+            return StreamingResponse(_ndjson(), media_type="application/x-ndjson")
+
+        try:
+            items, next_token = await asyncio.to_thread(
+                agent.list_events_page, service, time_min, time_max, req.page_size, req.page_token
+            )
+        except agent.PageCursorExpired as e:
+            # הלקוח צריך להתחיל מהעמוד הראשון (אחרת יקבל אירועים כפולים)
+            raise HTTPException(status_code=410, detail=str(e))
+        events = [_event_item(it) for it in items]
+        return EventsResponse(ok=True, events=events, next_page_token=next_token)
+
+    except HTTPException:
+        raise
     except Exception as e:
         # אפשר להחליף ל-HTTPException(500) אם תרצה לכפות קוד שגיאה
         return EventsResponse(ok=False, events=[])
@@ -150,36 +359,55 @@ def list_events(req: EventsQuery):
 
 # --- OAuth start: מחזיר קישור התחברות ---
 @app.get("/oauth2/start")
-def oauth2_start():
+def oauth2_start(authorization: str | None = Header(None)):
+    """
+    משתמש מחובר (עם session) מחבר מחדש את היומן שלו; בלי session (כש-REQUIRE_SESSION מופעל)
+    המשתמש נקבע ב-/oauth2callback – default אם זה אותו חשבון גוגל, אחרת משתמש חדש.
+    ה-state הוא nonce חד-פעמי חתום שמזהה את המשתמש ב-/oauth2callback.
+    """
+    user_id = _session_user(authorization)
+    if user_id is None:
+        user_id = "" if session_auth.REQUIRE_SESSION else DEFAULT_USER
     try:
-        url = get_auth_url()
+        url = get_auth_url(session_auth.get_state_store().issue(user_id))
         return {"ok": True, "auth_url": url}
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # --- OAuth callback: גוגל מחזירה ?code= ---
 from fastapi.responses import HTMLResponse
-import traceback
 
 @app.get("/oauth2callback")
-def oauth2_callback(code: str | None = None):
+def oauth2_callback(code: str | None = None, state: str | None = None):
     if not code:
         return HTMLResponse("<h3>Missing ?code</h3>", status_code=400)
-
     try:
-        exchange_code_for_token(code)
+        # ה-state שהונפק ב-/oauth2/start – נבדק ונמחק לפני שנשמרים אישורים כלשהם
+        user_id = session_auth.get_state_store().consume(state)
+    except session_auth.AuthError as e:
+        return HTMLResponse(f"<h3>OAuth error: {e}</h3>", status_code=400)
 
+    try:
+        user_id = exchange_code_for_token(code, user_id)
+        if calendar_watch.WATCH_ENABLED:
+            try:
+                calendar_watch.get_registry().ensure(get_calendar_service(user_id), user_id)
+            except Exception as e:
+                print("WATCH ERROR:", e)
+
+        # האפליקציה שומרת את ה-session ושולחת אותו מעכשיו ב-Authorization: Bearer
+        session = quote(session_auth.issue_session(user_id), safe="")
         html = """
         <html>
         <body>
             <h3>Login completed. Returning to the app…</h3>
             <script>
                 // Redirect back to Flutter app
-                window.location.href = "myapp://oauth-complete";
+                window.location.href = "myapp://oauth-complete?session=SESSION";
             </script>
         </body>
         </html>
-        """
+        """.replace("SESSION", session)
         return HTMLResponse(html, status_code=200)
 
     except Exception as e:
@@ -189,7 +417,7 @@ def oauth2_callback(code: str | None = None):
 
 
 @app.get("/auth/status")
-def auth_status():
+async def auth_status(user_id: str = Depends(current_user)):
     """
     בודק אם קיימת הרשאת Google Calendar תקפה.
     מחזיר:
@@ -197,9 +425,42 @@ def auth_status():
     { "ok": false } אם אין או פג תוקף
     """
     try:
-        service = get_calendar_service()   # יזרוק חריגה אם אין הרשאה
+        service = await asyncio.to_thread(get_calendar_service, user_id)   # יזרוק חריגה אם אין הרשאה
         # בדיקה בסיסית שמבצעת קריאה קטנה ליומן
-        service.calendarList().list(maxResults=1).execute()
+        await asyncio.to_thread(rate_limiter.execute, service.calendarList().list(maxResults=1), service)
         return {"ok": True}
     except Exception:
         return {"ok": False}
+
+
+# ----------------------------------------------------
+# Push notifications (events.watch)
+# ----------------------------------------------------
+class WatchRequest(BaseModel):
+    calendar_id: str = "primary"
+
+
+@app.post("/calendar/watch")
+async def calendar_watch_register(req: WatchRequest, user_id: str = Depends(current_user)):
+    """
+    פותח (או מחזיר את הקיים) ערוץ events.watch ליומן של המשתמש.
+    """
+    try:
+        service = await asyncio.to_thread(get_calendar_service, user_id)
+        channel = await asyncio.to_thread(calendar_watch.get_registry().ensure, service, user_id, req.calendar_id)
+        return {"ok": True, "channel_id": channel.id, "expiration": channel.expiration}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/calendar/notifications")
+async def calendar_notifications(request: Request):
+    """
+    נקודת הקצה שגוגל קורא אליה בכל שינוי ביומן (X-Goog-* headers, בלי גוף).
+    תמיד מחזירים 200 – אחרת גוגל מנסה שוב ושוב.
+    """
+    if not calendar_watch.WATCH_ENABLED:
+        # push notifications כבויים – לא פותחים את מאגר הערוצים בשביל הודעה שאין לה ערוץ אצלנו
+        return {"ok": False, "result": "ignored"}
+    result = calendar_watch.get_registry().handle_notification(request.headers)
+    return {"ok": result != "ignored", "result": result}
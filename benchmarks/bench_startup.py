@@ -0,0 +1,76 @@
+# benchmarks/bench_startup.py
+"""
+Cold-start benchmark: imports each module in a fresh interpreter with `python -X importtime`
+and reports the wall time plus the most expensive imports (cumulative, in ms).
+
+usage: python benchmarks/bench_startup.py [module ...] [--runs N] [--top N]
+       (default modules: agent tools app.main)
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Tuple
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DEFAULT_MODULES = ["agent", "tools", "app.main"]
+
+
+def _import_once(module: str) -> Tuple[float, Dict[str, int]]:
+    """Returns (wall seconds, {imported module: cumulative microseconds})."""
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-bench")  # agent.py should not need a real key to import
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    started = time.perf_counter()
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    elapsed = time.perf_counter() - started
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    cumulative: Dict[str, int] = {}
+    for line in proc.stderr.splitlines():
+        # "import time:      self [us] |  cumulative | imported package"
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cum, name = line[len("import time:"):].split("|")
+        cumulative[name.strip()] = int(cum)
+    return elapsed, cumulative
+
+
+def bench(module: str, runs: int) -> Tuple[List[float], Dict[str, int]]:
+    walls, samples = [], []
+    for _ in range(runs):
+        wall, cumulative = _import_once(module)
+        walls.append(wall)
+        samples.append(cumulative)
+    # median per imported module over the runs
+    names = set().union(*samples)
+    median = {n: int(statistics.median(s.get(n, 0) for s in samples)) for n in names}
+    return walls, median
+
+
+def main(argv=None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=DEFAULT_MODULES)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args(argv)
+
+    for module in args.modules:
+        walls, cumulative = bench(module, args.runs)
+        print(f"\n== import {module}: wall median {statistics.median(walls) * 1000:.0f} ms "
+              f"(min {min(walls) * 1000:.0f} ms, {args.runs} runs); "
+              f"import time {cumulative.get(module, 0) / 1000:.0f} ms")
+        top = sorted(((us, name) for name, us in cumulative.items() if name != module), reverse=True)
+        for us, name in top[:args.top]:
+            print(f"  {us / 1000:8.1f} ms  {name}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,233 @@
+# calendar_cache.py
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import rate_limiter
+
+# מטמון אירועים מקומי: סנכרון מלא פעם אחת, ואחר כך סנכרון מצטבר עם syncToken
+CACHE_ENABLED = os.getenv("EVENT_CACHE", "1") == "1"
+# כמה שניות לסמוך על העותק המקומי בלי לבקש שינויים מגוגל
+SYNC_INTERVAL_SECONDS = float(os.getenv("EVENT_CACHE_SYNC_INTERVAL", "30"))
+# כשיש ערוץ events.watch פעיל גוגל מודיע על שינויים, אבל הודעה יכולה ללכת לאיבוד – רשת ביטחון
+PUSH_SYNC_INTERVAL_SECONDS = float(os.getenv("EVENT_CACHE_PUSH_SYNC_INTERVAL", "600"))
+# אירועים שהסתיימו לפני (עכשיו - RETENTION_DAYS) נמחקים מהזיכרון; טווחים ישנים יותר נקראים ישירות מה-API
+RETENTION_DAYS = int(os.getenv("EVENT_CACHE_RETENTION_DAYS", "60"))
+
+PAGE_SIZE = 2500  # המקסימום שה-API מאפשר
+
+
+def iter_pages(service, calendar_id: str = "primary", page_size: Optional[int] = None,
+               page_token: Optional[str] = None, **params):
+    """
+    Generator over events().list responses, following nextPageToken until the last page.
+    Only one page is held in memory at a time.
+    """
+    while True:
+        request = service.events().list(
+            calendarId=calendar_id,
+            maxResults=page_size or PAGE_SIZE,
+            pageToken=page_token,
+            **params,
+        )
+        resp = rate_limiter.execute(request, service)
+        yield resp
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            return
+
+
+def parse_event_time(value: Dict[str, Any], default_tz: str) -> Optional[datetime]:
+    """The aware datetime of an event's start/end object (dateTime or all-day date), or None."""
+    if not value:
+        return None
+    if value.get("dateTime"):
+        dt = datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=ZoneInfo(value.get("timeZone") or default_tz))
+        return dt
+    if value.get("date"):
+        # אירוע של יום שלם – חצות לפי אזור הזמן של היומן
+        return datetime.fromisoformat(value["date"]).replace(tzinfo=ZoneInfo(default_tz))
+    return None
+
+
+def parse_bound(value: str) -> datetime:
+    """An RFC3339 range bound as an aware datetime (a naive bound is taken as UTC)."""
+    dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt
+
+
+class SyncTokenExpired(Exception):
+    """Google returned 410 Gone – the sync token is no longer valid and a full sync is required."""
+
+
+class EventCache:
+    """
+    עותק מקומי של יומן אחד (singleEvents=True), שמתעדכן ע"י syncToken.
+    שאילתות טווח (list_range) נענות מהזיכרון; אם הטווח מתחיל לפני חלון השמירה – נקרא ישירות מה-API.
+    """
+
+    def __init__(self, calendar_id: str = "primary",
+                 sync_interval: float = SYNC_INTERVAL_SECONDS,
+                 retention_days: int = RETENTION_DAYS,
+                 user_id: str = "default",
+                 push_sync_interval: float = PUSH_SYNC_INTERVAL_SECONDS):
+        self.calendar_id = calendar_id
+        self.user_id = user_id
+        self.sync_interval = sync_interval
+        self.push_sync_interval = push_sync_interval
+        self.retention = timedelta(days=retention_days)
+        self.time_zone = "UTC"
+        self.hits = 0
+        self.misses = 0
+        self._events: Dict[str, Dict[str, Any]] = {}
+        self._sync_token: Optional[str] = None
+        self._last_sync = 0.0
+        self._stale = True
+        self._floor: Optional[datetime] = None  # אירועים שהסתיימו לפני הגבול הזה פונו מהמטמון
+        # מספר ההודעות על שינויים (מכל worker) שהסנכרון האחרון כבר כולל – ראה set_push_state
+        self._seen_changes = 0
+        self._lock = threading.RLock()
+
+    # ---------------- sync ----------------
+
+    def _list_all(self, service, **params) -> Dict[str, Any]:
+        items: List[Dict[str, Any]] = []
+        resp: Dict[str, Any] = {}
+        try:
+            for resp in iter_pages(service, self.calendar_id, singleEvents=True, **params):
+                items.extend(resp.get("items", []))
+                if resp.get("timeZone"):
+                    self.time_zone = resp["timeZone"]
+        except Exception as e:
+            if getattr(getattr(e, "resp", None), "status", None) == 410:
+                raise SyncTokenExpired() from e
+            raise
+        return {"items": items, "nextSyncToken": resp.get("nextSyncToken")}
+
+    def _full_sync(self, service) -> None:
+        result = self._list_all(service)
+        self._events = {ev["id"]: ev for ev in result["items"] if ev.get("status") != "cancelled"}
+        self._sync_token = result["nextSyncToken"]
+
+    def _incremental_sync(self, service) -> None:
+        result = self._list_all(service, syncToken=self._sync_token)
+        for ev in result["items"]:
+            if ev.get("status") == "cancelled":
+                self._events.pop(ev["id"], None)
+            else:
+                self._events[ev["id"]] = ev
+        self._sync_token = result["nextSyncToken"] or self._sync_token
+
+    def sync(self, service, force: bool = False) -> None:
+        with self._lock:
+            # עם ערוץ events.watch פעיל שואלים את גוגל רק אחרי הודעה על שינוי (שהתקבלה בכל worker)
+            # או אחרי push_sync_interval; בלי ערוץ – כל sync_interval
+            push_until, changes = _push_state(self.user_id, self.calendar_id) if _push_state else (0.0, 0)
+            interval = self.push_sync_interval if time.time() < push_until else self.sync_interval
+            fresh = time.monotonic() - self._last_sync < interval and changes == self._seen_changes
+            if not force and not self._stale and self._sync_token and fresh:
+                return
+            if self._sync_token:
+                try:
+                    self._incremental_sync(service)
+                except SyncTokenExpired:
+                    self._full_sync(service)
+            else:
+                self._full_sync(service)
+            self._last_sync = time.monotonic()
+            self._seen_changes = changes
+            self._stale = False
+            self.evict_before(datetime.now(timezone.utc) - self.retention)
+
+    def mark_stale(self) -> None:
+        """Next read will ask Google for changes (e.g. after we inserted/deleted events ourselves)."""
+        with self._lock:
+            self._stale = True
+
+    def invalidate(self) -> None:
+        """Drop the local copy entirely; next read performs a full sync."""
+        with self._lock:
+            self._events = {}
+            self._sync_token = None
+            self._stale = True
+            self._floor = None
+
+    def evict_before(self, cutoff: datetime) -> None:
+        with self._lock:
+            for event_id, ev in list(self._events.items()):
+                end = parse_event_time(ev.get("end"), self.time_zone)
+                if end is not None and end < cutoff:
+                    del self._events[event_id]
+            if self._floor is None or cutoff > self._floor:
+                self._floor = cutoff
+
+    # ---------------- reads ----------------
+
+    def covers(self, time_min: str) -> bool:
+        floor = datetime.now(timezone.utc) - self.retention
+        with self._lock:
+            if self._floor is not None:
+                floor = max(floor, self._floor)
+        return parse_bound(time_min) >= floor
+
+    def list_range(self, service, time_min: str, time_max: str) -> Optional[List[Dict[str, Any]]]:
+        """
+        Same semantics as events().list(timeMin, timeMax, singleEvents=True, orderBy='startTime'):
+        events that end after time_min and start before time_max, sorted by start.
+        Returns None when the range starts before the retained window (caller should hit the API).
+        """
+        if not self.covers(time_min):
+            self.misses += 1
+            return None
+        with self._lock:
+            self.sync(service)
+            self.hits += 1
+            lo, hi = parse_bound(time_min), parse_bound(time_max)
+            selected = []
+            for ev in self._events.values():
+                start = parse_event_time(ev.get("start"), self.time_zone)
+                end = parse_event_time(ev.get("end"), self.time_zone)
+                if start is None or end is None:
+                    continue
+                if end > lo and start < hi:
+                    selected.append((start, ev))
+            selected.sort(key=lambda pair: pair[0])
+            return [ev for _, ev in selected]
+
+
+# מטמון לכל (משתמש, יומן)
+_caches: Dict[Tuple[str, str], EventCache] = {}
+_caches_lock = threading.Lock()
+# (user_id, calendar_id) -> (עד מתי יש ערוץ push פעיל, מונה הודעות השינוי) מהאחסון המשותף של calendar_watch
+_push_state: Optional[Callable[[str, str], Tuple[float, int]]] = None
+
+
+def set_push_state(provider: Optional[Callable[[str, str], Tuple[float, int]]]) -> None:
+    """Where the caches read the push-channel state shared by all the workers (see calendar_watch)."""
+    global _push_state
+    _push_state = provider
+
+
+def get_event_cache(calendar_id: str = "primary", user_id: str = "default") -> EventCache:
+    with _caches_lock:
+        key = (user_id, calendar_id)
+        if key not in _caches:
+            _caches[key] = EventCache(calendar_id, user_id=user_id)
+        return _caches[key]
+
+
+def cache_for(service, calendar_id: str = "primary") -> EventCache:
+    """The cache of the user the service belongs to (see tools.get_calendar_service)."""
+    return get_event_cache(calendar_id, getattr(service, "calendar_user", "default"))
+
+
+def reset_caches() -> None:
+    with _caches_lock:
+        _caches.clear()
@@ -0,0 +1,240 @@
+# calendar_watch.py
+import os
+import secrets
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Mapping, Optional, Tuple
+
+import calendar_cache
+import rate_limiter
+import sqlite_local
+
+# ערוצי events.watch (push notifications) לכל משתמש:
+# גוגל שולח POST ל-WATCH_ADDRESS בכל שינוי ביומן, והמטמון המקומי מסומן כ-stale – הקריאה הבאה
+# מביאה רק את השינויים (syncToken). כל עוד יש ערוץ פעיל המטמון שואל את גוגל רק כל
+# push_sync_interval (רשת ביטחון) במקום כל sync_interval.
+# הערוצים ומונה ההודעות לכל יומן נשמרים ב-SQLite (כמו credential_store), כך שכל worker מזהה
+# הודעה של ערוץ שנפתח ב-worker אחר, והמטמונים של כל ה-workers רואים שהיה שינוי.
+WATCH_DB_PATH = os.getenv("CALENDAR_WATCH_DB_PATH", os.path.join(os.getenv("TOKEN_DIR", "/tmp"), "watch.sqlite3"))
+WATCH_ENABLED = os.getenv("CALENDAR_WATCH", "0") == "1"
+# כתובת HTTPS ציבורית של /calendar/notifications (חובה לגוגל)
+WATCH_ADDRESS = os.getenv("CALENDAR_WATCH_ADDRESS", "")
+WATCH_TTL_SECONDS = int(os.getenv("CALENDAR_WATCH_TTL", str(7 * 24 * 3600)))
+# ערוץ שתוקפו מסתיים בפחות מזה מחודש מראש
+RENEW_BEFORE_SECONDS = int(os.getenv("CALENDAR_WATCH_RENEW_BEFORE", "3600"))
+RENEW_CHECK_SECONDS = int(os.getenv("CALENDAR_WATCH_RENEW_CHECK", "600"))
+
+
+class Channel:
+    __slots__ = ("id", "resource_id", "token", "user_id", "calendar_id", "expiration")
+
+    def __init__(self, id: str, resource_id: str, token: str, user_id: str, calendar_id: str, expiration: float):
+        self.id = id
+        self.resource_id = resource_id
+        self.token = token
+        self.user_id = user_id
+        self.calendar_id = calendar_id
+        self.expiration = expiration  # epoch seconds
+
+
+_CHANNEL_COLUMNS = "id, resource_id, token, user_id, calendar_id, expiration"
+
+
+class ChannelStore:
+    """SQLite tables of the active channels and of a change counter per calendar; shared by all the workers."""
+
+    def __init__(self, path: str = WATCH_DB_PATH):
+        self.path = path
+        self._conn = sqlite_local.ThreadLocalConnection(path)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS watch_channels ("
+                " id TEXT PRIMARY KEY, resource_id TEXT NOT NULL, token TEXT NOT NULL, user_id TEXT NOT NULL,"
+                " calendar_id TEXT NOT NULL, expiration REAL NOT NULL, renew_lease REAL NOT NULL DEFAULT 0)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS watch_changes ("
+                " user_id TEXT NOT NULL, calendar_id TEXT NOT NULL, changes INTEGER NOT NULL,"
+                " PRIMARY KEY (user_id, calendar_id))"
+            )
+
+    def save(self, channel: Channel) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO watch_channels ({_CHANNEL_COLUMNS}) VALUES (?, ?, ?, ?, ?, ?)",
+                (channel.id, channel.resource_id, channel.token, channel.user_id, channel.calendar_id,
+                 channel.expiration),
+            )
+
+    def delete(self, channel_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM watch_channels WHERE id = ?", (channel_id,))
+
+    def get(self, channel_id: str) -> Optional[Channel]:
+        row = self._conn().execute(
+            f"SELECT {_CHANNEL_COLUMNS} FROM watch_channels WHERE id = ?", (channel_id,)).fetchone()
+        return Channel(*row) if row else None
+
+    def all(self) -> List[Channel]:
+        rows = self._conn().execute(f"SELECT {_CHANNEL_COLUMNS} FROM watch_channels ORDER BY expiration")
+        return [Channel(*row) for row in rows]
+
+    def current(self, user_id: str, calendar_id: str) -> Optional[Channel]:
+        row = self._conn().execute(
+            f"SELECT {_CHANNEL_COLUMNS} FROM watch_channels WHERE user_id = ? AND calendar_id = ?"
+            " ORDER BY expiration DESC LIMIT 1", (user_id, calendar_id)).fetchone()
+        return Channel(*row) if row else None
+
+    def claim_renewal(self, channel_id: str, lease: float) -> bool:
+        """True for exactly one worker per lease period, so a channel is renewed once and not by every worker."""
+        now = time.time()
+        with self._conn() as conn:
+            cur = conn.execute("UPDATE watch_channels SET renew_lease = ? WHERE id = ? AND renew_lease < ?",
+                               (now + lease, channel_id, now))
+        return cur.rowcount == 1
+
+    def add_change(self, user_id: str, calendar_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO watch_changes (user_id, calendar_id, changes) VALUES (?, ?, 1)"
+                " ON CONFLICT (user_id, calendar_id) DO UPDATE SET changes = changes + 1",
+                (user_id, calendar_id),
+            )
+
+    def push_state(self, user_id: str, calendar_id: str) -> Tuple[float, int]:
+        """(latest expiration of the calendar's channels or 0, number of change notifications so far)"""
+        conn = self._conn()
+        expiration = conn.execute(
+            "SELECT MAX(expiration) FROM watch_channels WHERE user_id = ? AND calendar_id = ?",
+            (user_id, calendar_id)).fetchone()[0]
+        changes = conn.execute(
+            "SELECT changes FROM watch_changes WHERE user_id = ? AND calendar_id = ?",
+            (user_id, calendar_id)).fetchone()
+        return expiration or 0.0, changes[0] if changes else 0
+
+
+class WatchRegistry:
+    """Active push channels by channel id, at most one per (user, calendar), kept in a ChannelStore."""
+
+    def __init__(self, address: str = WATCH_ADDRESS, ttl: int = WATCH_TTL_SECONDS,
+                 renew_before: int = RENEW_BEFORE_SECONDS, store: Optional[ChannelStore] = None):
+        self.address = address
+        self.ttl = ttl
+        self.renew_before = renew_before
+        self.notifications = 0
+        self.store = store or ChannelStore()
+        self._lock = threading.Lock()
+        # המטמונים של ה-worker הזה קוראים את מצב הערוצים מהאחסון המשותף
+        calendar_cache.set_push_state(self.store.push_state)
+
+    def channels(self) -> List[Channel]:
+        return self.store.all()
+
+    def _current(self, user_id: str, calendar_id: str) -> Optional[Channel]:
+        return self.store.current(user_id, calendar_id)
+
+    def register(self, service, user_id: str = "default", calendar_id: str = "primary") -> Channel:
+        """Opens a new events.watch channel for the user's calendar (and stops the previous one)."""
+        if not self.address:
+            raise RuntimeError("CALENDAR_WATCH_ADDRESS is not set")
+        body = {
+            "id": uuid.uuid4().hex,
+            "type": "web_hook",
+            "address": self.address,
+            "token": secrets.token_urlsafe(24),
+            "params": {"ttl": str(self.ttl)},
+        }
+        resp = rate_limiter.execute(service.events().watch(calendarId=calendar_id, body=body), service)
+        expiration = int(resp["expiration"]) / 1000 if resp.get("expiration") else time.time() + self.ttl
+        channel = Channel(body["id"], resp["resourceId"], body["token"], user_id, calendar_id, expiration)
+
+        previous = self._current(user_id, calendar_id)
+        self.store.save(channel)
+        # ייתכנו שינויים בין הסנכרון האחרון לפתיחת הערוץ (בכל ה-workers)
+        self.store.add_change(user_id, calendar_id)
+        calendar_cache.get_event_cache(calendar_id, user_id).mark_stale()
+        if previous is not None:
+            self.stop(service, previous)
+        return channel
+
+    def ensure(self, service, user_id: str = "default", calendar_id: str = "primary") -> Channel:
+        current = self._current(user_id, calendar_id)
+        if current is not None and current.expiration - time.time() > self.renew_before:
+            return current
+        return self.register(service, user_id, calendar_id)
+
+    def stop(self, service, channel: Channel) -> None:
+        self.store.delete(channel.id)
+        try:
+            rate_limiter.execute(service.channels().stop(body={"id": channel.id, "resourceId": channel.resource_id}),
+                                 service)
+        except Exception as e:
+            # הערוץ יפוג בעצמו; הודעות שלו ייזרקו כי הוא כבר לא רשום
+            print(f"Failed to stop watch channel {channel.id}: {e}")
+
+    def renew_due(self, service_factory: Callable[[str], Any], now: Optional[float] = None) -> int:
+        """Re-registers every channel that expires within renew_before. Returns how many were renewed."""
+        now = time.time() if now is None else now
+        renewed = 0
+        for channel in self.channels():
+            if channel.expiration - now > self.renew_before:
+                continue
+            # כל ה-workers מריצים את הלולאה – רק מי שתפס את החידוש מבצע אותו
+            if not self.store.claim_renewal(channel.id, RENEW_CHECK_SECONDS):
+                continue
+            try:
+                self.register(service_factory(channel.user_id), channel.user_id, channel.calendar_id)
+                renewed += 1
+            except Exception as e:
+                print(f"Failed to renew watch channel for {channel.user_id}/{channel.calendar_id}: {e}")
+        return renewed
+
+    def handle_notification(self, headers: Mapping[str, str]) -> str:
+        """
+        Applies one push notification (the X-Goog-* headers of the POST).
+        Returns 'sync' (channel handshake), 'changed', or 'ignored' (unknown channel / bad token).
+        """
+        get = lambda name: headers.get(name) or headers.get(name.lower())
+        channel = self.store.get(get("X-Goog-Channel-ID") or "")
+        if (channel is None or get("X-Goog-Channel-Token") != channel.token
+                or get("X-Goog-Resource-ID") != channel.resource_id):
+            return "ignored"
+        state = get("X-Goog-Resource-State")
+        if state == "sync":
+            return "sync"
+        with self._lock:
+            self.notifications += 1
+        # רק השינויים יימשכו (syncToken) – בקריאה הבאה של אותו יומן, בכל worker
+        self.store.add_change(channel.user_id, channel.calendar_id)
+        calendar_cache.get_event_cache(channel.calendar_id, channel.user_id).mark_stale()
+        return "changed"
+
+    def stats(self) -> Dict[str, Any]:
+        return {"channels": len(self.channels()), "notifications": self.notifications}
+
+
+_registry: Optional[WatchRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> WatchRegistry:
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = WatchRegistry()
+        return _registry
+
+
+def start_renewal_thread(service_factory: Callable[[str], Any],
+                         interval: float = RENEW_CHECK_SECONDS) -> threading.Event:
+    """Background loop that renews expiring channels. Set the returned event to stop it."""
+    stop = threading.Event()
+    registry = get_registry()  # מחבר כבר עכשיו את המטמונים של ה-worker למצב הערוצים המשותף
+
+    def _loop():
+        while not stop.wait(interval):
+            registry.renew_due(service_factory)
+
+    threading.Thread(target=_loop, name="calendar-watch-renewal", daemon=True).start()
+    return stop
@@ -0,0 +1,204 @@
+# credential_store.py
+import hashlib
+import os
+import re
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import sqlite_local
+
+# מאגר אישורי Google לכל משתמש (multi-tenant):
+# - אחסון קבוע: קובץ לכל משתמש או SQLite, עם כתיבה אטומית
+# - מטמון בזיכרון לפני האחסון (נטען מחדש רק כשהגרסה באחסון השתנתה, למשל worker אחר רענן)
+# - רענון single-flight: נעילה לכל משתמש, כך שרק רענון אחד לכל משתמש רץ בכל רגע
+CREDENTIAL_STORE = os.getenv("CREDENTIAL_STORE", "file")  # file | sqlite
+DEFAULT_USER = "default"
+# כמה שניות לפני תום התוקף כבר מרעננים (כדי שבקשה לא תיכשל באמצע)
+REFRESH_MARGIN_SECONDS = 60
+
+_SAFE_ID_RE = re.compile(r"[^A-Za-z0-9_.-]")
+
+
+def _atomic_write(path: str, text: str) -> None:
+    """Writes to a temp file in the same directory and os.replace()s it over the target."""
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-", suffix=".json")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+class FileBackend:
+    """One JSON file per user. The default user keeps the legacy path (TOKEN_DIR/token.json)."""
+
+    def __init__(self, directory: str, legacy_path: Optional[str] = None):
+        self.directory = directory
+        self.legacy_path = legacy_path or os.path.join(directory, "token.json")
+
+    def path(self, user_id: str) -> str:
+        if user_id == DEFAULT_USER:
+            return self.legacy_path
+        safe = _SAFE_ID_RE.sub("_", user_id)[:64]
+        digest = hashlib.sha256(user_id.encode("utf-8")).hexdigest()[:12]
+        return os.path.join(self.directory, "tokens", f"{safe}-{digest}.json")
+
+    def version(self, user_id: str) -> Optional[int]:
+        try:
+            return os.stat(self.path(user_id)).st_mtime_ns
+        except OSError:
+            return None
+
+    def load(self, user_id: str) -> Tuple[Optional[str], Optional[int]]:
+        path = self.path(user_id)
+        try:
+            version = os.stat(path).st_mtime_ns
+            with open(path, "r", encoding="utf-8") as f:
+                return f.read(), version
+        except OSError:
+            return None, None
+
+    def save(self, user_id: str, token_json: str) -> Optional[int]:
+        _atomic_write(self.path(user_id), token_json)
+        return self.version(user_id)
+
+    def delete(self, user_id: str) -> None:
+        try:
+            os.unlink(self.path(user_id))
+        except OSError:
+            pass
+
+
+class SQLiteBackend:
+    """Single table keyed by user id; shared by all the workers on the same machine."""
+
+    def __init__(self, path: str, legacy_path: Optional[str] = None):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._conn = sqlite_local.ThreadLocalConnection(path)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS credentials ("
+                " user_id TEXT PRIMARY KEY, token TEXT NOT NULL, version INTEGER NOT NULL)"
+            )
+
+    def version(self, user_id: str) -> Optional[int]:
+        row = self._conn().execute("SELECT version FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+        return row[0] if row else None
+
+    def load(self, user_id: str) -> Tuple[Optional[str], Optional[int]]:
+        row = self._conn().execute(
+            "SELECT token, version FROM credentials WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None and user_id == DEFAULT_USER and self.legacy_path and os.path.exists(self.legacy_path):
+            # מעבר חד-פעמי מ-token.json הישן
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                token_json = f.read()
+            return token_json, self.save(user_id, token_json)
+        return (row[0], row[1]) if row else (None, None)
+
+    def save(self, user_id: str, token_json: str) -> int:
+        version = time.time_ns()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO credentials (user_id, token, version) VALUES (?, ?, ?)",
+                (user_id, token_json, version),
+            )
+        return version
+
+    def delete(self, user_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM credentials WHERE user_id = ?", (user_id,))
+
+
+class _Entry:
+    __slots__ = ("lock", "creds", "version")
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.creds = None
+        self.version = None
+
+
+class CredentialStore:
+    """
+    In-memory cache of credentials per user in front of a durable backend.
+    from_json builds a credentials object from the stored JSON and refresh refreshes it in place
+    (google.oauth2 Credentials + Request() in production, plain fakes in tests).
+    """
+
+    def __init__(self, backend, from_json: Callable[[str], Any], refresh: Callable[[Any], None]):
+        self.backend = backend
+        self.from_json = from_json
+        self.refresh = refresh
+        self.refreshes = 0
+        self._entries: Dict[str, _Entry] = {}
+        self._entries_lock = threading.Lock()
+
+    def _entry(self, user_id: str) -> _Entry:
+        with self._entries_lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                entry = self._entries[user_id] = _Entry()
+            return entry
+
+    @staticmethod
+    def _needs_refresh(creds) -> bool:
+        if not getattr(creds, "refresh_token", None):
+            return False
+        expiry = getattr(creds, "expiry", None)
+        if expiry is None:
+            return bool(getattr(creds, "expired", False))
+        if expiry.tzinfo is None:  # google-auth keeps expiry as naive UTC
+            expiry = expiry.replace(tzinfo=timezone.utc)
+        return expiry - datetime.now(timezone.utc) <= timedelta(seconds=REFRESH_MARGIN_SECONDS)
+
+    def get(self, user_id: str = DEFAULT_USER) -> Optional[Any]:
+        """The user's valid credentials (refreshed if needed), or None when the user never logged in."""
+        entry = self._entry(user_id)
+        with entry.lock:
+            version = self.backend.version(user_id)
+            if entry.creds is None or version != entry.version:
+                token_json, version = self.backend.load(user_id)
+                entry.creds = self.from_json(token_json) if token_json else None
+                entry.version = version
+            creds = entry.creds
+            if creds is not None and self._needs_refresh(creds):
+                # נעילת המשתמש מוחזקת – threads אחרים של אותו משתמש ממתינים ומקבלים את האישורים המרועננים
+                self.refresh(creds)
+                self.refreshes += 1
+                entry.version = self.backend.save(user_id, creds.to_json())
+            return creds
+
+    def put(self, user_id: str, creds) -> None:
+        entry = self._entry(user_id)
+        with entry.lock:
+            entry.version = self.backend.save(user_id, creds.to_json())
+            entry.creds = creds
+
+    def delete(self, user_id: str) -> None:
+        entry = self._entry(user_id)
+        with entry.lock:
+            self.backend.delete(user_id)
+            entry.creds = entry.version = None
+
+    def invalidate(self, user_id: Optional[str] = None) -> None:
+        """Drops the in-memory copy (of one user or of everyone); the next get() reloads from the backend."""
+        with self._entries_lock:
+            entries = list(self._entries.values()) if user_id is None else [self._entries.get(user_id)]
+        for entry in entries:
+            if entry is not None:
+                with entry.lock:
+                    entry.creds = entry.version = None
+
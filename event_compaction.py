@@ -0,0 +1,158 @@
+# event_compaction.py
+import json
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Tuple
+from zoneinfo import ZoneInfo
+
+# דחיסת רשימת האירועים לפני שליחתה ל-LLM ב-handle_query:
+# - סדרה חוזרת (recurringEventId) נדחסת לשורה אחת עם תבנית ("weekly on Tue")
+# - תיאורים ארוכים מקוצרים
+# - טבלה עם עמודות קבועות במקום JSON עם שמות מפתחות בכל שורה
+
+DESCRIPTION_LIMIT = 80
+TABLE_HEADER = "date|start|end|title|location|note"
+SERIES_HEADER = "title|pattern|start|end|occurrences|location"
+WEEKDAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+
+# סכומים מצטברים לתהליך (נחשפים ב-/metrics)
+_totals = {"calls": 0, "events": 0, "json_tokens": 0, "compact_tokens": 0}
+_totals_lock = threading.Lock()
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token estimate (~4 characters per token) – good enough to compare encodings."""
+    return (len(text) + 3) // 4
+
+
+def _local(value: Dict[str, Any], tz: ZoneInfo):
+    """Returns (datetime, all_day) in the given timezone."""
+    if value.get("dateTime"):
+        dt = datetime.fromisoformat(value["dateTime"].replace("Z", "+00:00"))
+        if dt.tzinfo is None:
+            dt = dt.replace(tzinfo=tz)
+        return dt.astimezone(tz), False
+    return datetime.fromisoformat(value["date"]).replace(tzinfo=tz), True
+
+
+def _clean(text: str, limit: int) -> str:
+    text = " ".join((text or "").split()).replace("|", "/")
+    if limit <= 0:
+        return ""
+    return text if len(text) <= limit else text[:limit - 1].rstrip() + "…"
+
+
+def _pattern(days: List[datetime]) -> str:
+    dates = sorted({d.date() for d in days})
+    gaps = {(b - a).days for a, b in zip(dates, dates[1:])}
+    if gaps == {1}:
+        return "daily"
+    weekdays = sorted({d.weekday() for d in dates})
+    if len(gaps) == 1 and len(weekdays) == 1 and next(iter(gaps)) % 7 == 0:
+        weeks = next(iter(gaps)) // 7
+        day_name = WEEKDAY_NAMES[weekdays[0]]
+        return f"weekly on {day_name}" if weeks == 1 else f"every {weeks} weeks on {day_name}"
+    # כמה ימים קבועים בשבוע (למשל א'+ג')
+    span_weeks = (dates[-1] - dates[0]).days // 7 + 1
+    if len(weekdays) > 1 and len(dates) >= span_weeks * len(weekdays) - len(weekdays) + 1:
+        return "weekly on " + ",".join(WEEKDAY_NAMES[w] for w in weekdays)
+    return "on " + ",".join(d.isoformat() for d in dates)
+
+
+def _slim_json(items: List[Dict[str, Any]]) -> str:
+    """The verbose encoding handle_query used before compaction (for the savings estimate)."""
+    slim = []
+    for ev in items:
+        slim.append({
+            "title": ev.get("summary") or "",
+            "start": ev.get("start", {}).get("dateTime") or ev.get("start", {}).get("date"),
+            "end": ev.get("end", {}).get("dateTime") or ev.get("end", {}).get("date"),
+            "location": ev.get("location") or "",
+            "description": ev.get("description") or "",
+            "recurring": bool(ev.get("recurringEventId")),
+        })
+    return json.dumps(slim, ensure_ascii=False)
+
+
+def compact_events(items: List[Dict[str, Any]], time_zone: str = "Asia/Jerusalem",
+                   description_limit: int = DESCRIPTION_LIMIT) -> Tuple[str, Dict[str, Any]]:
+    """
+    Encodes events (as returned by events().list) as a compact text block for the LLM.
+    Returns (text, stats) where stats holds the estimated token counts before/after.
+    """
+    tz = ZoneInfo(time_zone)
+    rows = []
+    series: "OrderedDict[tuple, List[Tuple[datetime, datetime, Dict[str, Any]]]]" = OrderedDict()
+
+    for ev in items:
+        start, all_day = _local(ev.get("start") or {}, tz)
+        end, _ = _local(ev.get("end") or {}, tz)
+        if ev.get("recurringEventId"):
+            # מופע שהוזז (שעה אחרת) נכנס לקבוצה משלו ולכן לא "נבלע" בתבנית
+            key = (ev["recurringEventId"], ev.get("summary") or "", all_day,
+                   start.strftime("%H:%M"), end - start, ev.get("location") or "")
+            series.setdefault(key, []).append((start, end, ev))
+        else:
+            rows.append((start, end, all_day, ev, False))
+
+    series_lines = []
+    for (_, title, all_day, _, _, location), occurrences in series.items():
+        if len(occurrences) == 1:
+            start, end, ev = occurrences[0]
+            rows.append((start, end, all_day, ev, True))
+            continue
+        first_start, first_end, _ = occurrences[0]
+        series_lines.append("|".join([
+            _clean(title, 120),
+            _pattern([s for s, _, _ in occurrences]),
+            "all-day" if all_day else first_start.strftime("%H:%M"),
+            "" if all_day else first_end.strftime("%H:%M"),
+            f"{len(occurrences)}x {occurrences[0][0].date().isoformat()}..{occurrences[-1][0].date().isoformat()}",
+            _clean(location, 60),
+        ]))
+
+    rows.sort(key=lambda row: row[0])
+    table_lines = []
+    for start, end, all_day, ev, recurring in rows:
+        if all_day:
+            last_day = (end - timedelta(days=1)).date()
+            start_text, end_text = "all-day", "" if last_day == start.date() else last_day.isoformat()
+        else:
+            start_text = start.strftime("%H:%M")
+            end_text = end.strftime("%H:%M") if end.date() == start.date() else end.strftime("%Y-%m-%d %H:%M")
+        note = _clean(ev.get("description"), description_limit)
+        if recurring:
+            note = ("(recurring) " + note).strip()
+        table_lines.append("|".join([
+            start.date().isoformat(), start_text, end_text,
+            _clean(ev.get("summary"), 120), _clean(ev.get("location"), 60), note,
+        ]))
+
+    parts = [f"Events ({len(table_lines)}):", TABLE_HEADER, *table_lines]
+    if series_lines:
+        parts += ["", f"Recurring series ({len(series_lines)}):", SERIES_HEADER, *series_lines]
+    text = "\n".join(parts)
+
+    stats = {
+        "events": len(items),
+        "rows": len(table_lines),
+        "series": len(series_lines),
+        "json_tokens": estimate_tokens(_slim_json(items)),
+        "compact_tokens": estimate_tokens(text),
+    }
+    stats["saved_tokens"] = stats["json_tokens"] - stats["compact_tokens"]
+    with _totals_lock:
+        _totals["calls"] += 1
+        _totals["events"] += stats["events"]
+        _totals["json_tokens"] += stats["json_tokens"]
+        _totals["compact_tokens"] += stats["compact_tokens"]
+    return text, stats
+
+
+def compaction_stats() -> Dict[str, Any]:
+    with _totals_lock:
+        totals = dict(_totals)
+    totals["saved_tokens"] = totals["json_tokens"] - totals["compact_tokens"]
+    totals["saved_pct"] = round(100 * totals["saved_tokens"] / totals["json_tokens"], 1) if totals["json_tokens"] else 0.0
+    return totals
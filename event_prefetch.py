@@ -0,0 +1,106 @@
+# event_prefetch.py
+import re
+import threading
+from datetime import date, datetime, time, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo
+
+import calendar_cache
+
+# שליפה ספקולטיבית של אירועים במקביל לתכנון (/run): בזמן שה-LLM מתכנן, הטווח הסביר
+# (היום + השבוע הקרוב, או טווח שמנוחש מהפרומפט) כבר נשלף מהיומן. אם הפילטרים של התוכנית
+# נופלים בתוך הטווח – query / delete משתמשים באירועים שכבר נשלפו במקום סבב נוסף מול Calendar.
+TIME_ZONE = "Asia/Jerusalem"
+DEFAULT_DAYS = 8  # היום + השבוע הקרוב
+MAX_DAYS = 92
+
+_PAST_RE = re.compile(r"yesterday|last\s+(?:week|month)|past|ago|אתמול|שעבר|שעברה|לפני", re.IGNORECASE)
+_NEXT_WEEK_RE = re.compile(r"next\s+week|שבוע הבא", re.IGNORECASE)
+_MONTH_RE = re.compile(r"\bmonth\b|חודש", re.IGNORECASE)
+_DAY_MONTH_RE = re.compile(r"\b(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?\b")
+
+
+def _explicit_dates(prompt: str, today: date) -> List[date]:
+    found = []
+    for day, month, year in _DAY_MONTH_RE.findall(prompt):
+        year = int(year) + (2000 if len(year) == 2 else 0) if year else today.year
+        try:
+            found.append(date(year, int(month), int(day)))
+        except ValueError:
+            continue
+    return found
+
+
+def guess_range(prompt: str, today: date, time_zone: str = TIME_ZONE) -> Tuple[str, str]:
+    """The date range the prompt most likely touches, as RFC3339 (from, to)."""
+    start, end = today, today + timedelta(days=DEFAULT_DAYS)
+    if _PAST_RE.search(prompt or ""):
+        start = today - timedelta(days=DEFAULT_DAYS)
+    if _NEXT_WEEK_RE.search(prompt or ""):
+        end = today + timedelta(days=15)
+    if _MONTH_RE.search(prompt or ""):
+        end = max(end, today + timedelta(days=35))
+        if start < today:
+            start = today - timedelta(days=35)
+    for day in _explicit_dates(prompt or "", today):
+        start, end = min(start, day), max(end, day + timedelta(days=1))
+    # טווח רחוק מדי לא שווה את השליפה – חוזרים לברירת המחדל
+    if (end - start).days > MAX_DAYS:
+        start, end = today, today + timedelta(days=DEFAULT_DAYS)
+    tz = ZoneInfo(time_zone)
+    return (datetime.combine(start, time.min, tz).isoformat(),
+            datetime.combine(end, time.min, tz).isoformat())
+
+
+class Prefetch:
+    """One speculative fetch of the events in [from_time, to_time); filled by run() on a worker thread."""
+
+    def __init__(self, from_time: str, to_time: str, time_zone: str = TIME_ZONE):
+        self.from_time = from_time
+        self.to_time = to_time
+        self.time_zone = time_zone
+        self.events: Optional[List[Dict[str, Any]]] = None
+        self.error: Optional[Exception] = None
+        self.hits = 0
+        self._done = threading.Event()
+        self._lock = threading.Lock()
+
+    def run(self, fetch: Callable[[str, str], List[Dict[str, Any]]]) -> None:
+        try:
+            self.events = fetch(self.from_time, self.to_time)
+        except Exception as e:
+            # אם השליפה נכשלה הפעולות פשוט שולפות בעצמן
+            self.error = e
+        finally:
+            self._done.set()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        return self._done.wait(timeout)
+
+    def covers(self, from_time: str, to_time: str) -> bool:
+        lo, hi = calendar_cache.parse_bound(self.from_time), calendar_cache.parse_bound(self.to_time)
+        return lo <= calendar_cache.parse_bound(from_time) and calendar_cache.parse_bound(to_time) <= hi
+
+    def events_for(self, from_time: str, to_time: str) -> Optional[List[Dict[str, Any]]]:
+        """The prefetched events in the range (same semantics as events().list), or None if not covered."""
+        if not self._done.is_set() or self.events is None or not self.covers(from_time, to_time):
+            return None
+        lo, hi = calendar_cache.parse_bound(from_time), calendar_cache.parse_bound(to_time)
+        selected = []
+        for ev in self.events:
+            start = calendar_cache.parse_event_time(ev.get("start"), self.time_zone)
+            end = calendar_cache.parse_event_time(ev.get("end"), self.time_zone)
+            if start is not None and end is not None and end > lo and start < hi:
+                selected.append(ev)
+        with self._lock:
+            self.hits += 1
+        return selected
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "from": self.from_time,
+            "to": self.to_time,
+            "events": len(self.events) if self.events is not None else None,
+            "hits": self.hits,
+            "error": str(self.error) if self.error else None,
+        }
@@ -0,0 +1,230 @@
+# fast_parser.py
+import re
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+# פרסר דטרמיניסטי לפקודות פשוטות ("lunch tomorrow", "meeting on 05/11 at 14:00 for 30 minutes",
+# "what do I have today"). מחזיר את אותו מבנה פעולה ש-system_prompt מתאר, או None כשאינו בטוח –
+# ואז agent.plan_actions ממשיך ל-LLM.
+
+TIME_ZONE = "Asia/Jerusalem"
+
+# אותם כללי ברירת מחדל כמו ב-system_prompt ("Event time rules")
+DEFAULT_TIMES = [
+    ("breakfast", (8, 0), 60),
+    ("lunch", (13, 0), 60),
+    ("dinner", (19, 0), 60),
+    ("lesson", (9, 0), 60),
+    ("meeting", (9, 0), 60),
+]
+DEFAULT_START = (9, 0)
+DEFAULT_MINUTES = 60
+
+WEEKDAYS = ["monday", "tuesday", "wednesday", "thursday", "friday", "saturday", "sunday"]
+
+# מילים שמרמזות על בקשה מורכבת (כמה פעולות, חזרתיות, מחיקה...) – משאירים ל-LLM
+_REJECT_RE = re.compile(
+    r"[,;?&+]|\b(and|then|also|every|each|weekly|daily|monthly|until|delete|remove|cancel|clear|"
+    r"move|reschedule|change|not|don't|except|between|next|last|week|month|year)\b",
+    re.IGNORECASE,
+)
+_VERB_RE = re.compile(r"^\s*(?:please\s+)?(?:schedule|add|book|set up|create|put|plan)\b(?:\s+(?:a|an|my))?\s+",
+                      re.IGNORECASE)
+_DURATION_RE = re.compile(
+    r"\bfor\s+(an?|half an|\d+(?:\.\d+)?)\s*(minutes?|mins?|hours?|hrs?|h)\b", re.IGNORECASE
+)
+_RANGE_RE = re.compile(
+    r"\b(?:(?:from|at)\s+)?(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\s*(?:-|–|to|until)\s*(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b",
+    re.IGNORECASE,
+)
+_AT_RE = re.compile(r"\bat\s+(\d{1,2})(?::(\d{2}))?\s*(am|pm)?\b", re.IGNORECASE)
+_CLOCK_RE = re.compile(r"\b(\d{1,2}):(\d{2})\s*(am|pm)?\b", re.IGNORECASE)
+_DATE_RE = re.compile(
+    r"\b(?:on\s+)?(?:(today|tomorrow)|(\d{1,2})[/.](\d{1,2})(?:[/.](\d{2,4}))?|"
+    r"(monday|tuesday|wednesday|thursday|friday|saturday|sunday))\b",
+    re.IGNORECASE,
+)
+# "in the morning" / "evening" קובעים אם שעה בלי am/pm היא לפני או אחרי הצהריים
+_DAYPART_RE = re.compile(r"\b(?:in\s+the\s+)?(morning|afternoon|evening|night)\b", re.IGNORECASE)
+_TITLE_RE = re.compile(r"^[^\W\d_][\w' -]*$")
+
+_QUERY_RE = re.compile(
+    r"^\s*(?:what do i have|what have i got|what's on|what is on|what's on my (?:calendar|schedule)|"
+    r"what is on my (?:calendar|schedule)|show(?: me)? my (?:events|calendar|schedule))\s+"
+    r"(?:for\s+)?(today|tomorrow|this week|next week|on \d{1,2}[/.]\d{1,2}(?:[/.]\d{2,4})?)\s*[?.!]?\s*$",
+    re.IGNORECASE,
+)
+_HEBREW_QUERY_RE = re.compile(r"^\s*מה יש לי\s+(היום|מחר|השבוע|בשבוע הבא)\s*[?.!]?\s*$")
+_HEBREW_WHEN = {"היום": "today", "מחר": "tomorrow", "השבוע": "this week", "בשבוע הבא": "next week"}
+
+
+def _to_24h(hour: int, minute: int, ampm: Optional[str]) -> Optional[Tuple[int, int]]:
+    if ampm:
+        if not 1 <= hour <= 12:
+            return None
+        hour = hour % 12 + (12 if ampm.lower() == "pm" else 0)
+    if not (0 <= hour <= 23 and 0 <= minute <= 59):
+        return None
+    return hour, minute
+
+
+def _resolve_date(match: re.Match, today: date) -> Optional[date]:
+    word, day, month, year, weekday = match.groups()
+    if word:
+        return today if word.lower() == "today" else today + timedelta(days=1)
+    if day:
+        y = int(year) if year else today.year
+        if year and y < 100:
+            y += 2000
+        try:
+            resolved = date(y, int(month), int(day))
+        except ValueError:
+            return None
+        if not year and resolved < today:
+            resolved = resolved.replace(year=y + 1)
+        return resolved
+    delta = (WEEKDAYS.index(weekday.lower()) - today.weekday()) % 7
+    if delta == 0:
+        return None  # "on monday" ביום שני – לא ברור אם היום או בשבוע הבא
+    return today + timedelta(days=delta)
+
+
+def _query_range(when: str, today: date) -> Optional[Tuple[date, date]]:
+    when = when.lower()
+    if when == "today":
+        return today, today
+    if when == "tomorrow":
+        return today + timedelta(days=1), today + timedelta(days=1)
+    if when in ("this week", "next week"):
+        # השבוע מתחיל ביום ראשון
+        saturday = today + timedelta(days=(5 - today.weekday()) % 7)
+        if when == "this week":
+            return today, saturday
+        return saturday + timedelta(days=1), saturday + timedelta(days=7)
+    match = _DATE_RE.search(when)
+    resolved = _resolve_date(match, today) if match else None
+    return (resolved, resolved) if resolved else None
+
+
+def _parse_query(prompt: str, today: date) -> Optional[Dict[str, Any]]:
+    match = _QUERY_RE.match(prompt)
+    when = match.group(1) if match else None
+    if when is None:
+        hebrew = _HEBREW_QUERY_RE.match(prompt)
+        when = _HEBREW_WHEN[hebrew.group(1)] if hebrew else None
+    if when is None:
+        return None
+    span = _query_range(when, today)
+    if span is None:
+        return None
+    return {
+        "command": "query_event",
+        "question": prompt.strip(),
+        "filters": {
+            "from": f"{span[0].isoformat()}T00:00:00",
+            "to": f"{span[1].isoformat()}T23:59:59",
+        },
+    }
+
+
+def _parse_duration(match: re.Match) -> int:
+    amount, unit = match.group(1).lower(), match.group(2).lower()
+    value = 0.5 if amount == "half an" else 1.0 if amount in ("a", "an") else float(amount)
+    return int(round(value * (60 if unit.startswith("h") else 1)))
+
+
+def _parse_add(prompt: str, today: date) -> Optional[Dict[str, Any]]:
+    text = prompt.strip().rstrip(".!")
+    if _REJECT_RE.search(text):
+        return None
+    text = _VERB_RE.sub("", text, count=1)
+
+    minutes = None
+    duration = _DURATION_RE.search(text)
+    if duration:
+        minutes = _parse_duration(duration)
+        text = text[:duration.start()] + " " + text[duration.end():]
+
+    daypart_hint = None
+    daypart = _DAYPART_RE.search(text)
+    if daypart:
+        daypart_hint = "am" if daypart.group(1).lower() == "morning" else "pm"
+        text = text[:daypart.start()] + " " + text[daypart.end():]
+
+    start_hm = end_hm = None
+    span = _RANGE_RE.search(text)
+    at = _AT_RE.search(text) or _CLOCK_RE.search(text)
+    if span and (":" in span.group(0) or span.group(3) or span.group(6) or "from" in span.group(0).lower()):
+        ampm = span.group(3) or span.group(6)
+        if ampm is None and ":" not in span.group(0) and int(span.group(1)) <= 12:
+            # "from 8 to 10" – בוקר או ערב? רק מילה כמו "evening" מכריעה
+            if daypart_hint is None:
+                return None
+            ampm = daypart_hint
+        start_hm = _to_24h(int(span.group(1)), int(span.group(2) or 0), ampm)
+        end_hm = _to_24h(int(span.group(4)), int(span.group(5) or 0), span.group(6) or ampm)
+        if start_hm is None or end_hm is None or minutes is not None:
+            return None
+        text = text[:span.start()] + " " + text[span.end():]
+    elif at:
+        hour, minute, ampm = int(at.group(1)), int(at.group(2) or 0), at.group(3)
+        if ampm is None and at.group(2) is None and 1 <= hour <= 12:
+            # "dinner at 8" – 08:00 או 20:00? בלי am/pm או "evening" משאירים ל-LLM
+            if daypart_hint is None:
+                return None
+            ampm = daypart_hint
+        start_hm = _to_24h(hour, minute, ampm)
+        if start_hm is None:
+            return None
+        text = text[:at.start()] + " " + text[at.end():]
+    elif daypart_hint is not None:
+        return None  # "meeting tomorrow evening" – בלי שעה מפורשת אין ברירת מחדל נכונה
+
+    date_match = _DATE_RE.search(text)
+    if not date_match:
+        return None
+    day = _resolve_date(date_match, today)
+    if day is None:
+        return None
+    text = text[:date_match.start()] + " " + text[date_match.end():]
+
+    title = re.sub(r"\s+", " ", text).strip()
+    title = re.sub(r"^(?:a|an|my|the)\s+", "", title, flags=re.IGNORECASE)
+    if not title or not _TITLE_RE.match(title) or len(title.split()) > 5 or re.search(r"\d", title):
+        return None
+    title = title[0].upper() + title[1:]
+
+    lowered = title.lower()
+    default_start, default_minutes = DEFAULT_START, DEFAULT_MINUTES
+    for keyword, hm, length in DEFAULT_TIMES:
+        if keyword in lowered:
+            default_start, default_minutes = hm, length
+            break
+
+    hour, minute = start_hm or default_start
+    start = datetime.combine(day, time(hour, minute))
+    if end_hm is not None:
+        end = start.replace(hour=end_hm[0], minute=end_hm[1])
+        if end <= start:
+            return None
+    else:
+        end = start + timedelta(minutes=minutes or default_minutes)
+
+    return {
+        "command": "add_event",
+        "events": [{
+            "summary": title,
+            "start": {"dateTime": start.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": TIME_ZONE},
+            "end": {"dateTime": end.strftime("%Y-%m-%dT%H:%M:%S"), "timeZone": TIME_ZONE},
+        }],
+    }
+
+
+def parse(prompt: str, today: date) -> Optional[Dict[str, Any]]:
+    """
+    Returns a single command dict for simple, fully understood prompts, or None when the
+    prompt should go to the LLM.
+    """
+    if not prompt or len(prompt) > 120:
+        return None
+    return _parse_query(prompt, today) or _parse_add(prompt, today)
@@ -0,0 +1,65 @@
+# http_transport.py
+import os
+import threading
+from typing import Optional
+
+import httplib2
+import httpx
+
+# תעבורת HTTP ל-Google Calendar מעל httpx: מאגר חיבורים (keep-alive) אחד לכל התהליך,
+# thread-safe, במקום httplib2.Http נפרד לכל thread.
+# HttpxHttp מממש את הממשק של httplib2.Http שבו googleapiclient ו-AuthorizedHttp משתמשים.
+# מגבלה: אין תמיכה בתעודות לקוח (httplib2 add_certificate / mTLS) – Calendar API לא צריך אותן;
+# מי שצריך mTLS מריץ עם CALENDAR_TRANSPORT=httplib2.
+CALENDAR_TRANSPORT = os.getenv("CALENDAR_TRANSPORT", "httpx")  # httpx | httplib2
+CALENDAR_MAX_CONNECTIONS = int(os.getenv("CALENDAR_MAX_CONNECTIONS", "32"))
+CALENDAR_TIMEOUT_SECONDS = float(os.getenv("CALENDAR_TIMEOUT_SECONDS", "30"))
+
+# httpx כבר פתח את הדחיסה ומחשב את האורך בעצמו
+_DROPPED_RESPONSE_HEADERS = ("content-encoding", "content-length", "transfer-encoding")
+
+_client_lock = threading.Lock()
+_shared_client: Optional[httpx.Client] = None
+
+
+def get_shared_client() -> httpx.Client:
+    global _shared_client
+    with _client_lock:
+        if _shared_client is None:
+            _shared_client = httpx.Client(
+                timeout=CALENDAR_TIMEOUT_SECONDS,
+                limits=httpx.Limits(max_connections=CALENDAR_MAX_CONNECTIONS,
+                                    max_keepalive_connections=CALENDAR_MAX_CONNECTIONS),
+            )
+        return _shared_client
+
+
+class HttpxHttp:
+    """httplib2.Http look-alike that sends every request through a pooled httpx.Client."""
+
+    def __init__(self, client: Optional[httpx.Client] = None):
+        self.client = client or get_shared_client()
+        # מאפיינים ש-AuthorizedHttp מעביר הלאה ל-httplib2
+        self.timeout = CALENDAR_TIMEOUT_SECONDS
+        self.follow_redirects = True
+        self.redirect_codes = httplib2.REDIRECT_CODES
+        self.connections = {}
+
+    def request(self, uri, method="GET", body=None, headers=None,
+                redirections=httplib2.DEFAULT_MAX_REDIRECTS, connection_type=None, **kwargs):
+        headers = {k: v for k, v in (headers or {}).items() if k.lower() != "content-length"}
+        response = self.client.request(method, uri, content=body, headers=headers,
+                                       follow_redirects=self.follow_redirects)
+        info = {k.lower(): v for k, v in response.headers.items() if k.lower() not in _DROPPED_RESPONSE_HEADERS}
+        info["status"] = str(response.status_code)
+        resp = httplib2.Response(info)
+        resp.reason = response.reason_phrase
+        return resp, response.content
+
+    def close(self):
+        pass  # המאגר משותף לכל ה-services ונשאר פתוח
+
+
+def new_http():
+    """The transport a new Calendar service should use (see CALENDAR_TRANSPORT)."""
+    return HttpxHttp() if CALENDAR_TRANSPORT == "httpx" else httplib2.Http()
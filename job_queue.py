@@ -0,0 +1,277 @@
+# job_queue.py
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlite_local
+from action_results import ActionResult, ResultCollector
+
+# תור עבודות ל-/execute גדולים (ייבוא/מחיקה של מאות אירועים):
+# הבקשה חוזרת מיד עם 202 ו-job id, ו-JOB_WORKERS threads בתהליך מריצים את הפעולות ברקע.
+# העבודות והתוצאה של כל פעולה נשמרות ב-SQLite – עבודה שנקטעה (restart / קריסה) ממשיכה
+# מהפעולה הראשונה שאין לה תוצאה, כך שפעולות שכבר בוצעו לא ירוצו פעמיים. פעולה שנקטעה באמצע
+# (batch של הוספות) רצה שוב – אבל לכל אירוע שלה יש id קבוע, כך שגוגל עונה 409 ולא יוצר כפילות.
+JOB_QUEUE_PATH = os.getenv("JOB_QUEUE_PATH", os.path.join(os.getenv("TOKEN_DIR", "/tmp"), "jobs.sqlite3"))
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
+# עבודה ב-running שלא קיבלה heartbeat זמן כזה נחשבת יתומה (התהליך שלה מת) וחוזרת לתור
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+
+QUEUED, RUNNING, SUCCEEDED, FAILED = "queued", "running", "succeeded", "failed"
+
+
+def job_event_id(job_id: str, action_index: int, event_index: int) -> str:
+    """Deterministic Calendar event id (base32hex: 0-9 a-v) for one insert of a job."""
+    return hashlib.sha1(f"{job_id}:{action_index}:{event_index}".encode("utf-8")).hexdigest()
+
+
+def with_event_ids(job_id: str, actions: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The actions with a fixed id on every event to insert. A job that resumes after a crash may repeat
+    an insert whose result was not saved yet; Google then answers 409 instead of creating a duplicate
+    (agent.add_event counts that as created).
+    """
+    stamped = []
+    for i, action in enumerate(actions):
+        events = action.get("events") if action.get("command") == "add_event" else None
+        if isinstance(events, dict):
+            events = [events]
+        if isinstance(events, list):
+            action = dict(action, events=[
+                dict(ev, id=ev.get("id") or job_event_id(job_id, i, j)) if isinstance(ev, dict) else ev
+                for j, ev in enumerate(events)
+            ])
+        stamped.append(action)
+    return stamped
+
+
+class JobStore:
+    """SQLite tables of jobs and of the result of every finished action; shared by all the workers."""
+
+    def __init__(self, path: str = JOB_QUEUE_PATH):
+        self.path = path
+        self._conn = sqlite_local.ThreadLocalConnection(path)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL, actions TEXT NOT NULL,"
+                " total INTEGER NOT NULL, error TEXT, created_at REAL NOT NULL, started_at REAL,"
+                " finished_at REAL, heartbeat REAL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS job_results ("
+                " job_id TEXT NOT NULL, idx INTEGER NOT NULL, result TEXT NOT NULL, PRIMARY KEY (job_id, idx))"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def create(self, actions: List[Dict[str, Any]], user_id: str) -> str:
+        job_id = uuid.uuid4().hex
+        actions = with_event_ids(job_id, actions)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, user_id, status, actions, total, created_at) VALUES (?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, QUEUED, json.dumps(actions, ensure_ascii=False), len(actions), time.time()),
+            )
+        return job_id
+
+    def claim(self, lease: float = JOB_LEASE_SECONDS) -> Optional[Dict[str, Any]]:
+        """Atomically takes the oldest queued (or abandoned running) job. Returns it or None."""
+        now = time.time()
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id, user_id, actions FROM jobs WHERE status = ? OR (status = ? AND heartbeat < ?)"
+                " ORDER BY created_at LIMIT 1",
+                (QUEUED, RUNNING, now - lease),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, started_at = COALESCE(started_at, ?), heartbeat = ? WHERE id = ?",
+                (RUNNING, now, now, row[0]),
+            )
+        return {"id": row[0], "user_id": row[1], "actions": json.loads(row[2]), "done": self.done_indexes(row[0])}
+
+    def heartbeat(self, job_ids: List[str]) -> None:
+        if not job_ids:
+            return
+        with self._conn() as conn:
+            conn.executemany("UPDATE jobs SET heartbeat = ? WHERE id = ?", [(time.time(), j) for j in job_ids])
+
+    def save_result(self, job_id: str, index: int, result: Dict[str, Any]) -> None:
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO job_results (job_id, idx, result) VALUES (?, ?, ?)",
+                         (job_id, index, json.dumps(result, ensure_ascii=False)))
+            conn.execute("UPDATE jobs SET heartbeat = ? WHERE id = ?", (time.time(), job_id))
+
+    def finish(self, job_id: str, error: Optional[str] = None) -> None:
+        with self._conn() as conn:
+            conn.execute("UPDATE jobs SET status = ?, error = ?, finished_at = ? WHERE id = ?",
+                         (FAILED if error else SUCCEEDED, error, time.time(), job_id))
+
+    def done_indexes(self, job_id: str) -> List[int]:
+        rows = self._conn().execute("SELECT idx FROM job_results WHERE job_id = ?", (job_id,)).fetchall()
+        return [r[0] for r in rows]
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        conn = self._conn()
+        row = conn.execute(
+            "SELECT user_id, status, total, error, created_at, started_at, finished_at FROM jobs WHERE id = ?",
+            (job_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        results = [json.loads(r[0]) for r in conn.execute(
+            "SELECT result FROM job_results WHERE job_id = ? ORDER BY idx", (job_id,))]
+        return {
+            "job_id": job_id,
+            "user_id": row[0],
+            "status": row[1],
+            "total": row[2],
+            "completed": len(results),
+            "failed": sum(1 for r in results if not r.get("ok")),
+            "error": row[3],
+            "created_at": row[4],
+            "started_at": row[5],
+            "finished_at": row[6],
+            "results": results,
+        }
+
+    def counts(self) -> Dict[str, int]:
+        rows = self._conn().execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return {status: count for status, count in rows}
+
+
+class _JobCollector(ResultCollector):
+    """Stores every action result as soon as it is added (progress survives a restart)."""
+
+    def __init__(self, store: JobStore, job_id: str, indexes: List[int]):
+        super().__init__()
+        self.store = store
+        self.job_id = job_id
+        self.indexes = indexes  # local index -> index in the job
+
+    def add(self, index: int, result: ActionResult) -> None:
+        super().add(index, result)
+        index = self.indexes[index]
+        self.store.save_result(self.job_id, index, dict(result.to_dict(), index=index))
+
+
+class JobQueue:
+    """
+    Bounded in-process worker pool over a JobStore.
+    runner(actions, user_id, collector) executes the actions (raising the first error, like
+    agent.execute_actions) and adds every result to the collector.
+    """
+
+    def __init__(self, runner: Callable[[List[Dict[str, Any]], str, ResultCollector], Any],
+                 store: Optional[JobStore] = None, workers: int = JOB_WORKERS,
+                 poll_interval: float = JOB_POLL_SECONDS, lease: float = JOB_LEASE_SECONDS):
+        self.runner = runner
+        self.store = store or JobStore()
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.lease = lease
+        self._wakeup = threading.Event()
+        self._stop = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._running: set = set()
+        self._lock = threading.Lock()
+
+    def start(self) -> None:
+        with self._lock:
+            if self._threads:
+                return
+            self._stop.clear()
+            self._threads = [threading.Thread(target=self._work, name=f"job-worker-{i}", daemon=True)
+                             for i in range(self.workers)]
+            self._threads.append(threading.Thread(target=self._beat, name="job-heartbeat", daemon=True))
+            for thread in self._threads:
+                thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        self._stop.set()
+        self._wakeup.set()
+        with self._lock:
+            threads, self._threads = self._threads, []
+        for thread in threads:
+            thread.join(timeout)
+
+    def submit(self, actions: List[Dict[str, Any]], user_id: str = "default") -> str:
+        job_id = self.store.create(actions, user_id)
+        self.start()
+        self._wakeup.set()
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        return self.store.get(job_id)
+
+    def run_next(self) -> bool:
+        """Claims and runs one job on the calling thread. Returns False when the queue is empty."""
+        job = self.store.claim(self.lease)
+        if job is None:
+            return False
+        with self._lock:
+            self._running.add(job["id"])
+        try:
+            self._run(job)
+        finally:
+            with self._lock:
+                self._running.discard(job["id"])
+        return True
+
+    def _run(self, job: Dict[str, Any]) -> None:
+        done = set(job["done"])
+        remaining = [i for i in range(len(job["actions"])) if i not in done]
+        collector = _JobCollector(self.store, job["id"], remaining)
+        try:
+            if remaining:
+                self.runner([job["actions"][i] for i in remaining], job["user_id"], collector)
+        except Exception as e:
+            self.store.finish(job["id"], str(e) or type(e).__name__)
+            return
+        self.store.finish(job["id"])
+
+    def _work(self) -> None:
+        while not self._stop.is_set():
+            try:
+                if self.run_next():
+                    continue
+            except Exception as e:
+                print(f"Job worker error: {e}")
+            self._wakeup.wait(self.poll_interval)
+            self._wakeup.clear()
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self.lease / 3):
+            with self._lock:
+                running = list(self._running)
+            try:
+                self.store.heartbeat(running)
+            except Exception as e:
+                print(f"Job heartbeat error: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            running_here = len(self._running)
+        return {"workers": self.workers, "running_here": running_here, "jobs": self.store.counts()}
+
+
+_queue: Optional[JobQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_queue(runner: Optional[Callable[..., Any]] = None) -> JobQueue:
+    """The process-wide queue; the first call must pass the runner."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            if runner is None:
+                raise RuntimeError("the job queue has no runner yet")
+            _queue = JobQueue(runner)
+        return _queue
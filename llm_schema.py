@@ -0,0 +1,308 @@
+# llm_schema.py
+import json
+import re
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# סכמות JSON לתשובות ה-LLM (structured outputs) + ולידציה ותיקון מקומי של טעויות קטנות,
+# במקום לאבד את הבקשה כש-json.loads נכשל.
+
+DEFAULT_TIME_ZONE = "Asia/Jerusalem"
+# פעולה שלא ניתן לתקן נשארת בתוכנית במקומה כסמן, ומדווחת כפעולה שנכשלה
+INVALID_ACTION = "invalid_action"
+
+_STRING = {"type": "string"}
+_EVENT_TIME = {
+    "type": "object",
+    "properties": {"dateTime": _STRING, "timeZone": _STRING},
+    "required": ["dateTime", "timeZone"],
+}
+_RANGE = {"from": _STRING, "to": _STRING}
+
+# אותם פורמטים כמו ב-system_prompt: command -> (שדות, שדות חובה)
+ACTION_FORMATS: Dict[str, Tuple[Dict[str, Any], List[str]]] = {
+    "add_event": ({
+        "events": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"summary": _STRING, "start": _EVENT_TIME, "end": _EVENT_TIME},
+                "required": ["summary", "start", "end"],
+            },
+        },
+    }, ["events"]),
+    "delete_event": ({
+        "filters": {"type": "object", "properties": {"text": _STRING, **_RANGE}, "required": ["text", "from", "to"]},
+        "answer": _STRING,
+    }, ["filters"]),
+    "query_event": ({
+        "question": _STRING,
+        "filters": {"type": "object", "properties": dict(_RANGE), "required": ["from", "to"]},
+    }, ["question", "filters"]),
+    "general_answer": ({"answer": _STRING}, ["answer"]),
+}
+
+
+def compile_action_schema() -> Dict[str, Any]:
+    return {
+        "anyOf": [
+            {
+                "type": "object",
+                "properties": {"command": {"type": "string", "enum": [command]}, **fields},
+                "required": ["command", *required],
+            }
+            for command, (fields, required) in ACTION_FORMATS.items()
+        ]
+    }
+
+
+ACTION_SCHEMA = compile_action_schema()
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {"actions": {"type": "array", "items": ACTION_SCHEMA}},
+    "required": ["actions"],
+}
+QUERY_RESULT_SCHEMA = {
+    "type": "object",
+    "properties": {"answer": _STRING, "delete_titles": {"type": "array", "items": _STRING}},
+}
+QUERY_FINDINGS_SCHEMA = {
+    "type": "object",
+    "properties": {"findings": _STRING, "delete_titles": {"type": "array", "items": _STRING}},
+    "required": ["findings"],
+}
+
+
+def response_format(name: str, schema: Dict[str, Any]) -> Dict[str, Any]:
+    """OpenAI structured-output parameter (non-strict: the schema guides, validate_* enforces)."""
+    return {"type": "json_schema", "json_schema": {"name": name, "schema": schema, "strict": False}}
+
+
+PLAN_RESPONSE_FORMAT = response_format("calendar_plan", PLAN_SCHEMA)
+QUERY_RESPONSE_FORMAT = response_format("calendar_query_result", QUERY_RESULT_SCHEMA)
+FINDINGS_RESPONSE_FORMAT = response_format("calendar_query_findings", QUERY_FINDINGS_SCHEMA)
+
+
+class PlanValidationError(ValueError):
+    """The LLM output could not be parsed or repaired into a valid plan."""
+
+
+# ----------------------------- lenient JSON parsing -----------------------------
+
+_FENCE_RE = re.compile(r"^```[a-zA-Z]*\s*|\s*```\s*$")
+_TRAILING_COMMA_RE = re.compile(r",\s*([}\]])")
+_LINE_COMMENT_RE = re.compile(r"(?m)^(\s*[^\"\n]*?)\s*//[^\n]*$")
+_SMART_QUOTES = str.maketrans({"“": '"', "”": '"', "„": '"'})
+
+
+def _close_brackets(text: str) -> str:
+    """Appends the closing brackets of a truncated JSON document."""
+    stack, in_string, escape = [], False, False
+    for ch in text:
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            stack.append("}" if ch == "{" else "]")
+        elif ch in "}]" and stack:
+            stack.pop()
+    return text + ('"' if in_string else "") + "".join(reversed(stack))
+
+
+def parse_json_lenient(content: str) -> Any:
+    """json.loads with local repairs for the usual LLM mistakes (fences, comments, trailing commas, truncation)."""
+    text = _FENCE_RE.sub("", (content or "").strip())
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        pass
+    start = min([i for i in (text.find("{"), text.find("[")) if i >= 0], default=-1)
+    if start < 0:
+        raise PlanValidationError("no JSON object in the response")
+    text = text[start:].translate(_SMART_QUOTES)
+    text = _LINE_COMMENT_RE.sub(r"\1", text)
+    text = _TRAILING_COMMA_RE.sub(r"\1", text)
+    for candidate in (text, text[:text.rfind("}") + 1], _close_brackets(text)):
+        try:
+            return json.loads(_TRAILING_COMMA_RE.sub(r"\1", candidate))
+        except json.JSONDecodeError:
+            continue
+    raise PlanValidationError("invalid JSON in the response")
+
+
+# ----------------------------- plan validation -----------------------------
+
+_COMMAND_ALIASES = {
+    "add": "add_event", "add_events": "add_event", "create_event": "add_event", "create": "add_event",
+    "delete": "delete_event", "delete_events": "delete_event", "remove_event": "delete_event", "remove": "delete_event",
+    "query": "query_event", "query_events": "query_event", "search": "query_event",
+    "answer": "general_answer", "general": "general_answer",
+}
+_RANGE_ALIASES = {"from": ("from", "start", "timeMin", "from_time"), "to": ("to", "end", "timeMax", "to_time")}
+
+
+def _fix_time(value: Any, time_zone: str) -> Optional[Dict[str, Any]]:
+    if isinstance(value, str):
+        value = {"dateTime": value}
+    if not isinstance(value, dict):
+        return None
+    value = dict(value)
+    if not value.get("dateTime") and not value.get("date"):
+        return None
+    if value.get("dateTime"):
+        value.setdefault("timeZone", time_zone)
+    return value
+
+
+def _fix_event(event: Any) -> Optional[Dict[str, Any]]:
+    if not isinstance(event, dict):
+        return None
+    event = dict(event)
+    if not event.get("summary") and isinstance(event.get("title"), str):
+        event["summary"] = event.pop("title")
+    event["summary"] = str(event.get("summary") or "")
+    tz = ((event.get("start") or {}) if isinstance(event.get("start"), dict) else {}).get("timeZone") or DEFAULT_TIME_ZONE
+    start = _fix_time(event.get("start"), tz)
+    if start is None:
+        return None
+    end = _fix_time(event.get("end"), tz)
+    if end is None:
+        if not start.get("dateTime"):
+            return None
+        # בלי שעת סיום – שעה אחת, כמו כללי ברירת המחדל ב-system_prompt
+        try:
+            begin = datetime.fromisoformat(start["dateTime"].replace("Z", "+00:00"))
+        except ValueError:
+            return None
+        end = {"dateTime": (begin + timedelta(hours=1)).isoformat(), "timeZone": start.get("timeZone", tz)}
+    event["start"], event["end"] = start, end
+    return event
+
+
+def _fix_filters(filters: Any, need_text: bool) -> Tuple[Optional[Dict[str, Any]], str]:
+    if not isinstance(filters, dict):
+        return None, "without filters"
+    fixed = dict(filters)
+    for key, aliases in _RANGE_ALIASES.items():
+        value = next((filters.get(a) for a in aliases if filters.get(a)), None)
+        if isinstance(value, dict):
+            value = value.get("dateTime") or value.get("date")
+        if not isinstance(value, str) or not value:
+            return None, f"without a '{key}' bound"
+        fixed[key] = value
+    if need_text and not (isinstance(fixed.get("text"), str) and fixed["text"].strip()):
+        return None, "without a title to match"  # never guess what to delete
+    return fixed, ""
+
+
+def validate_action(action: Any) -> Optional[Dict[str, Any]]:
+    """Returns the repaired action, or None when it can't be repaired."""
+    return _repair_action(action)[0]
+
+
+def _repair_action(action: Any) -> Tuple[Optional[Dict[str, Any]], str]:
+    """(repaired action, "") or (None, why it can't be repaired)"""
+    if not isinstance(action, dict):
+        return None, "action is not a JSON object"
+    action = dict(action)
+    command = action.get("command")
+    if isinstance(command, str):
+        command = _COMMAND_ALIASES.get(command.strip().lower(), command.strip().lower())
+    elif "events" in action:
+        command = "add_event"
+    elif "question" in action:
+        command = "query_event"
+    elif isinstance(action.get("filters"), dict):
+        command = "delete_event"
+    elif "answer" in action:
+        command = "general_answer"
+    if command not in ACTION_FORMATS:
+        return None, f"unknown command {command!r}"
+    action["command"] = command
+
+    if command == "add_event":
+        events = action.get("events")
+        if isinstance(events, dict):
+            events = [events]
+        events = [e for e in (_fix_event(ev) for ev in (events or [])) if e is not None]
+        if not events:
+            return None, "add_event without an event that has a valid start"
+        action["events"] = events
+    elif command in ("delete_event", "query_event"):
+        filters, reason = _fix_filters(action.get("filters"), need_text=command == "delete_event")
+        if filters is None:
+            return None, f"{command} {reason}"
+        action["filters"] = filters
+        if command == "query_event":
+            action["question"] = str(action.get("question") or "")
+    else:
+        answer = action.get("answer")
+        action["answer"] = answer if isinstance(answer, str) else json.dumps(answer, ensure_ascii=False) if answer else ""
+    return action, ""
+
+
+def check_action(action: Any, index: int) -> Dict[str, Any]:
+    """
+    The repaired action, or an "invalid_action" marker in its place when it can't be repaired,
+    so the caller reports it as a failed action instead of silently dropping it.
+    """
+    repaired, reason = _repair_action(action)
+    if repaired is not None:
+        return repaired
+    return {"command": INVALID_ACTION, "index": index, "reason": reason, "action": action}
+
+
+def plan_items(data: Any) -> List[Any]:
+    """The raw actions of a parsed plan, in order (a bare command or list counts as a one-action plan)."""
+    if isinstance(data, list):
+        return data
+    if isinstance(data, dict):
+        return data["actions"] if isinstance(data.get("actions"), list) else [data]
+    return []
+
+
+def validate_plan(data: Any) -> Dict[str, Any]:
+    """
+    Normalizes whatever the LLM returned into {"actions": [...]} with repaired actions, in order;
+    an action that can't be repaired is kept as an "invalid_action" marker (see check_action).
+    Raises PlanValidationError when no action survives.
+    """
+    if isinstance(data, list):
+        data = {"actions": data}
+    if not isinstance(data, dict):
+        raise PlanValidationError("plan is not a JSON object")
+    raw_actions = plan_items(data)
+    actions = [check_action(raw, i) for i, raw in enumerate(raw_actions)]
+    for marker in actions:
+        if marker["command"] == INVALID_ACTION:
+            print(f"Invalid action #{marker['index']} ({marker['reason']}):",
+                  json.dumps(marker["action"], ensure_ascii=False, default=str))
+    if raw_actions and all(a["command"] == INVALID_ACTION for a in actions):
+        raise PlanValidationError("no valid action in the plan")
+    return {"actions": actions}
+
+
+def validate_query_result(data: Any) -> Dict[str, Any]:
+    """Keeps only well-typed answer / findings / delete_titles from a query (or map-step) reply."""
+    if not isinstance(data, dict):
+        raise PlanValidationError("query result is not a JSON object")
+    result: Dict[str, Any] = {}
+    for key in ("answer", "findings"):
+        if isinstance(data.get(key), str):
+            result[key] = data[key]
+    titles = data.get("delete_titles")
+    if isinstance(titles, str):
+        titles = [titles]
+    if isinstance(titles, list):
+        result["delete_titles"] = [t for t in titles if isinstance(t, str) and t.strip()]
+    return result
+
+
+def parse_and_validate(content: str, validator: Callable[[Any], Dict[str, Any]]) -> Dict[str, Any]:
+    return validator(parse_json_lenient(content))
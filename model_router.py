@@ -0,0 +1,180 @@
+# model_router.py
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+# ניתוב בין שני מודלים: בקשות פשוטות (פעולה אחת, שאלה על מעט אירועים, תשובה כללית) הולכות למודל
+# הקטן והמהיר, ורק בקשות מורכבות (כמה פעולות, חזרתיות, טווח עם הרבה אירועים, ניתוח) למודל הגדול.
+# ההחלטה מבוססת על כללים זולים (בלי קריאה נוספת ל-LLM), ונרשמת יחד עם ה-latency של כל tier.
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") == "1"  # 0 → תמיד המודל הגדול
+SMALL_MODEL = os.getenv("LLM_SMALL_MODEL", "gpt-4o-mini")
+LARGE_MODEL = os.getenv("LLM_LARGE_MODEL", "gpt-4o")
+# פרומפט ארוך מזה (בתווים) נחשב מורכב
+PLAN_SMALL_MAX_CHARS = int(os.getenv("ROUTER_PLAN_SMALL_MAX_CHARS", "160"))
+# שאלה על יותר אירועים מזה הולכת למודל הגדול
+QUERY_SMALL_MAX_EVENTS = int(os.getenv("ROUTER_QUERY_SMALL_MAX_EVENTS", "60"))
+RECENT_DECISIONS = 100
+
+SMALL, LARGE = "small", "large"
+
+# כמה פעולות בפרומפט אחד ("... and then ...", "וגם", "ואז", כמה משפטים)
+_MULTI_ACTION_RE = re.compile(
+    r"\band\s+(?:then\s+)?(?:also\s+)?(?:add|schedule|book|delete|remove|cancel|move|create|set)\b|\bthen\b|\balso\b"
+    r"|וגם|ואז|אחר כך|בנוסף|[;\n]|\.\s+\S",
+    re.IGNORECASE,
+)
+# אירועים חוזרים ותנאים – קשים למודל הקטן
+_RECURRENCE_RE = re.compile(
+    r"\bevery\b|\beach\b|\bweekly\b|\bdaily\b|\bmonthly\b|\buntil\b|\bexcept\b|\bunless\b|\bif\b"
+    r"|כל יום|כל שבוע|כל חודש|בכל|עד ה|חוץ מ|אלא אם|(?:^|\s)אם\s",
+    re.IGNORECASE,
+)
+# שאלות שדורשות ניתוח ולא רק שליפה
+_ANALYTIC_RE = re.compile(
+    r"\bwhy\b|compare|summar|pattern|trend|analy|recommend|suggest|optimi|balance|"
+    r"למה|השווה|השוואה|סכם|סיכום|מגמה|נתח|ניתוח|המלץ|הצע",
+    re.IGNORECASE,
+)
+
+
+class Decision:
+    __slots__ = ("kind", "tier", "model", "reason")
+
+    def __init__(self, kind: str, tier: str, model: str, reason: str):
+        self.kind = kind
+        self.tier = tier
+        self.model = model
+        self.reason = reason
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"kind": self.kind, "tier": self.tier, "model": self.model, "reason": self.reason}
+
+
+def _decide(kind: str, tier: str, reason: str) -> Decision:
+    if not MODEL_ROUTING:
+        return Decision(kind, LARGE, LARGE_MODEL, "routing disabled")
+    return Decision(kind, tier, SMALL_MODEL if tier == SMALL else LARGE_MODEL, reason)
+
+
+def route_plan(prompt: str) -> Decision:
+    """Tier for planning the prompt (parse_event)."""
+    text = (prompt or "").strip()
+    if len(text) > PLAN_SMALL_MAX_CHARS:
+        return _decide("plan", LARGE, "long prompt")
+    if _MULTI_ACTION_RE.search(text):
+        return _decide("plan", LARGE, "multiple actions")
+    if _RECURRENCE_RE.search(text):
+        return _decide("plan", LARGE, "recurrence or condition")
+    return _decide("plan", SMALL, "single short request")
+
+
+def route_query(question: str, n_events: int, intents: Optional[List[str]] = None) -> Decision:
+    """Tier for answering a question over n_events events (handle_query)."""
+    if intents and set(intents) <= {"conflicts", "free_slots"}:
+        return _decide("query", SMALL, "facts precomputed")
+    if n_events > QUERY_SMALL_MAX_EVENTS:
+        return _decide("query", LARGE, f"{n_events} events")
+    if _ANALYTIC_RE.search(question or ""):
+        return _decide("query", LARGE, "analytical question")
+    return _decide("query", SMALL, f"{n_events} events")
+
+
+def route_map_window(n_events: int) -> Decision:
+    # חלון של map רק מחלץ ממצאים – תמיד המודל הקטן; ה-reduce שמנסח את התשובה – הגדול
+    return _decide("map", SMALL, f"map window of {n_events} events")
+
+
+def route_reduce(n_windows: int) -> Decision:
+    return _decide("reduce", LARGE, f"reduce over {n_windows} windows")
+
+
+def escalate(decision: Decision, reason: str) -> Optional[Decision]:
+    """The large-model decision to retry with, or None when the decision was already large."""
+    if decision.tier == LARGE:
+        return None
+    return Decision(decision.kind, LARGE, LARGE_MODEL, f"escalated: {reason}")
+
+
+class RoutingStats:
+    """Counts and latency per tier plus the most recent decisions (for /metrics)."""
+
+    def __init__(self, recent: int = RECENT_DECISIONS):
+        self._lock = threading.Lock()
+        self._tiers: Dict[str, Dict[str, float]] = {}
+        self._recent: deque = deque(maxlen=recent)
+
+    def record(self, decision: Decision, seconds: float, ok: bool = True) -> None:
+        with self._lock:
+            tier = self._tiers.setdefault(decision.tier, {"calls": 0, "errors": 0, "seconds": 0.0, "max_seconds": 0.0})
+            tier["calls"] += 1
+            tier["errors"] += 0 if ok else 1
+            tier["seconds"] += seconds
+            tier["max_seconds"] = max(tier["max_seconds"], seconds)
+            self._recent.append(dict(decision.to_dict(), ms=round(seconds * 1000), ok=ok))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            tiers = {
+                name: {
+                    "calls": int(t["calls"]),
+                    "errors": int(t["errors"]),
+                    "avg_ms": round(t["seconds"] / t["calls"] * 1000) if t["calls"] else 0,
+                    "max_ms": round(t["max_seconds"] * 1000),
+                }
+                for name, t in self._tiers.items()
+            }
+            return {"enabled": MODEL_ROUTING, "models": {SMALL: SMALL_MODEL, LARGE: LARGE_MODEL},
+                    "tiers": tiers, "recent": list(self._recent)}
+
+    def reset(self) -> None:
+        with self._lock:
+            self._tiers.clear()
+            self._recent.clear()
+
+
+_stats = RoutingStats()
+
+
+def get_stats() -> RoutingStats:
+    return _stats
+
+
+@contextmanager
+def timed(decision: Decision) -> Iterator[Decision]:
+    """Records the latency of the LLM call made inside the block under the decision's tier."""
+    started = time.perf_counter()
+    ok = False
+    try:
+        yield decision
+        ok = True
+    finally:
+        _stats.record(decision, time.perf_counter() - started, ok)
+
+
+class StreamTimer:
+    """
+    Latency of a streamed LLM call: only the time spent waiting for the model (the request and every
+    chunk), not the time the consumer holds each chunk – a slow or disconnected client isn't counted.
+    """
+
+    def __init__(self, decision: Decision):
+        self.decision = decision
+        self.seconds = 0.0
+
+    @contextmanager
+    def waiting(self) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        except Exception:
+            _stats.record(self.decision, self.seconds + time.perf_counter() - started, ok=False)
+            raise
+        self.seconds += time.perf_counter() - started
+
+    def finish(self) -> None:
+        """Records the call once the last chunk arrived."""
+        _stats.record(self.decision, self.seconds)
@@ -0,0 +1,124 @@
+# multi_calendar.py
+import heapq
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import calendar_cache
+import rate_limiter
+
+# שאילתות על כמה יומנים (משפחה, עבודה...) במקביל: כל יומן נשלף ב-thread משלו (כבר ממוין לפי התחלה),
+# הזרמים ממוזגים ב-k-way merge (heapq.merge) ואירוע שמופיע בכמה יומנים (אותו iCalUID) נשאר פעם אחת.
+# CALENDAR_IDS: רשימה מופרדת בפסיקים, או "all" לכל היומנים שב-calendarList של המשתמש.
+CALENDAR_IDS = [c.strip() for c in os.getenv("CALENDAR_IDS", "primary").split(",") if c.strip()] or ["primary"]
+CALENDAR_LIST_TTL_SECONDS = float(os.getenv("CALENDAR_LIST_TTL", "300"))
+FANOUT_WORKERS = int(os.getenv("CALENDAR_FANOUT_WORKERS", "8"))
+DEFAULT_TIME_ZONE = "Asia/Jerusalem"
+
+_calendar_lists: Dict[str, Tuple[float, List[str]]] = {}
+_calendar_lists_lock = threading.Lock()
+
+
+def _list_calendars(service) -> List[str]:
+    ids, page_token = [], None
+    while True:
+        resp = rate_limiter.execute(service.calendarList().list(pageToken=page_token, showHidden=False), service)
+        for item in resp.get("items", []):
+            if item.get("deleted") or item.get("hidden"):
+                continue
+            # היומן הראשי נשמר בשם "primary" – אותו מפתח מטמון כמו במצב של יומן אחד
+            ids.append("primary" if item.get("primary") else item["id"])
+        page_token = resp.get("nextPageToken")
+        if not page_token:
+            break
+    if "primary" in ids:
+        ids.remove("primary")
+    return ["primary"] + ids
+
+
+def resolve_calendar_ids(service, calendar_ids: Optional[List[str]] = None) -> List[str]:
+    """The calendars to read: the explicit list, CALENDAR_IDS, or every calendar of the user for "all"."""
+    calendar_ids = calendar_ids or CALENDAR_IDS
+    if calendar_ids != ["all"]:
+        return list(calendar_ids)
+    user_id = rate_limiter.user_of(service)
+    with _calendar_lists_lock:
+        cached = _calendar_lists.get(user_id)
+        if cached is not None and time.monotonic() - cached[0] < CALENDAR_LIST_TTL_SECONDS:
+            return cached[1]
+    ids = _list_calendars(service)
+    with _calendar_lists_lock:
+        _calendar_lists[user_id] = (time.monotonic(), ids)
+    return ids
+
+
+def reset_calendar_lists() -> None:
+    with _calendar_lists_lock:
+        _calendar_lists.clear()
+
+
+def _start_key(ev: Dict[str, Any]) -> datetime:
+    return calendar_cache.parse_event_time(ev.get("start"), DEFAULT_TIME_ZONE) or datetime.min.replace(
+        tzinfo=calendar_cache.timezone.utc)
+
+
+def _dedupe_key(ev: Dict[str, Any]) -> Tuple[str, str]:
+    start = ev.get("start") or {}
+    return ev.get("iCalUID") or ev.get("id"), start.get("dateTime") or start.get("date") or ""
+
+
+def merge_sorted(streams: List[List[Dict[str, Any]]]) -> Iterator[Dict[str, Any]]:
+    """k-way merge of per-calendar event lists (each sorted by start), skipping duplicates."""
+    seen = set()
+    for ev in heapq.merge(*streams, key=_start_key):
+        key = _dedupe_key(ev)
+        if key in seen:
+            continue
+        seen.add(key)
+        yield ev
+
+
+def fan_out(service, calendar_ids: List[str],
+            fetch: Callable[[Any, str], List[Dict[str, Any]]],
+            service_factory: Callable[[Any], Any] = lambda service: service) -> Iterator[Dict[str, Any]]:
+    """
+    Runs fetch(service, calendar_id) for every calendar concurrently (each worker gets its own service
+    from service_factory) and yields the merged events. Every event is tagged with its calendarId.
+    """
+    def _fetch(calendar_id):
+        return [dict(ev, calendarId=calendar_id) for ev in fetch(service_factory(service), calendar_id)]
+
+    with ThreadPoolExecutor(max_workers=max(1, min(FANOUT_WORKERS, len(calendar_ids)))) as pool:
+        streams = list(pool.map(_fetch, calendar_ids))
+    yield from merge_sorted(streams)
+
+
+def merge_page(windows: List[List[Dict[str, Any]]], page_size: int,
+               seen: Optional[List[List[str]]] = None) -> Tuple[List[Dict[str, Any]], List[int], List[List[str]]]:
+    """
+    One page of the merge of per-calendar windows (each sorted by start, holding at least page_size events
+    unless its calendar ends there). Returns the page, how many events of every window it consumed
+    (duplicates included) and the keys to skip on the next page: the events that share the page's last start
+    with a copy that may still be waiting in another calendar.
+    """
+    positions = [0] * len(windows)
+    skip = {tuple(key) for key in seen or []}
+    page: List[Dict[str, Any]] = []
+    while len(page) < page_size:
+        heads = [i for i, window in enumerate(windows) if positions[i] < len(window)]
+        if not heads:
+            break
+        # הראשון מבין המינימליים – כמו heapq.merge, לפי סדר היומנים
+        i = min(heads, key=lambda j: _start_key(windows[j][positions[j]]))
+        ev = windows[i][positions[i]]
+        positions[i] += 1
+        key = _dedupe_key(ev)
+        if key in skip:
+            continue
+        skip.add(key)
+        page.append(ev)
+    last_start = _dedupe_key(page[-1])[1] if page else None
+    return page, positions, [list(key) for key in skip if key[1] == last_start]
@@ -0,0 +1,152 @@
+# plan_cache.py
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import sqlite_local
+
+# מטמון לתוכניות שה-LLM החזיר (parse_event). המפתח כולל את התאריך של היום,
+# כי "מחר"/"השבוע" מתפרשים אחרת בכל יום.
+PLAN_CACHE = os.getenv("PLAN_CACHE", "memory")  # memory | sqlite | off
+PLAN_CACHE_PATH = os.getenv("PLAN_CACHE_PATH", os.path.join(os.getenv("TOKEN_DIR", "/tmp"), "plan_cache.sqlite3"))
+PLAN_CACHE_TTL = float(os.getenv("PLAN_CACHE_TTL", "3600"))
+PLAN_CACHE_MAX_ENTRIES = int(os.getenv("PLAN_CACHE_MAX_ENTRIES", "1024"))
+
+_WS_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Case-fold, collapse whitespace and drop trailing punctuation, so near-identical prompts share a key."""
+    text = _WS_RE.sub(" ", prompt).strip().casefold()
+    return text.rstrip(" ?!.,;:")
+
+
+def make_key(prompt: str, today: str, time_zone: str = "Asia/Jerusalem") -> str:
+    raw = f"{today}|{time_zone}|{normalize_prompt(prompt)}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class MemoryBackend:
+    """In-process LRU with TTL."""
+
+    def __init__(self, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+
+class SQLiteBackend:
+    """File-backed store shared by all the gunicorn workers on the same machine."""
+
+    def __init__(self, path: str = PLAN_CACHE_PATH, max_entries: int = PLAN_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self._conn = sqlite_local.ThreadLocalConnection(path)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS plans ("
+                " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used REAL NOT NULL)"
+            )
+
+    def get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._conn() as conn:
+            row = conn.execute("SELECT value, expires_at FROM plans WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < now:
+                conn.execute("DELETE FROM plans WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE plans SET last_used = ? WHERE key = ?", (now, key))
+            return row[0]
+
+    def set(self, key: str, value: str, ttl: float) -> None:
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO plans (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, value, now + ttl, now),
+            )
+            conn.execute("DELETE FROM plans WHERE expires_at < ?", (now,))
+            conn.execute(
+                "DELETE FROM plans WHERE key NOT IN (SELECT key FROM plans ORDER BY last_used DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+
+    def clear(self) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM plans")
+
+
+class PlanCache:
+    def __init__(self, backend, ttl: float = PLAN_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, prompt: str, today: str) -> Optional[Dict[str, Any]]:
+        value = self.backend.get(make_key(prompt, today))
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(value)
+
+    def set(self, prompt: str, today: str, plan: Dict[str, Any]) -> None:
+        self.backend.set(make_key(prompt, today), json.dumps(plan, ensure_ascii=False), self.ttl)
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "backend": type(self.backend).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 3) if total else 0.0,
+        }
+
+
+_plan_cache: Optional[PlanCache] = None
+_plan_cache_lock = threading.Lock()
+
+
+def get_plan_cache() -> Optional[PlanCache]:
+    """The process-wide plan cache configured by PLAN_CACHE (None when disabled)."""
+    global _plan_cache
+    if PLAN_CACHE == "off":
+        return None
+    with _plan_cache_lock:
+        if _plan_cache is None:
+            backend = SQLiteBackend() if PLAN_CACHE == "sqlite" else MemoryBackend()
+            _plan_cache = PlanCache(backend)
+        return _plan_cache
@@ -0,0 +1,79 @@
+# prompt_builder.py
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+# סדר ההודעות ל-LLM בנוי כך ש-prompt caching של הספק (cache לפי prefix) יתפוס:
+#   1. הוראות המערכת הגדולות – קבועות, זהות בייט-לבייט בכל קריאה ובכל יום
+#   2. הקשר משתנה (תאריך היום, אזור זמן) – הודעת system קצרה אחרי ההוראות
+#   3. הודעת המשתמש (השאלה, האירועים)
+# כל שינוי בחלק 1 (אפילו תאריך) מבטל את ה-cache לכל הבקשות, לכן אסור להכניס אליו נתונים.
+DEFAULT_TIME_ZONE = "Asia/Jerusalem"
+
+
+def context_text(today: str, time_zone: str = DEFAULT_TIME_ZONE) -> str:
+    weekday = datetime.strptime(today, "%Y-%m-%d").strftime("%A")
+    return f"Context:\nToday's date is {today} ({weekday}).\nDefault time zone: {time_zone}."
+
+
+def build_messages(static_system: str, user_content: str, context: Optional[str] = None) -> List[Dict[str, str]]:
+    """The static instructions first, the volatile context after them, the user's content last."""
+    messages = [{"role": "system", "content": static_system}]
+    if context:
+        messages.append({"role": "system", "content": context})
+    messages.append({"role": "user", "content": user_content})
+    return messages
+
+
+class TokenUsage:
+    """Prompt / cached / completion token totals per kind of call (plan, query, map, reduce)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds: Dict[str, Dict[str, int]] = {}
+
+    def record(self, kind: str, prompt_tokens: int, cached_tokens: int, completion_tokens: int) -> None:
+        with self._lock:
+            totals = self._kinds.setdefault(
+                kind, {"calls": 0, "prompt_tokens": 0, "cached_tokens": 0, "completion_tokens": 0})
+            totals["calls"] += 1
+            totals["prompt_tokens"] += prompt_tokens
+            totals["cached_tokens"] += cached_tokens
+            totals["completion_tokens"] += completion_tokens
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kinds = {kind: dict(totals) for kind, totals in self._kinds.items()}
+        for totals in kinds.values():
+            totals["cache_hit_ratio"] = (round(totals["cached_tokens"] / totals["prompt_tokens"], 3)
+                                         if totals["prompt_tokens"] else 0.0)
+        return kinds
+
+    def reset(self) -> None:
+        with self._lock:
+            self._kinds.clear()
+
+
+_usage = TokenUsage()
+
+
+def get_usage() -> TokenUsage:
+    return _usage
+
+
+def record_usage(kind: str, response: Any) -> Optional[Dict[str, int]]:
+    """
+    Adds the usage block of a chat completion (or of the last chunk of a stream with include_usage)
+    to the totals. Returns the counts, or None when the response has no usage.
+    """
+    usage = getattr(response, "usage", None)
+    if usage is None:
+        return None
+    details = getattr(usage, "prompt_tokens_details", None)
+    counts = {
+        "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+        "cached_tokens": getattr(details, "cached_tokens", 0) or 0,
+        "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+    }
+    _usage.record(kind, counts["prompt_tokens"], counts["cached_tokens"], counts["completion_tokens"])
+    return counts
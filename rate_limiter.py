@@ -0,0 +1,202 @@
+# rate_limiter.py
+import json
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# מתזמן מרכזי לכל הקריאות ל-Google Calendar:
+# - token bucket גלובלי (לכל הפרויקט) ולכל משתמש, כדי לא לחרוג מהמכסה מלכתחילה
+# - ניסיון חוזר עם exponential backoff + jitter על 429 / 5xx / 403 של rate limit
+# - מדדים: כמה זמן חיכינו ל-bucket, כמה ל-backoff, כמה ניסיונות חוזרים
+# ברירות המחדל לפי מכסת ברירת המחדל של Calendar API (600 בקשות לדקה למשתמש)
+GLOBAL_QPS = float(os.getenv("CALENDAR_GLOBAL_QPS", "50"))
+USER_QPS = float(os.getenv("CALENDAR_USER_QPS", "10"))
+BURST_SECONDS = float(os.getenv("CALENDAR_BURST_SECONDS", "5"))  # גודל ה-bucket = QPS * BURST_SECONDS
+MAX_RETRIES = int(os.getenv("CALENDAR_MAX_RETRIES", "6"))
+BACKOFF_BASE_SECONDS = float(os.getenv("CALENDAR_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX_SECONDS = float(os.getenv("CALENDAR_BACKOFF_MAX", "32"))
+
+# 403 נחשב זמני רק עם אחת מהסיבות האלה (403 אחר = אין הרשאה, לא מנסים שוב)
+_RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+
+
+class TokenBucket:
+    """Classic token bucket; acquire() blocks until the tokens are available and returns the wait."""
+
+    def __init__(self, rate: float, capacity: float,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.rate = rate
+        self.capacity = max(capacity, 1.0)
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def _reserve(self, tokens: float) -> float:
+        """Takes the tokens (going into debt if needed) and returns how long the caller must wait."""
+        with self._lock:
+            now = self.clock()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= tokens
+            return 0.0 if self._tokens >= 0 else -self._tokens / self.rate
+
+    def acquire(self, tokens: float = 1.0) -> float:
+        if self.rate <= 0:
+            return 0.0
+        wait = self._reserve(tokens)
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+def http_status(error: Exception) -> Optional[int]:
+    """The HTTP status of a googleapiclient HttpError (None for other errors)."""
+    status = getattr(getattr(error, "resp", None), "status", None)
+    try:
+        return int(status) if status is not None else None
+    except (TypeError, ValueError):
+        return None
+
+
+def _reason(error: Exception) -> str:
+    content = getattr(error, "content", None)
+    try:
+        data = json.loads(content.decode("utf-8") if isinstance(content, bytes) else content or "")
+        errors = data.get("error", {}).get("errors") or []
+        return errors[0].get("reason", "") if errors else ""
+    except (ValueError, AttributeError):
+        return ""
+
+
+def is_retryable(error: Exception) -> bool:
+    status = http_status(error)
+    if status == 429 or (status is not None and status >= 500):
+        return True
+    return status == 403 and _reason(error) in _RATE_LIMIT_REASONS
+
+
+def user_of(service) -> str:
+    return getattr(service, "calendar_user", "default")
+
+
+class CallScheduler:
+    def __init__(self, global_qps: float = GLOBAL_QPS, user_qps: float = USER_QPS,
+                 burst_seconds: float = BURST_SECONDS, max_retries: int = MAX_RETRIES,
+                 backoff_base: float = BACKOFF_BASE_SECONDS, backoff_max: float = BACKOFF_MAX_SECONDS,
+                 clock: Callable[[], float] = time.monotonic, sleep: Callable[[float], None] = time.sleep):
+        self.user_qps = user_qps
+        self.burst_seconds = burst_seconds
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.clock = clock
+        self.sleep = sleep
+        self.global_bucket = TokenBucket(global_qps, global_qps * burst_seconds, clock, sleep)
+        self._user_buckets: Dict[str, TokenBucket] = {}
+        self._lock = threading.Lock()
+        self._metrics = {"calls": 0, "retries": 0, "failures": 0, "throttled_seconds": 0.0, "backoff_seconds": 0.0}
+
+    def _user_bucket(self, user_id: str) -> TokenBucket:
+        with self._lock:
+            bucket = self._user_buckets.get(user_id)
+            if bucket is None:
+                bucket = self._user_buckets[user_id] = TokenBucket(
+                    self.user_qps, self.user_qps * self.burst_seconds, self.clock, self.sleep)
+            return bucket
+
+    def _count(self, key: str, amount: float = 1) -> None:
+        with self._lock:
+            self._metrics[key] += amount
+
+    def _throttle(self, user_id: str, cost: int) -> None:
+        waited = self._user_bucket(user_id).acquire(cost) + self.global_bucket.acquire(cost)
+        self._count("calls", cost)
+        if waited:
+            self._count("throttled_seconds", waited)
+
+    def _backoff(self, attempt: int) -> None:
+        # full jitter: uniform(0, min(max, base * 2^attempt))
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+        self._count("retries")
+        self._count("backoff_seconds", delay)
+        self.sleep(delay)
+
+    def execute(self, request, user_id: str = "default", cost: int = 1) -> Any:
+        """request.execute() under the rate limits, retrying transient errors with backoff."""
+        for attempt in range(self.max_retries + 1):
+            self._throttle(user_id, cost)
+            try:
+                return request.execute()
+            except Exception as e:
+                if attempt >= self.max_retries or not is_retryable(e):
+                    self._count("failures")
+                    raise
+            self._backoff(attempt)
+
+    def execute_batched(self, service, requests: List[Any], batch_size: int) -> List[Tuple[Any, Optional[Exception]]]:
+        """
+        Sends the requests in batches of batch_size (each sub-request counts against the quota).
+        Sub-requests that failed with a transient error are re-sent together after a backoff.
+        Returns (response, exception) per request, in order.
+        """
+        user_id = user_of(service)
+        results: List[Tuple[Any, Optional[Exception]]] = [(None, None)] * len(requests)
+        if len(requests) == 1:
+            try:
+                results[0] = (self.execute(requests[0], user_id), None)
+            except Exception as e:
+                results[0] = (None, e)
+            return results
+
+        def _callback(request_id, response, exception):
+            results[int(request_id)] = (response, exception)
+
+        pending = list(range(len(requests)))
+        for attempt in range(self.max_retries + 1):
+            for offset in range(0, len(pending), batch_size):
+                chunk = pending[offset:offset + batch_size]
+                batch = service.new_batch_http_request(callback=_callback)
+                for i in chunk:
+                    batch.add(requests[i], request_id=str(i))
+                # שגיאה ברמת ה-batch כולו (למשל 429) – כל הבקשות בו ינוסו שוב בסבב הבא
+                self._throttle(user_id, len(chunk))
+                try:
+                    batch.execute()
+                except Exception as e:
+                    for i in chunk:
+                        results[i] = (None, e)
+            pending = [i for i in pending if results[i][1] is not None and is_retryable(results[i][1])]
+            if not pending or attempt >= self.max_retries:
+                break
+            self._backoff(attempt)
+        self._count("failures", sum(1 for _, error in results if error is not None))
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._metrics)
+            stats["users"] = len(self._user_buckets)
+        stats["throttled_seconds"] = round(stats["throttled_seconds"], 3)
+        stats["backoff_seconds"] = round(stats["backoff_seconds"], 3)
+        return stats
+
+
+_scheduler: Optional[CallScheduler] = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> CallScheduler:
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = CallScheduler()
+        return _scheduler
+
+
+def execute(request, service=None, cost: int = 1) -> Any:
+    """Shortcut for get_scheduler().execute() with the user the service belongs to."""
+    return get_scheduler().execute(request, user_of(service), cost)
@@ -0,0 +1,138 @@
+# session_auth.py
+import base64
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from typing import Optional
+
+import sqlite_local
+
+# זיהוי המשתמש בצד השרת, במקום user_id שהלקוח בוחר בעצמו:
+# - בסוף ה-OAuth השרת מנפיק session token חתום (HMAC) למשתמש, והלקוח שולח אותו בכל בקשה
+#   ב-Authorization: Bearer <token>
+# - ה-state של OAuth הוא nonce חד-פעמי חתום; ה-nonce (והמשתמש שהוא שייך לו) נשמר ב-SQLite,
+#   משותף לכל ה-workers, ונמחק בשימוש הראשון – state מזויף, ישן או משומש נדחה לפני שמירת האישורים
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(os.getenv("TOKEN_DIR", "/tmp"), "sessions.sqlite3"))
+SESSION_TTL_SECONDS = int(os.getenv("SESSION_TTL_SECONDS", str(30 * 24 * 3600)))
+OAUTH_STATE_TTL_SECONDS = int(os.getenv("OAUTH_STATE_TTL_SECONDS", "600"))
+# 1 → כל בקשה חייבת session token (שרת של כמה משתמשים; דורש SESSION_SECRET).
+# 0 (ברירת המחדל) → בקשות בלי token הן של המשתמש default, כמו לפני שהיו sessions
+REQUIRE_SESSION = os.getenv("REQUIRE_SESSION", "0") == "1"
+SESSION_SECRET = os.getenv("SESSION_SECRET", "")
+
+_secret: bytes = SESSION_SECRET.encode("utf-8")
+
+
+class AuthError(Exception):
+    """Missing, forged, expired or already used session token / OAuth state."""
+
+
+def check_config() -> None:
+    """Called at startup: a multi-user server must not sign sessions with a secret it made up itself."""
+    if REQUIRE_SESSION and not SESSION_SECRET:
+        raise RuntimeError("REQUIRE_SESSION=1 needs SESSION_SECRET to be set")
+
+
+def _signing_secret() -> bytes:
+    # בלי SESSION_SECRET (מצב משתמש יחיד): סוד אקראי שנוצר פעם אחת ונשמר ב-SQLite של ה-sessions,
+    # כך שהוא משותף לכל ה-workers ושורד restart
+    global _secret
+    if not _secret:
+        _secret = get_state_store().shared_secret()
+    return _secret
+
+
+def _sign(purpose: str, payload: str) -> str:
+    digest = hmac.new(_signing_secret(), f"{purpose}:{payload}".encode("utf-8"), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(digest).rstrip(b"=").decode("ascii")
+
+
+def _b64(text: str) -> str:
+    return base64.urlsafe_b64encode(text.encode("utf-8")).rstrip(b"=").decode("ascii")
+
+
+def _unb64(text: str) -> str:
+    return base64.urlsafe_b64decode(text + "=" * (-len(text) % 4)).decode("utf-8")
+
+
+def issue_session(user_id: str, ttl: int = SESSION_TTL_SECONDS) -> str:
+    """A signed token that identifies user_id until it expires: <user>.<expires>.<signature>."""
+    payload = f"{_b64(user_id)}.{int(time.time()) + ttl}"
+    return f"{payload}.{_sign('session', payload)}"
+
+
+def verify_session(token: str) -> str:
+    """The user id of a valid session token; raises AuthError otherwise."""
+    try:
+        encoded_user, expires, signature = (token or "").split(".")
+        payload = f"{encoded_user}.{expires}"
+        if not hmac.compare_digest(signature, _sign("session", payload)):
+            raise AuthError("invalid session token")
+        if int(expires) < time.time():
+            raise AuthError("session expired")
+        return _unb64(encoded_user)
+    except (ValueError, UnicodeDecodeError):
+        raise AuthError("invalid session token")
+
+
+class OAuthStateStore:
+    """Single-use OAuth state nonces in SQLite; shared by all the workers on the same machine."""
+
+    def __init__(self, path: str = SESSION_DB_PATH):
+        self.path = path
+        self._conn = sqlite_local.ThreadLocalConnection(path)
+        with self._conn() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS oauth_states ("
+                " nonce TEXT PRIMARY KEY, user_id TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE TABLE IF NOT EXISTS secrets (name TEXT PRIMARY KEY, value TEXT NOT NULL)")
+
+    def shared_secret(self) -> bytes:
+        """The signing secret stored next to the states; the first worker to ask creates it."""
+        with self._conn() as conn:
+            conn.execute("INSERT OR IGNORE INTO secrets (name, value) VALUES ('session', ?)",
+                         (secrets.token_hex(32),))
+            row = conn.execute("SELECT value FROM secrets WHERE name = 'session'").fetchone()
+        return row[0].encode("utf-8")
+
+    def issue(self, user_id: str, ttl: int = OAUTH_STATE_TTL_SECONDS) -> str:
+        """A new signed state for an OAuth login of user_id ("" = decided at the callback): <nonce>.<signature>."""
+        nonce = secrets.token_urlsafe(24)
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("DELETE FROM oauth_states WHERE expires < ?", (now,))
+            conn.execute("INSERT INTO oauth_states (nonce, user_id, expires) VALUES (?, ?, ?)",
+                         (nonce, user_id, now + ttl))
+        return f"{nonce}.{_sign('oauth-state', nonce)}"
+
+    def consume(self, state: str) -> str:
+        """The user the state was issued for; the state can't be used again. Raises AuthError."""
+        nonce, _, signature = (state or "").partition(".")
+        if not nonce or not hmac.compare_digest(signature, _sign("oauth-state", nonce)):
+            raise AuthError("invalid OAuth state")
+        conn = self._conn()
+        with conn:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT user_id, expires FROM oauth_states WHERE nonce = ?", (nonce,)).fetchone()
+            conn.execute("DELETE FROM oauth_states WHERE nonce = ?", (nonce,))
+        if row is None:
+            raise AuthError("OAuth state already used or unknown")
+        if row[1] < time.time():
+            raise AuthError("OAuth state expired")
+        return row[0]
+
+
+_state_store: Optional[OAuthStateStore] = None
+_state_store_lock = threading.Lock()
+
+
+def get_state_store() -> OAuthStateStore:
+    global _state_store
+    with _state_store_lock:
+        if _state_store is None:
+            _state_store = OAuthStateStore()
+        return _state_store
@@ -0,0 +1,27 @@
+# sqlite_local.py
+import os
+import sqlite3
+import threading
+
+# חיבורי SQLite לקבצים שמשותפים לכל ה-workers באותה מכונה (מטמון תוכניות, אישורים, תור עבודות...):
+# חיבור אחד לכל thread (אובייקט sqlite3 לא עובר בין threads), במצב WAL כך שקוראים לא חוסמים כותב.
+BUSY_TIMEOUT_SECONDS = 5
+
+
+class ThreadLocalConnection:
+    """Callable that returns this thread's WAL connection to one SQLite file (the directory is created if needed)."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+
+    def __call__(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=BUSY_TIMEOUT_SECONDS)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
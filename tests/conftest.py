@@ -0,0 +1,216 @@
+import os
+import sys
+import time
+import uuid
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(__file__)))
+os.environ.setdefault("OPENAI_API_KEY", "sk-test")
+
+
+@pytest.fixture(autouse=True)
+def _no_real_backoff(monkeypatch):
+    import rate_limiter
+    monkeypatch.setattr(rate_limiter, "_scheduler", rate_limiter.CallScheduler(sleep=lambda seconds: None))
+
+
+@pytest.fixture(autouse=True)
+def _fresh_event_caches():
+    import calendar_cache
+    calendar_cache.reset_caches()
+    yield
+    calendar_cache.reset_caches()
+    calendar_cache.set_push_state(None)
+
+
+class FakeHttpError(Exception):
+    """Looks like googleapiclient's HttpError (resp.status) to rate_limiter.http_status."""
+
+    def __init__(self, status, message=""):
+        super().__init__(f"<HttpError {status}: {message}>")
+        self.resp = type("Resp", (), {"status": status})()
+
+
+class FakeRequest:
+    def __init__(self, service, fn):
+        self._service = service
+        self._fn = fn
+
+    def execute(self, **kwargs):
+        self._service.round_trips += 1
+        return self._fn()
+
+
+class FakeBatch:
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None):
+        self._requests.append((request_id, request))
+
+    def execute(self):
+        self._service.round_trips += 1
+        for request_id, request in self._requests:
+            try:
+                response, exception = request._fn(), None
+            except Exception as e:
+                response, exception = None, e
+            self._callback(request_id, response, exception)
+
+
+class FakeEvents:
+    def __init__(self, service):
+        self._service = service
+
+    def insert(self, calendarId, body):
+        def run():
+            if body.get("summary") == "boom":
+                raise RuntimeError("insert failed")
+            if body.get("id") and body["id"] in self._service.store.get(calendarId, {}):
+                raise FakeHttpError(409, "duplicate")
+            event = dict(body, id=body.get("id") or uuid.uuid4().hex, status="confirmed")
+            event["htmlLink"] = f"https://calendar.test/{event['id']}"
+            self._service.put(calendarId, event)
+            return event
+        return FakeRequest(self._service, run)
+
+    def delete(self, calendarId, eventId):
+        def run():
+            if eventId not in self._service.store.get(calendarId, {}):
+                raise RuntimeError("not found")
+            self._service.remove(calendarId, eventId)
+            return ""
+        return FakeRequest(self._service, run)
+
+    def list(self, calendarId, singleEvents=True, orderBy=None, timeMin=None, timeMax=None,
+             maxResults=250, pageToken=None, syncToken=None, **params):
+        def run():
+            self._service.list_calls += 1
+            if syncToken is not None:
+                since = int(syncToken)
+                changed = {event_id for version, event_id in self._service.changes if version > since}
+                store = self._service.store.get(calendarId, {})
+                items = [store.get(event_id) or {"id": event_id, "status": "cancelled"} for event_id in changed]
+            else:
+                items = sorted(self._service.store.get(calendarId, {}).values(), key=_start_key)
+            if timeMin:
+                items = [ev for ev in items if (ev["end"].get("dateTime") or ev["end"].get("date")) > timeMin]
+            if timeMax:
+                items = [ev for ev in items if (ev["start"].get("dateTime") or ev["start"].get("date")) < timeMax]
+            offset = int(pageToken or 0)
+            page = items[offset:offset + maxResults]
+            resp = {"items": page, "timeZone": "Asia/Jerusalem"}
+            if offset + maxResults < len(items):
+                resp["nextPageToken"] = str(offset + maxResults)
+            elif timeMin is None and timeMax is None:
+                resp["nextSyncToken"] = str(self._service.version)
+            return resp
+        return FakeRequest(self._service, run)
+
+    def watch(self, calendarId, body):
+        def run():
+            resource_id = f"res-{calendarId}"
+            self._service.watches[body["id"]] = dict(body, calendarId=calendarId, resourceId=resource_id)
+            expiration = int((time.time() + int(body.get("params", {}).get("ttl", 3600))) * 1000)
+            return {"kind": "api#channel", "id": body["id"], "resourceId": resource_id,
+                    "expiration": str(expiration)}
+        return FakeRequest(self._service, run)
+
+
+class FakeChannels:
+    def __init__(self, service):
+        self._service = service
+
+    def stop(self, body):
+        return FakeRequest(self._service, lambda: self._service.watches.pop(body["id"], None) and "")
+
+
+class FakeNotifier:
+    """
+    Plays Google's push side: every change in a FakeCalendarService with an open events.watch channel
+    is delivered as the X-Goog-* headers of a notification (deliver = TestClient post or a handler).
+    """
+
+    def __init__(self, deliver):
+        self.deliver = deliver
+        self.sent = []
+        self._messages = {}
+
+    def send(self, channel, state):
+        number = self._messages[channel["id"]] = self._messages.get(channel["id"], 0) + 1
+        headers = {
+            "X-Goog-Channel-ID": channel["id"],
+            "X-Goog-Channel-Token": channel.get("token", ""),
+            "X-Goog-Resource-ID": channel["resourceId"],
+            "X-Goog-Resource-State": state,
+            "X-Goog-Message-Number": str(number),
+        }
+        self.sent.append(headers)
+        return self.deliver(headers)
+
+
+class FakeCalendarList:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, pageToken=None, **params):
+        items = [{"id": calendar_id, "primary": calendar_id == "primary"} for calendar_id in self._service.store]
+        return FakeRequest(self._service, lambda: {"items": items})
+
+
+def _start_key(ev):
+    return ev["start"].get("dateTime") or ev["start"].get("date")
+
+
+class FakeCalendarService:
+    """Minimal in-memory stand-in for the googleapiclient calendar resource."""
+
+    def __init__(self, events=None, calendar_id="primary"):
+        self.store = {calendar_id: {ev["id"]: ev for ev in (events or [])}}
+        self.round_trips = 0
+        self.list_calls = 0
+        self.version = 0
+        self.changes = []
+        self.watches = {}
+        self.notifier = None
+
+    def put(self, calendar_id, event):
+        self.store.setdefault(calendar_id, {})[event["id"]] = event
+        self.version += 1
+        self.changes.append((self.version, event["id"]))
+        self._notify(calendar_id)
+
+    def remove(self, calendar_id, event_id):
+        del self.store[calendar_id][event_id]
+        self.version += 1
+        self.changes.append((self.version, event_id))
+        self._notify(calendar_id)
+
+    def _notify(self, calendar_id):
+        if self.notifier is None:
+            return
+        for channel in list(self.watches.values()):
+            if channel["calendarId"] == calendar_id:
+                self.notifier.send(channel, "exists")
+
+    def events(self):
+        return FakeEvents(self)
+
+    def channels(self):
+        return FakeChannels(self)
+
+    def calendarList(self):
+        return FakeCalendarList(self)
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+
+def make_event(event_id, summary, start, end, **extra):
+    event = {"id": event_id, "summary": summary, "status": "confirmed",
+             "start": {"dateTime": start}, "end": {"dateTime": end}}
+    event.update(extra)
+    return event
@@ -1,15 +1,191 @@
+import pytest
 from fastapi.testclient import TestClient
 from app.main import app
+import session_auth
 
 client = TestClient(app)
+AUTH = {"Authorization": f"Bearer {session_auth.issue_session('default')}"}
 
 def test_health_ok():
     r = client.get("/health")
     assert r.status_code == 200
 
 def test_run_dry_ok():
-    r = client.post("/run", json={"prompt": "schedule lunch tomorrow", "dry_run": True})
+    r = client.post("/run", json={"prompt": "schedule lunch tomorrow", "dry_run": True}, headers=AUTH)
     assert r.status_code == 200
     data = r.json()
     assert data["ok"] is True
     assert "logs" in data
+
+def test_parse_stream_sends_actions_as_events():
+    r = client.post("/parse/stream", json={"prompt": "lunch tomorrow"})
+    assert r.status_code == 200
+    assert r.headers["content-type"].startswith("text/event-stream")
+    assert "event: action" in r.text
+    assert "event: done" in r.text
+
+def test_calendar_notifications_mark_the_cache_stale(monkeypatch, tmp_path):
+    import calendar_cache
+    import calendar_watch
+    from conftest import FakeCalendarService, FakeNotifier
+
+    registry = calendar_watch.WatchRegistry(address="https://agent.test/calendar/notifications",
+                                            store=calendar_watch.ChannelStore(str(tmp_path / "watch.sqlite3")))
+    monkeypatch.setattr(calendar_watch, "_registry", registry)
+    monkeypatch.setattr(calendar_watch, "WATCH_ENABLED", True)
+    service = FakeCalendarService()
+    registry.register(service)
+    cache = calendar_cache.get_event_cache()
+    cache._stale = False
+
+    notifier = FakeNotifier(lambda headers: client.post("/calendar/notifications", headers=headers))
+    response = notifier.send(next(iter(service.watches.values())), "exists")
+
+    assert response.status_code == 200 and response.json()["result"] == "changed"
+    assert cache._stale is True
+
+def test_calendar_notifications_are_ignored_when_watch_is_off(monkeypatch):
+    import calendar_watch
+
+    monkeypatch.setattr(calendar_watch, "WATCH_ENABLED", False)
+    monkeypatch.setattr(calendar_watch, "get_registry", lambda: pytest.fail("registry built while watch is off"))
+
+    r = client.post("/calendar/notifications", headers={"X-Goog-Channel-ID": "c", "X-Goog-Resource-State": "exists"})
+    assert r.status_code == 200 and r.json() == {"ok": False, "result": "ignored"}
+
+def test_execute_in_background_returns_202_and_job_progress(monkeypatch, tmp_path):
+    import time
+    import job_queue
+    import app.main as main
+    from conftest import FakeCalendarService
+
+    service = FakeCalendarService()
+    monkeypatch.setattr(main, "get_calendar_service", lambda user_id="default": service)
+    queue = job_queue.JobQueue(main._run_job, store=job_queue.JobStore(str(tmp_path / "jobs.sqlite3")),
+                               poll_interval=0.05)
+    monkeypatch.setattr(job_queue, "_queue", queue)
+    actions = [{"command": "add_event", "payload": {"events": [{
+        "summary": f"Lesson {i}",
+        "start": {"dateTime": f"2025-11-{i:02d}T09:00:00", "timeZone": "Asia/Jerusalem"},
+        "end": {"dateTime": f"2025-11-{i:02d}T10:00:00", "timeZone": "Asia/Jerusalem"},
+    }]}} for i in range(1, 4)]
+
+    try:
+        r = client.post("/execute", json={"actions": actions, "background": True}, headers=AUTH)
+        assert r.status_code == 202
+        job_id = r.json()["job_id"]
+
+        deadline = time.time() + 5
+        while time.time() < deadline:
+            job = client.get(f"/jobs/{job_id}", headers=AUTH).json()
+            if job["status"] in ("succeeded", "failed"):
+                break
+            time.sleep(0.05)
+    finally:
+        queue.stop(timeout=5)
+
+    assert job["status"] == "succeeded", job
+    assert job["completed"] == 3 and job["failed"] == 0
+    assert len(service.store["primary"]) == 3
+    assert client.get("/jobs/missing", headers=AUTH).status_code == 404
+
+
+def test_run_answers_a_query_from_the_prefetched_range(monkeypatch):
+    import agent
+    import app.main as main
+    from conftest import FakeCalendarService, make_event
+
+    service = FakeCalendarService([
+        make_event("a", "Dentist", "2025-11-04T09:00:00+02:00", "2025-11-04T10:00:00+02:00"),
+    ])
+    monkeypatch.setattr(main, "get_calendar_service", lambda user_id="default": service)
+    monkeypatch.setattr(agent, "get_today", lambda: "2025-11-03")
+
+    class _Completions:
+        def create(self, **kwargs):
+            message = type("Message", (), {"content": '{"answer": "Dentist at 09:00."}'})
+            return type("Response", (), {"choices": [type("Choice", (), {"message": message})]})
+
+    monkeypatch.setattr(agent, "client", type("Client", (), {"chat": type("Chat", (), {"completions": _Completions()})}))
+    fetched = []
+    list_events = agent.list_events
+    monkeypatch.setattr(agent, "list_events", lambda *args, **kw: fetched.append(args[1:]) or list_events(*args, **kw))
+
+    r = client.post("/run", json={"prompt": "what do I have tomorrow?"}, headers=AUTH)
+
+    data = r.json()
+    assert r.status_code == 200 and data["ok"] is True, data
+    assert data["results"][0]["answer"] == "Dentist at 09:00."
+    assert data["prefetch"]["hits"] == 1
+    assert fetched == [("2025-11-03T00:00:00+02:00", "2025-11-11T00:00:00+02:00")]  # only the prefetch
+
+
+def test_events_rejects_a_non_positive_page_size():
+    r = client.post("/events", json={"from_datetime": "2025-11-01T00:00:00", "to_datetime": "2025-11-02T00:00:00",
+                                     "page_size": 0}, headers=AUTH)
+    assert r.status_code == 422
+
+
+def test_execute_counts_only_the_actions_that_succeeded(monkeypatch):
+    import app.main as main
+    from conftest import FakeCalendarService
+
+    service = FakeCalendarService()
+    monkeypatch.setattr(main, "get_calendar_service", lambda user_id="default": service)
+    event = lambda summary, day: {"summary": summary,
+                                  "start": {"dateTime": f"2025-11-{day:02d}T09:00:00", "timeZone": "Asia/Jerusalem"},
+                                  "end": {"dateTime": f"2025-11-{day:02d}T10:00:00", "timeZone": "Asia/Jerusalem"}}
+
+    r = client.post("/execute", json={"actions": [
+        {"command": "add_event", "events": [event("boom", 3)]},
+        {"command": "add_event", "events": [event("Lunch", 10)]},
+        {"command": "general_answer", "answer": "ok"},
+    ]}, headers=AUTH)
+
+    data = r.json()
+    assert data["ok"] is True and data["executed"] == 2
+    assert [res["ok"] for res in data["results"]] == [False, True, True]
+
+
+def test_calendar_endpoints_take_the_user_from_the_session(monkeypatch):
+    import app.main as main
+    from conftest import FakeCalendarService
+
+    users = []
+    monkeypatch.setattr(session_auth, "REQUIRE_SESSION", True)
+    monkeypatch.setattr(main, "get_calendar_service", lambda user_id="default": users.append(user_id) or FakeCalendarService())
+    body = {"from_datetime": "2025-11-01T00:00:00", "to_datetime": "2025-11-02T00:00:00", "user_id": "victim"}
+
+    assert client.post("/events", json=body).status_code == 401
+    assert client.post("/events", json=body, headers={"Authorization": "Bearer forged.1.x"}).status_code == 401
+    r = client.post("/events", json=body, headers={"Authorization": f"Bearer {session_auth.issue_session('alice')}"})
+
+    assert r.status_code == 200 and users == ["alice"]
+
+
+def test_oauth_callback_accepts_only_a_fresh_signed_state(monkeypatch):
+    import app.main as main
+
+    stored = []
+    monkeypatch.setattr(main, "exchange_code_for_token", lambda code, user_id: stored.append(user_id) or user_id)
+    state = session_auth.get_state_store().issue("alice")
+
+    assert client.get("/oauth2callback", params={"code": "c", "state": "alice"}).status_code == 400
+    assert client.get("/oauth2callback", params={"code": "c", "state": "x" + state}).status_code == 400
+    r = client.get("/oauth2callback", params={"code": "c", "state": state})
+    assert r.status_code == 200 and stored == ["alice"]
+    assert "myapp://oauth-complete?session=" in r.text
+    # single use
+    assert client.get("/oauth2callback", params={"code": "c", "state": state}).status_code == 400
+    assert stored == ["alice"]
+
+
+def test_oauth_callback_issues_the_session_for_the_user_the_login_resolved_to(monkeypatch):
+    import app.main as main
+    from urllib.parse import unquote
+
+    monkeypatch.setattr(main, "exchange_code_for_token", lambda code, user_id: user_id or "default")
+    r = client.get("/oauth2callback", params={"code": "c", "state": session_auth.get_state_store().issue("")})
+
+    session = unquote(r.text.split("session=")[1].split('"')[0])
+    assert session_auth.verify_session(session) == "default"
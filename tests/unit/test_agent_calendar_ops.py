@@ -0,0 +1,279 @@
+import pytest
+import agent
+from conftest import FakeCalendarService, make_event
+
+
+def _event(summary, day):
+    return {
+        "summary": summary,
+        "start": {"dateTime": f"2025-11-{day:02d}T09:00:00+02:00", "timeZone": "Asia/Jerusalem"},
+        "end": {"dateTime": f"2025-11-{day:02d}T10:00:00+02:00", "timeZone": "Asia/Jerusalem"},
+    }
+
+
+def test_add_event_batches_inserts():
+    service = FakeCalendarService()
+    events = [_event(f"Lesson {i}", 1 + i % 28) for i in range(60)]
+
+    report = agent.add_event(service, events).events
+
+    assert service.round_trips == 2  # 50 + 10
+    assert len(report) == 60
+    assert all(r["ok"] and r["link"] for r in report)
+
+
+def test_add_event_reports_failures_per_event():
+    service = FakeCalendarService()
+
+    result = agent.add_event(service, [_event("Lunch", 3), _event("boom", 4)])
+
+    assert [r["ok"] for r in result.events] == [True, False]
+    assert "insert failed" in result.events[1]["error"]
+    assert result.ok is False and result.created == 1
+
+
+def test_a_retried_insert_that_was_already_committed_is_not_duplicated(monkeypatch):
+    from conftest import FakeHttpError
+
+    service = FakeCalendarService()
+    insert = service.events().insert
+    failed = set()
+
+    def committed_then_503(calendarId, body):
+        request = insert(calendarId, body)
+        run = request._fn
+
+        def first_attempt_times_out():
+            response = run()
+            if body["summary"] not in failed:
+                failed.add(body["summary"])
+                raise FakeHttpError(503, "backend error")
+            return response
+        request._fn = first_attempt_times_out
+        return request
+
+    monkeypatch.setattr(type(service.events()), "insert", lambda self, calendarId, body: committed_then_503(calendarId, body))
+
+    for events in ([_event("Lunch", 3)], [_event("Gym", 4), _event("Dentist", 5)]):
+        result = agent.add_event(service, events)
+        assert result.ok is True and all(r["id"] for r in result.events)
+
+    assert sorted(ev["summary"] for ev in service.store["primary"].values()) == ["Dentist", "Gym", "Lunch"]
+
+
+def test_delete_event_by_titles_batches_deletes():
+    service = FakeCalendarService([
+        make_event(f"ev{i}", "Gym" if i % 2 else "Work", f"2025-11-{1 + i:02d}T09:00:00+02:00",
+                   f"2025-11-{1 + i:02d}T10:00:00+02:00")
+        for i in range(20)
+    ])
+
+    report = agent.delete_event_by_titles(
+        service, "2025-11-01T00:00:00+02:00", "2025-11-30T23:59:59+02:00", ["Gym"]).events
+
+    assert len(report) == 10 and all(r["ok"] for r in report)
+    assert service.round_trips == 2  # one list + one batch
+    assert all(ev["summary"] == "Work" for ev in service.store["primary"].values())
+
+
+def test_iter_events_follows_every_page(monkeypatch):
+    monkeypatch.setattr(agent.calendar_cache, "PAGE_SIZE", 7)
+    monkeypatch.setattr(agent.calendar_cache, "CACHE_ENABLED", False)
+    service = FakeCalendarService([
+        make_event(f"ev{i:02d}", f"Shift {i}", f"2025-11-{1 + i:02d}T09:00:00+02:00",
+                   f"2025-11-{1 + i:02d}T10:00:00+02:00")
+        for i in range(20)
+    ])
+
+    events = agent.list_events(service, "2025-11-01T00:00:00+02:00", "2025-11-30T23:59:59+02:00")
+
+    assert [ev["id"] for ev in events] == [f"ev{i:02d}" for i in range(20)]
+    assert service.list_calls == 3
+
+
+def test_list_events_page_cursor_walks_the_range(monkeypatch):
+    monkeypatch.setattr(agent.calendar_cache, "CACHE_ENABLED", False)
+    service = FakeCalendarService([
+        make_event(f"ev{i:02d}", f"Shift {i}", f"2025-11-{1 + i:02d}T09:00:00+02:00",
+                   f"2025-11-{1 + i:02d}T10:00:00+02:00")
+        for i in range(5)
+    ])
+    seen, cursor = [], None
+    while True:
+        page, cursor = agent.list_events_page(
+            service, "2025-11-01T00:00:00+02:00", "2025-11-30T23:59:59+02:00", 2, cursor)
+        seen.extend(ev["id"] for ev in page)
+        if cursor is None:
+            break
+
+    assert seen == [f"ev{i:02d}" for i in range(5)]
+
+
+def test_list_events_page_rejects_bad_sizes_and_expired_cursors(monkeypatch):
+    import pytest
+
+    service = FakeCalendarService([
+        make_event(f"ev{i}", f"Shift {i}", f"2025-11-{1 + i:02d}T09:00:00+02:00", f"2025-11-{1 + i:02d}T10:00:00+02:00")
+        for i in range(4)
+    ])
+    time_min, time_max = "2025-11-01T00:00:00+02:00", "2025-11-30T23:59:59+02:00"
+    with pytest.raises(ValueError):
+        agent.list_events_page(service, time_min, time_max, 0)
+
+    cached = list(service.store["primary"].values())
+    monkeypatch.setattr(agent.calendar_cache.EventCache, "list_range", lambda self, *args: cached)
+    page, cursor = agent.list_events_page(service, time_min, time_max, 2)
+    assert cursor == "o:2"
+    # the cache stops covering the range between two pages
+    monkeypatch.setattr(agent.calendar_cache.EventCache, "list_range", lambda self, *args: None)
+    with pytest.raises(agent.PageCursorExpired):
+        agent.list_events_page(service, time_min, time_max, 2, cursor)
+
+
+def test_dependencies_keep_overlapping_writes_ordered():
+    actions = agent.normalize_actions_timezone([
+        {"command": "delete_event", "filters": {"text": "Gym", "from": "2025-11-01T00:00:00", "to": "2025-11-07T23:59:59"}},
+        {"command": "query_event", "question": "?", "filters": {"from": "2025-11-03T00:00:00", "to": "2025-11-04T00:00:00"}},
+        {"command": "query_event", "question": "?", "filters": {"from": "2025-12-01T00:00:00", "to": "2025-12-02T00:00:00"}},
+        {"command": "general_answer", "answer": "hi"},
+        {"command": "add_event", "events": [_event("Lunch", 20)]},
+    ])
+
+    assert agent._build_dependencies(actions) == [set(), {0}, set(), set(), set()]
+
+
+def test_execute_actions_prints_outputs_in_original_order(capsys):
+    service = FakeCalendarService()
+    agent.execute_actions(
+        [
+            {"command": "general_answer", "answer": "first"},
+            {"command": "add_event", "events": [_event("Lunch", 20)]},
+            {"command": "general_answer", "answer": "third"},
+        ],
+        service,
+        service_factory=lambda: service,
+    )
+
+    lines = capsys.readouterr().out.splitlines()
+    assert lines[0] == "Answer: first"
+    assert lines[1].startswith("Event Created:")
+    assert lines[2] == "Answer: third"
+
+
+def test_execute_actions_feeds_the_request_collector(capsys):
+    service = FakeCalendarService()
+    collector = agent.ResultCollector()
+
+    agent.execute_actions(
+        [
+            {"command": "add_event", "events": [_event("Lunch", 20)]},
+            {"command": "general_answer", "answer": "done"},
+        ],
+        service,
+        service_factory=lambda: service,
+        collector=collector,
+    )
+
+    results = collector.results
+    assert capsys.readouterr().out == ""
+    assert [r.command for r in results] == ["add_event", "general_answer"]
+    assert results[0].created == 1 and results[1].answer == "done"
+    assert collector.logs().splitlines()[1] == "Answer: done"
+
+
+def test_delete_command_matches_locally_without_the_llm(monkeypatch):
+    service = FakeCalendarService([
+        make_event("a", "Spam call", "2025-11-03T09:00:00+02:00", "2025-11-03T10:00:00+02:00"),
+        make_event("b", "Standup", "2025-11-04T09:00:00+02:00", "2025-11-04T10:00:00+02:00"),
+    ])
+    monkeypatch.setattr(agent, "handle_query", lambda *a, **k: (_ for _ in ()).throw(AssertionError("LLM used")))
+
+    agent.execute_actions([{"command": "delete_event", "filters": {
+        "text": "spam", "from": "2025-11-01T00:00:00", "to": "2025-11-07T23:59:59"}}], service)
+
+    assert list(service.store["primary"]) == ["b"]
+    assert service.list_calls == 1
+
+
+def _two_calendars():
+    service = FakeCalendarService([
+        make_event("p1", "Standup", "2025-11-03T09:00:00+02:00", "2025-11-03T09:30:00+02:00"),
+        make_event("p2", "Dinner", "2025-11-03T19:00:00+02:00", "2025-11-03T21:00:00+02:00",
+                   iCalUID="shared@test"),
+    ])
+    for event in [
+        make_event("f1", "Kindergarten pickup", "2025-11-03T16:00:00+02:00", "2025-11-03T16:30:00+02:00"),
+        make_event("f2", "Dinner", "2025-11-03T19:00:00+02:00", "2025-11-03T21:00:00+02:00",
+                   iCalUID="shared@test"),
+        make_event("f3", "Swim", "2025-11-03T07:00:00+02:00", "2025-11-03T08:00:00+02:00"),
+    ]:
+        service.put("family", event)
+    return service
+
+
+def test_iter_events_merges_calendars_by_start_and_dedupes(monkeypatch):
+    monkeypatch.setattr(agent.multi_calendar, "CALENDAR_IDS", ["primary", "family"])
+    service = _two_calendars()
+
+    events = agent.list_events(service, "2025-11-03T00:00:00+02:00", "2025-11-04T00:00:00+02:00")
+
+    assert [ev["summary"] for ev in events] == ["Swim", "Standup", "Kindergarten pickup", "Dinner"]
+    assert [ev["calendarId"] for ev in events] == ["family", "primary", "family", "primary"]
+
+
+def test_all_calendars_come_from_calendar_list_and_delete_hits_the_owner(monkeypatch):
+    monkeypatch.setattr(agent.multi_calendar, "CALENDAR_IDS", ["all"])
+    agent.multi_calendar.reset_calendar_lists()
+    service = _two_calendars()
+
+    events = agent.list_events(service, "2025-11-03T00:00:00+02:00", "2025-11-04T00:00:00+02:00")
+    swim = next(ev for ev in events if ev["summary"] == "Swim")
+    result = agent.delete_events(service, [swim])
+
+    assert result.ok
+    assert "f3" not in service.store["family"]
+    page, cursor = agent.list_events_page(service, "2025-11-03T00:00:00+02:00", "2025-11-04T00:00:00+02:00", 2)
+    assert [ev["summary"] for ev in page] == ["Standup", "Kindergarten pickup"] and cursor.startswith("m:")
+    page, cursor = agent.list_events_page(service, "2025-11-03T00:00:00+02:00", "2025-11-04T00:00:00+02:00", 2, cursor)
+    assert [ev["summary"] for ev in page] == ["Dinner"] and cursor is None
+
+
+@pytest.mark.parametrize("cache_enabled", [True, False])
+def test_merged_pages_read_only_a_page_per_calendar(monkeypatch, cache_enabled):
+    monkeypatch.setattr(agent.calendar_cache, "CACHE_ENABLED", cache_enabled)
+    monkeypatch.setattr(agent.multi_calendar, "CALENDAR_IDS", ["primary", "family"])
+    service = FakeCalendarService()
+    for calendar_id, hour in (("primary", 9), ("family", 18)):
+        for day in range(1, 21):
+            service.put(calendar_id, make_event(f"{calendar_id}{day:02d}", f"{calendar_id} {day}",
+                                                f"2025-11-{day:02d}T{hour:02d}:00:00+02:00",
+                                                f"2025-11-{day:02d}T{hour:02d}:30:00+02:00"))
+    # the same invitation in both calendars is listed once even when its copies fall on two pages
+    for calendar_id in ("primary", "family"):
+        service.put(calendar_id, make_event(f"{calendar_id}-shared", "Shared", "2025-11-04T12:00:00+02:00",
+                                            "2025-11-04T13:00:00+02:00", iCalUID="shared@test"))
+    time_min, time_max = "2025-11-01T00:00:00+02:00", "2025-11-30T23:59:59+02:00"
+    expected = [ev["id"] for ev in agent.list_events(service, time_min, time_max)]
+
+    fetched = []
+    iter_pages = agent.calendar_cache.iter_pages
+
+    def counting_pages(*args, **kwargs):
+        for resp in iter_pages(*args, **kwargs):
+            fetched.extend(resp.get("items", []))
+            yield resp
+    monkeypatch.setattr(agent.calendar_cache, "iter_pages", counting_pages)
+
+    seen, cursor, pages = [], None, 0
+    while True:
+        fetched.clear()
+        page, cursor = agent.list_events_page(service, time_min, time_max, 3, cursor)
+        assert len(fetched) <= 2 * 2 * 3  # at most two pages of page_size per calendar, not the whole range
+        seen.extend(ev["id"] for ev in page)
+        pages += 1
+        if cursor is None:
+            break
+
+    assert seen == expected and len(seen) == 41 and pages == 14
+    with pytest.raises(agent.PageCursorExpired):
+        agent.list_events_page(service, time_min, time_max, 3, "o:3")
@@ -0,0 +1,197 @@
+import agent
+
+
+def test_stream_parser_emits_each_action_when_it_closes():
+    text = ('```json\n{"actions": [{"command": "add_event", "events": [{"summary": "a \\"}\\" b"}]}, '
+            '{"command": "general_answer", "answer": "x [ ] {"}]}\n```')
+    parser = agent._ActionStreamParser()
+    emitted = []
+    for i in range(0, len(text), 5):
+        emitted.append(parser.feed(text[i:i + 5]))
+
+    actions = [a for chunk in emitted for a in chunk]
+    assert [a["command"] for a in actions] == ["add_event", "general_answer"]
+    assert actions[0]["events"][0]["summary"] == 'a "}" b'
+    # the first action is available before the stream ends
+    assert next(i for i, chunk in enumerate(emitted) if chunk) < len(emitted) - 3
+
+
+class _FakeCompletions:
+    def __init__(self, reply):
+        self._reply = reply
+        self.calls = []
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        content = self._reply(kwargs)
+        message = type("Message", (), {"content": content})
+        choice = type("Choice", (), {"message": message})
+        return type("Response", (), {"choices": [choice]})
+
+
+class FakeOpenAI:
+    def __init__(self, reply):
+        self.completions = _FakeCompletions(reply)
+        self.chat = type("Chat", (), {"completions": self.completions})
+
+
+def test_large_ranges_are_answered_with_map_reduce(monkeypatch):
+    from datetime import date, timedelta
+    from conftest import FakeCalendarService, make_event
+
+    days = [date(2025, 1, 1) + timedelta(days=i) for i in range(120)]
+    service = FakeCalendarService([
+        make_event(f"e{i}", "Dentist" if i % 30 == 0 else f"Task {i}",
+                   f"{d}T09:00:00+02:00", f"{d}T10:00:00+02:00")
+        for i, d in enumerate(days)
+    ])
+
+    def reply(kwargs):
+        if kwargs["messages"][0]["content"] == agent.QUERY_MAP_PROMPT:
+            return '{"findings": "dentist x1"}'
+        return '{"answer": "You had 4 dentist appointments."}'
+
+    fake = FakeOpenAI(reply)
+    monkeypatch.setattr(agent, "client", fake)
+    monkeypatch.setattr(agent, "MAP_REDUCE_MIN_EVENTS", 50)
+    monkeypatch.setattr(agent, "MAP_CHUNK_MAX_EVENTS", 30)
+
+    result = agent.handle_query(service, "how many dentist appointments?",
+                       {"from": "2025-01-01T00:00:00+02:00", "to": "2025-12-31T23:59:59+02:00"})
+
+    map_calls = [c for c in fake.completions.calls if c["messages"][0]["content"] == agent.QUERY_MAP_PROMPT]
+    assert len(map_calls) == len(agent._split_by_week(service.events().list("primary").execute()["items"], 30))
+    assert len(fake.completions.calls) == len(map_calls) + 1
+    assert result.answer == "You had 4 dentist appointments."
+    assert "Answer: You had 4 dentist appointments." in result.text
+
+
+class _FakeAsyncCompletions(_FakeCompletions):
+    async def create(self, **kwargs):
+        return _FakeCompletions.create(self, **kwargs)
+
+
+def test_plan_actions_async_uses_the_async_client(monkeypatch):
+    import asyncio
+
+    monkeypatch.setattr(agent.plan_cache, "PLAN_CACHE", "off")
+    completions = _FakeAsyncCompletions(
+        lambda kwargs: '{"actions": [{"command": "general_answer", "answer": "42"}]}')
+    fake = type("AsyncOpenAI", (), {"chat": type("Chat", (), {"completions": completions})})
+    monkeypatch.setattr(agent, "async_client", fake)
+
+    actions = asyncio.run(agent.plan_actions_async("what is the meaning of life, and also of everything?"))
+
+    assert actions == [{"command": "general_answer", "answer": "42"}]
+    assert completions.calls[0]["response_format"] == agent.llm_schema.PLAN_RESPONSE_FORMAT
+
+
+def test_invalid_plan_from_the_small_model_is_retried_on_the_large_one(monkeypatch):
+    import model_router
+
+    def reply(kwargs):
+        if kwargs["model"] == model_router.SMALL_MODEL:
+            return "not json at all"
+        return '{"actions": [{"command": "general_answer", "answer": "Paris"}]}'
+
+    fake = FakeOpenAI(reply)
+    monkeypatch.setattr(agent, "client", fake)
+    monkeypatch.setattr(agent.plan_cache, "get_plan_cache", lambda: None)
+
+    data = agent.parse_event("capital of France?")
+
+    assert [c["model"] for c in fake.completions.calls] == [model_router.SMALL_MODEL, model_router.LARGE_MODEL]
+    assert data["actions"][0]["answer"] == "Paris"
+
+
+class StreamingOpenAI:
+    """streams the reply text in chunks of 7 characters"""
+
+    def __init__(self, text):
+        def chunk(content):
+            delta = type("Delta", (), {"content": content})
+            return type("Chunk", (), {"choices": [type("Choice", (), {"delta": delta})], "usage": None})
+
+        create = lambda _, **kwargs: [chunk(text[i:i + 7]) for i in range(0, len(text), 7)]
+        self.chat = type("Chat", (), {"completions": type("Completions", (), {"create": create})()})
+
+
+def test_stream_yields_repaired_actions_once_and_in_plan_order(monkeypatch):
+    # the first action has a trailing comma: it can't be emitted mid-stream, only after the lenient final parse
+    text = ('{"actions": [{"command": "general_answer", "answer": "first",}, '
+            '{"command": "general_answer", "answer": "second"}]}')
+
+    monkeypatch.setattr(agent, "client", StreamingOpenAI(text))
+    monkeypatch.setattr(agent.plan_cache, "get_plan_cache", lambda: None)
+
+    answers = [a["answer"] for a in agent.stream_actions("tell me something nice about my week please")]
+
+    # "second" waits for "first", which is only repaired at the end of the stream
+    assert answers == ["first", "second"]
+
+
+def test_map_windows_split_on_sunday_start_weeks():
+    from conftest import make_event
+
+    # 2025-01-04 is a Saturday, 2025-01-05 a Sunday and 2025-01-06 a Monday
+    items = [make_event(f"e{d}", "x", f"2025-01-0{d}T09:00:00+02:00", f"2025-01-0{d}T10:00:00+02:00")
+             for d in (4, 5, 6)]
+
+    windows = agent._split_by_week(items, 2)
+
+    # a week is never split, and Saturday closes the week that Sunday opens
+    assert [[ev["id"] for ev in w] for w in windows] == [["e4"], ["e5", "e6"]]
+
+
+def test_query_without_an_intent_sends_no_facts(monkeypatch):
+    from conftest import FakeCalendarService, make_event
+
+    service = FakeCalendarService([make_event("e1", "Dentist", "2025-01-01T09:00:00+02:00", "2025-01-01T10:00:00+02:00")])
+    fake = FakeOpenAI(lambda kwargs: '{"answer": "Dentist at 9."}')
+    monkeypatch.setattr(agent, "client", fake)
+    filters = {"from": "2025-01-01T00:00:00+02:00", "to": "2025-01-02T00:00:00+02:00"}
+
+    agent.handle_query(service, "what do I have on the account review day?", filters)
+    agent.handle_query(service, "how many meetings do I have?", filters)
+
+    contents = [c["messages"][-1]["content"] for c in fake.completions.calls]
+    assert "Precomputed facts" not in contents[0]
+    assert "Precomputed facts" in contents[1]
+
+
+def test_stream_reports_an_invalid_action_in_place_without_skipping_the_rest(monkeypatch):
+    text = ('{"actions": [{"command": "delete_event", "filters": {"from": "2025-11-03", "to": "2025-11-04"}}, '
+            '{"command": "general_answer", "answer": "a"}, {"command": "general_answer", "answer": "b"}]}')
+    monkeypatch.setattr(agent, "client", StreamingOpenAI(text))
+    monkeypatch.setattr(agent.plan_cache, "get_plan_cache", lambda: None)
+
+    actions = list(agent.stream_actions("tell me something nice about my week please"))
+
+    assert [a["command"] for a in actions] == ["invalid_action", "general_answer", "general_answer"]
+    assert [a.get("answer") for a in actions[1:]] == ["a", "b"]
+    result = agent.process_command(None, actions[0])
+    assert not result.ok
+    assert result.error == "delete_event without a title to match"
+
+
+def test_stream_latency_excludes_the_consumer_and_a_disconnect_is_not_an_error(monkeypatch):
+    import time
+    import model_router
+
+    text = ('{"actions": [{"command": "general_answer", "answer": "a"}, '
+            '{"command": "general_answer", "answer": "b"}]}')
+    monkeypatch.setattr(agent, "client", StreamingOpenAI(text))
+    monkeypatch.setattr(agent.plan_cache, "get_plan_cache", lambda: None)
+    stats = model_router.get_stats()
+    stats.reset()
+    prompt = "tell me something nice about my week please"
+
+    disconnected = agent.stream_actions(prompt)
+    next(disconnected)
+    disconnected.close()
+    assert stats.stats()["recent"] == []
+
+    for _ in agent.stream_actions(prompt):
+        time.sleep(0.2)  # a slow client
+    recent = stats.stats()["recent"]
+    assert len(recent) == 1 and recent[0]["ok"] and recent[0]["ms"] < 200
@@ -0,0 +1,45 @@
+import analytics
+from conftest import make_event
+
+EVENTS = [
+    make_event("a", "Standup", "2025-11-03T09:00:00+02:00", "2025-11-03T09:30:00+02:00"),
+    make_event("b", "Design review", "2025-11-03T09:15:00+02:00", "2025-11-03T11:00:00+02:00"),
+    make_event("c", "Dentist", "2025-11-03T16:00:00+02:00", "2025-11-03T17:00:00+02:00"),
+    make_event("d", "Dentist", "2025-11-04T08:00:00+02:00", "2025-11-04T09:00:00+02:00"),
+    {"id": "e", "summary": "Holiday", "start": {"date": "2025-11-05"}, "end": {"date": "2025-11-06"}},
+]
+RANGE = ("2025-11-03T00:00:00+02:00", "2025-11-04T23:59:59+02:00")
+
+
+def test_conflicts_and_durations_are_exact():
+    facts = analytics.compute_facts(EVENTS, *RANGE)
+
+    assert [(a.title, b.title) for a, b in facts["conflicts"]] == [("Standup", "Design review")]
+    assert facts["scheduled_minutes"] == 30 + 105 + 60 + 60
+    assert facts["busy_minutes"] == 120 + 60 + 60
+    assert facts["per_title"][0] == ["Dentist", 2, 120.0]
+    assert facts["all_day"] == 1
+
+
+def test_free_slots_within_the_work_day():
+    facts = analytics.compute_facts(EVENTS, *RANGE)
+    slots = [(s.strftime("%d %H:%M"), e.strftime("%H:%M")) for s, e in facts["free_slots"]]
+
+    assert slots[:3] == [("03 08:00", "09:00"), ("03 11:00", "16:00"), ("03 17:00", "20:00")]
+    assert slots[3:] == [("04 09:00", "20:00")]
+
+
+def test_facts_text_and_intents():
+    text = analytics.facts_text(analytics.compute_facts(EVENTS, *RANGE))
+
+    assert "conflicts: 1: 2025-11-03 09:00–09:30 \"Standup\" overlaps" in text
+    assert "\"Dentist\" 2x 2h00m" in text
+    assert analytics.detect_intents("When am I free tomorrow?") == ["free_slots"]
+    assert analytics.detect_intents("כמה פגישות יש לי?") == ["count"]
+
+
+def test_intents_match_whole_words_only():
+    assert analytics.detect_intents("which account meetings do I have?") == []
+    assert analytics.detect_intents("any freelance calls this week?") == []
+    assert analytics.detect_intents("count my meetings") == ["count"]
+    assert analytics.detect_intents("do I have overlapping meetings?") == ["conflicts"]
@@ -0,0 +1,44 @@
+from datetime import datetime, timedelta, timezone
+
+from calendar_cache import EventCache
+from conftest import FakeCalendarService, make_event
+
+
+def _iso(days, hour):
+    base = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return (base + timedelta(days=days)).replace(hour=hour).isoformat()
+
+
+def test_range_reads_are_served_locally_after_first_sync():
+    service = FakeCalendarService([
+        make_event("a", "Dentist", _iso(1, 9), _iso(1, 10)),
+        make_event("b", "Gym", _iso(3, 18), _iso(3, 19)),
+    ])
+    cache = EventCache(sync_interval=3600)
+
+    first = cache.list_range(service, _iso(0, 0), _iso(7, 0))
+    second = cache.list_range(service, _iso(2, 0), _iso(7, 0))
+
+    assert [ev["id"] for ev in first] == ["a", "b"]
+    assert [ev["id"] for ev in second] == ["b"]
+    assert service.list_calls == 1
+
+
+def test_incremental_sync_applies_inserts_and_deletes():
+    service = FakeCalendarService([make_event("a", "Dentist", _iso(1, 9), _iso(1, 10))])
+    cache = EventCache(sync_interval=3600)
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+
+    service.remove("primary", "a")
+    service.put("primary", make_event("c", "Lunch", _iso(2, 13), _iso(2, 14)))
+    cache.mark_stale()
+
+    assert [ev["id"] for ev in cache.list_range(service, _iso(0, 0), _iso(7, 0))] == ["c"]
+
+
+def test_ranges_older_than_retention_fall_back_to_api():
+    service = FakeCalendarService([make_event("old", "Trip", _iso(-400, 9), _iso(-400, 10))])
+    cache = EventCache(retention_days=30)
+
+    assert cache.list_range(service, _iso(-401, 0), _iso(-399, 0)) is None
+    assert cache.misses == 1
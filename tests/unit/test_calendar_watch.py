@@ -0,0 +1,104 @@
+import time
+from datetime import datetime, timedelta, timezone
+
+import calendar_cache
+from calendar_watch import ChannelStore, WatchRegistry
+from conftest import FakeCalendarService, FakeNotifier, make_event
+
+
+def _iso(days, hour):
+    base = datetime.now(timezone.utc).replace(minute=0, second=0, microsecond=0)
+    return (base + timedelta(days=days)).replace(hour=hour).isoformat()
+
+
+def _setup(tmp_path):
+    service = FakeCalendarService([make_event("a", "Dentist", _iso(1, 9), _iso(1, 10))])
+    registry = WatchRegistry(address="https://agent.test/calendar/notifications",
+                             store=ChannelStore(str(tmp_path / "watch.sqlite3")))
+    cache = calendar_cache.get_event_cache()
+    cache.sync_interval = 0  # without push every read would ask Google for changes
+    return service, registry, cache
+
+
+def test_reads_stay_local_until_a_ping_arrives(tmp_path):
+    service, registry, cache = _setup(tmp_path)
+    registry.register(service)
+    service.notifier = FakeNotifier(registry.handle_notification)
+
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+    assert service.list_calls == 1
+
+    service.put("primary", make_event("b", "Lunch", _iso(2, 13), _iso(2, 14)))
+
+    assert [ev["id"] for ev in cache.list_range(service, _iso(0, 0), _iso(7, 0))] == ["a", "b"]
+    assert service.list_calls == 2  # one incremental sync, no full re-list
+    assert registry.notifications == 1
+
+
+def test_unknown_channels_and_wrong_tokens_are_ignored(tmp_path):
+    service, registry, cache = _setup(tmp_path)
+    channel = registry.register(service)
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+
+    headers = {"X-Goog-Channel-ID": channel.id, "X-Goog-Resource-ID": channel.resource_id,
+               "X-Goog-Channel-Token": "forged", "X-Goog-Resource-State": "exists"}
+    assert registry.handle_notification(headers) == "ignored"
+    assert registry.handle_notification(dict(headers, **{"X-Goog-Channel-ID": "nope"})) == "ignored"
+    assert registry.handle_notification(
+        dict(headers, **{"X-Goog-Channel-Token": channel.token, "X-Goog-Resource-State": "sync"})) == "sync"
+
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+    assert service.list_calls == 1
+
+
+def test_expiring_channels_are_renewed_and_the_old_one_stopped(tmp_path):
+    service, registry, _ = _setup(tmp_path)
+    old = registry.register(service)
+    old.expiration = time.time() + 60
+    registry.store.save(old)
+
+    assert registry.renew_due(lambda user_id: service) == 1
+    assert [c.id for c in registry.channels()] != [old.id]
+    assert list(service.watches) == [registry.channels()[0].id]
+    assert registry.renew_due(lambda user_id: service) == 0
+
+
+def test_any_worker_accepts_the_ping_and_every_worker_sees_the_change(tmp_path):
+    service, worker_a, _ = _setup(tmp_path)
+    worker_b = WatchRegistry(address=worker_a.address, store=ChannelStore(worker_a.store.path))
+    channel = worker_a.register(service)
+    # the cache of a third worker that never registered the channel
+    other = calendar_cache.EventCache(sync_interval=0)
+
+    other.list_range(service, _iso(0, 0), _iso(7, 0))
+    other.list_range(service, _iso(0, 0), _iso(7, 0))
+    assert service.list_calls == 1  # the channel is active for every worker
+
+    service.put("primary", make_event("b", "Lunch", _iso(2, 13), _iso(2, 14)))
+    headers = {"X-Goog-Channel-ID": channel.id, "X-Goog-Resource-ID": channel.resource_id,
+               "X-Goog-Channel-Token": channel.token, "X-Goog-Resource-State": "exists"}
+    assert worker_b.handle_notification(headers) == "changed"
+
+    assert [ev["id"] for ev in other.list_range(service, _iso(0, 0), _iso(7, 0))] == ["a", "b"]
+
+
+def test_an_active_channel_still_polls_on_the_safety_net_interval(tmp_path):
+    service, registry, cache = _setup(tmp_path)
+    registry.register(service)
+    cache.push_sync_interval = 0  # as if the safety-net interval elapsed
+
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+    cache.list_range(service, _iso(0, 0), _iso(7, 0))
+
+    assert service.list_calls == 2
+
+
+def test_a_channel_is_renewed_by_one_worker_only(tmp_path):
+    service, worker_a, _ = _setup(tmp_path)
+    worker_b = WatchRegistry(address=worker_a.address, store=ChannelStore(worker_a.store.path))
+    channel = worker_a.register(service)
+    channel.expiration = time.time() + 60
+    worker_a.store.save(channel)
+
+    assert worker_a.renew_due(lambda user_id: service) + worker_b.renew_due(lambda user_id: service) == 1
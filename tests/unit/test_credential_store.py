@@ -0,0 +1,82 @@
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from credential_store import CredentialStore, FileBackend, SQLiteBackend
+
+
+class FakeCreds:
+    def __init__(self, token, expires_in=3600, refresh_token="r"):
+        self.token = token
+        self.refresh_token = refresh_token
+        self.expiry = datetime.now(timezone.utc) + timedelta(seconds=expires_in)
+
+    def to_json(self):
+        return json.dumps({"token": self.token, "expiry": self.expiry.timestamp()})
+
+
+def _from_json(text):
+    data = json.loads(text)
+    creds = FakeCreds(data["token"])
+    creds.expiry = datetime.fromtimestamp(data["expiry"], timezone.utc)
+    return creds
+
+
+def _slow_refresh(creds):
+    time.sleep(0.05)
+    creds.token = "fresh"
+    creds.expiry = datetime.now(timezone.utc) + timedelta(hours=1)
+
+
+def test_file_backend_keeps_users_apart_and_default_on_the_legacy_path(tmp_path):
+    backend = FileBackend(str(tmp_path), legacy_path=str(tmp_path / "token.json"))
+    store = CredentialStore(backend, _from_json, _slow_refresh)
+    store.put("default", FakeCreds("a"))
+    store.put("noa@example.com", FakeCreds("b"))
+
+    assert json.loads((tmp_path / "token.json").read_text())["token"] == "a"
+    other = CredentialStore(FileBackend(str(tmp_path), legacy_path=str(tmp_path / "token.json")),
+                            _from_json, _slow_refresh)
+    assert other.get("noa@example.com").token == "b"
+    assert other.get("someone-else") is None
+    assert not list(tmp_path.rglob(".tmp-*"))
+
+
+def test_concurrent_requests_refresh_once_per_user(tmp_path):
+    store = CredentialStore(SQLiteBackend(str(tmp_path / "creds.sqlite3")), _from_json, _slow_refresh)
+    store.put("u1", FakeCreds("old", expires_in=-10))
+    store.invalidate()
+
+    tokens = []
+    threads = [threading.Thread(target=lambda: tokens.append(store.get("u1").token)) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert tokens == ["fresh"] * 8
+    assert store.refreshes == 1
+
+
+def test_sqlite_backend_imports_the_legacy_token(tmp_path):
+    legacy = tmp_path / "token.json"
+    legacy.write_text(FakeCreds("legacy").to_json())
+    store = CredentialStore(SQLiteBackend(str(tmp_path / "creds.sqlite3"), legacy_path=str(legacy)),
+                            _from_json, _slow_refresh)
+
+    assert store.get().token == "legacy"
+
+
+def test_a_new_login_of_the_default_account_keeps_the_default_credentials(tmp_path, monkeypatch):
+    import tools
+
+    store = CredentialStore(FileBackend(str(tmp_path), legacy_path=str(tmp_path / "token.json")),
+                            _from_json, _slow_refresh)
+    monkeypatch.setattr(tools, "get_credential_store", lambda: store)
+    monkeypatch.setattr(tools, "_calendar_account", lambda creds: {"a": "noa@example.com"}.get(creds.token, creds.token))
+
+    assert tools.login_user_for(FakeCreds("noa@example.com")) not in ("default", "")
+    store.put("default", FakeCreds("a"))
+    assert tools.login_user_for(FakeCreds("noa@example.com")) == "default"
+    assert tools.login_user_for(FakeCreds("dan@example.com")) != "default"
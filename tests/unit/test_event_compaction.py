@@ -0,0 +1,48 @@
+from datetime import date, timedelta
+
+from event_compaction import compact_events
+from conftest import make_event
+
+
+def test_daily_series_collapses_to_one_line():
+    standup = [
+        make_event(f"s{i}", "Standup", f"{date(2025, 11, 1) + timedelta(days=i)}T09:00:00+02:00",
+                   f"{date(2025, 11, 1) + timedelta(days=i)}T09:15:00+02:00",
+                   recurringEventId="standup", description="Daily sync " * 30)
+        for i in range(30)
+    ]
+    dentist = make_event("d", "Dentist", "2025-11-12T16:00:00+02:00", "2025-11-12T17:00:00+02:00",
+                         location="Tel Aviv")
+
+    text, stats = compact_events(standup + [dentist])
+
+    assert "2025-11-12|16:00|17:00|Dentist|Tel Aviv|" in text
+    assert "Standup|daily|09:00|09:15|30x 2025-11-01..2025-11-30|" in text
+    assert text.count("Standup") == 1
+    assert stats["series"] == 1 and stats["rows"] == 1
+    assert stats["compact_tokens"] * 5 < stats["json_tokens"]
+
+
+def test_moved_instance_and_weekly_pattern():
+    yoga = [
+        make_event(f"y{i}", "Yoga", f"{date(2025, 11, 4) + timedelta(weeks=i)}T18:00:00+02:00",
+                   f"{date(2025, 11, 4) + timedelta(weeks=i)}T19:00:00+02:00", recurringEventId="yoga")
+        for i in range(4)
+    ]
+    yoga[2] = make_event("moved", "Yoga", "2025-11-19T20:00:00+02:00", "2025-11-19T21:00:00+02:00",
+                         recurringEventId="yoga")
+
+    text, _ = compact_events(yoga)
+
+    assert "2025-11-19|20:00|21:00|Yoga||(recurring)" in text
+    assert "Yoga|on 2025-11-04,2025-11-11,2025-11-25|18:00|19:00|3x" in text
+
+
+def test_long_descriptions_are_truncated():
+    ev = make_event("a", "Review", "2025-11-03T10:00:00+02:00", "2025-11-03T11:00:00+02:00",
+                    description="word " * 100)
+
+    text, _ = compact_events([ev], description_limit=20)
+
+    assert text.splitlines()[-1].endswith("…")
+    assert len(text.splitlines()[-1].split("|")[-1]) == 20
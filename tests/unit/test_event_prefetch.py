@@ -0,0 +1,54 @@
+from datetime import date
+
+import event_prefetch
+from conftest import make_event
+
+TODAY = date(2025, 11, 3)
+
+
+def test_guess_range_defaults_to_the_coming_week_and_widens_from_the_prompt():
+    assert event_prefetch.guess_range("what do I have tomorrow?", TODAY) == (
+        "2025-11-03T00:00:00+02:00", "2025-11-11T00:00:00+02:00")
+    assert event_prefetch.guess_range("what did I do last week?", TODAY)[0] == "2025-10-26T00:00:00+03:00"  # still summer time
+    assert event_prefetch.guess_range("what do I have next week", TODAY)[1] == "2025-11-18T00:00:00+02:00"
+    assert event_prefetch.guess_range("meetings on 20/11", TODAY)[1] == "2025-11-21T00:00:00+02:00"
+    # טווח רחוק מדי – ברירת המחדל
+    assert event_prefetch.guess_range("trip on 01/08/2026", TODAY)[1] == "2025-11-11T00:00:00+02:00"
+
+
+def test_events_for_slices_a_covered_range_only():
+    prefetch = event_prefetch.Prefetch("2025-11-03T00:00:00+02:00", "2025-11-11T00:00:00+02:00")
+    events = [
+        make_event("a", "Gym", "2025-11-03T07:00:00+02:00", "2025-11-03T08:00:00+02:00"),
+        make_event("b", "Dentist", "2025-11-04T09:00:00+02:00", "2025-11-04T10:00:00+02:00"),
+    ]
+    assert prefetch.events_for("2025-11-04T00:00:00+02:00", "2025-11-04T23:59:59+02:00") is None  # not fetched yet
+
+    prefetch.run(lambda time_min, time_max: events)
+
+    assert [e["id"] for e in prefetch.events_for("2025-11-04T00:00:00+02:00", "2025-11-04T23:59:59+02:00")] == ["b"]
+    assert prefetch.events_for("2025-11-01T00:00:00+02:00", "2025-11-04T00:00:00+02:00") is None
+    assert prefetch.hits == 1
+
+
+def test_failed_prefetch_is_never_used():
+    prefetch = event_prefetch.Prefetch("2025-11-03T00:00:00+02:00", "2025-11-11T00:00:00+02:00")
+
+    prefetch.run(lambda time_min, time_max: 1 / 0)
+
+    assert prefetch.wait(0) and prefetch.events_for("2025-11-04T00:00:00+02:00", "2025-11-05T00:00:00+02:00") is None
+    assert "division" in prefetch.stats()["error"]
+
+
+def test_run_waits_for_the_prefetch_only_when_it_covers_a_read():
+    import agent
+
+    prefetch = event_prefetch.Prefetch(*event_prefetch.guess_range("what do I have tomorrow?", TODAY))
+    query = lambda start, end: {"command": "query_event", "question": "?",
+                                "filters": {"from": start, "to": end}}
+
+    # naive bounds are wall-clock times in Asia/Jerusalem, like in execute_actions
+    assert agent.prefetch_covers_a_read(prefetch, [query("2025-11-04T00:00:00", "2025-11-04T23:59:59")])
+    assert not agent.prefetch_covers_a_read(prefetch, [query("2026-03-01T00:00:00", "2026-03-02T00:00:00")])
+    assert not agent.prefetch_covers_a_read(prefetch, [query("2025-11-03T00:00:00", "2025-12-31T00:00:00")])
+    assert not agent.prefetch_covers_a_read(prefetch, [{"command": "general_answer", "answer": "hi"}])
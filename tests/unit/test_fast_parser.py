@@ -0,0 +1,63 @@
+from datetime import date
+
+import pytest
+
+import fast_parser
+
+MONDAY = date(2025, 11, 3)
+
+
+def _span(plan):
+    event = plan["events"][0]
+    return event["summary"], event["start"]["dateTime"], event["end"]["dateTime"]
+
+
+@pytest.mark.parametrize("prompt, expected", [
+    ("lunch tomorrow", ("Lunch", "2025-11-04T13:00:00", "2025-11-04T14:00:00")),
+    ("schedule breakfast today", ("Breakfast", "2025-11-03T08:00:00", "2025-11-03T09:00:00")),
+    ("meeting on 05/11 at 14:00 for 30 minutes", ("Meeting", "2025-11-05T14:00:00", "2025-11-05T14:30:00")),
+    ("Dentist on friday at 4pm", ("Dentist", "2025-11-07T16:00:00", "2025-11-07T17:00:00")),
+    ("yoga tomorrow 18:00-19:30", ("Yoga", "2025-11-04T18:00:00", "2025-11-04T19:30:00")),
+    ("dinner tomorrow at 8 in the evening", ("Dinner", "2025-11-04T20:00:00", "2025-11-04T21:00:00")),
+    ("run tomorrow at 7 in the morning", ("Run", "2025-11-04T07:00:00", "2025-11-04T08:00:00")),
+    ("movie tomorrow at 21", ("Movie", "2025-11-04T21:00:00", "2025-11-04T22:00:00")),
+    ("lunch tomorrow at 1pm to 3pm", ("Lunch", "2025-11-04T13:00:00", "2025-11-04T15:00:00")),
+    ("meeting tomorrow at 14:00-15:00", ("Meeting", "2025-11-04T14:00:00", "2025-11-04T15:00:00")),
+    ("standup tomorrow at 9:30am to 10am", ("Standup", "2025-11-04T09:30:00", "2025-11-04T10:00:00")),
+    ("gym tomorrow from 7pm to 8pm", ("Gym", "2025-11-04T19:00:00", "2025-11-04T20:00:00")),
+])
+def test_simple_add_prompts(prompt, expected):
+    plan = fast_parser.parse(prompt, MONDAY)
+
+    assert plan["command"] == "add_event"
+    assert _span(plan) == expected
+    assert plan["events"][0]["start"]["timeZone"] == "Asia/Jerusalem"
+
+
+@pytest.mark.parametrize("prompt, start, end", [
+    ("what do I have today", "2025-11-03T00:00:00", "2025-11-03T23:59:59"),
+    ("What do I have tomorrow?", "2025-11-04T00:00:00", "2025-11-04T23:59:59"),
+    ("what's on my calendar this week", "2025-11-03T00:00:00", "2025-11-08T23:59:59"),
+    ("מה יש לי מחר", "2025-11-04T00:00:00", "2025-11-04T23:59:59"),
+])
+def test_simple_queries(prompt, start, end):
+    plan = fast_parser.parse(prompt, MONDAY)
+
+    assert plan == {"command": "query_event", "question": prompt, "filters": {"from": start, "to": end}}
+
+
+@pytest.mark.parametrize("prompt", [
+    "lunch and dinner tomorrow",
+    "delete lunch tomorrow",
+    "call mom at 2 tomorrow",
+    "dinner tomorrow at 8",
+    "movie tomorrow at 9",
+    "meeting tomorrow at 12",
+    "party tomorrow from 8 to 11",
+    "meeting tomorrow evening",
+    "gym every monday",
+    "dinner",
+    "how do you say friend in spanish?",
+])
+def test_falls_back_when_not_confident(prompt):
+    assert fast_parser.parse(prompt, MONDAY) is None
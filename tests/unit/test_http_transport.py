@@ -0,0 +1,35 @@
+import httpx
+from googleapiclient.discovery import build
+
+from http_transport import HttpxHttp
+
+
+def test_calendar_requests_go_through_the_shared_httpx_client():
+    seen = []
+
+    def handler(request):
+        seen.append((request.method, request.url.path, request.url.params.get("timeMin")))
+        return httpx.Response(200, json={"items": [{"id": "a", "summary": "Gym"}]})
+
+    client = httpx.Client(transport=httpx.MockTransport(handler))
+    service = build("calendar", "v3", http=HttpxHttp(client), static_discovery=True)
+
+    result = service.events().list(calendarId="primary", timeMin="2025-11-01T00:00:00Z").execute()
+
+    assert result["items"][0]["summary"] == "Gym"
+    assert seen == [("GET", "/calendar/v3/calendars/primary/events", "2025-11-01T00:00:00Z")]
+
+
+def test_error_statuses_surface_as_http_errors():
+    from googleapiclient.errors import HttpError
+
+    client = httpx.Client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(404, json={"error": {"message": "Not Found"}})))
+    service = build("calendar", "v3", http=HttpxHttp(client), static_discovery=True)
+
+    try:
+        service.events().delete(calendarId="primary", eventId="missing").execute()
+    except HttpError as e:
+        assert e.resp.status == 404
+    else:
+        raise AssertionError("expected HttpError")
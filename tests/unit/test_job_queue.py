@@ -0,0 +1,96 @@
+import job_queue
+from action_results import ActionResult
+
+
+def _runner(calls, fail_on=None):
+    def run(actions, user_id, collector):
+        calls.append([a["title"] for a in actions])
+        for i, action in enumerate(actions):
+            ok = action["title"] != fail_on
+            result = ActionResult(command="add", ok=ok, error=None if ok else "boom")
+            result.log(f"{action['title']}\n")
+            collector.add(i, result)
+        if fail_on is not None:
+            raise RuntimeError("boom")
+    return run
+
+
+def _actions(*titles):
+    return [{"command": "add", "title": t} for t in titles]
+
+
+def test_job_runs_and_reports_progress_per_action(tmp_path):
+    calls = []
+    queue = job_queue.JobQueue(_runner(calls), store=job_queue.JobStore(str(tmp_path / "jobs.sqlite3")))
+    job_id = queue.store.create(_actions("a", "b", "c"), "dana")
+
+    assert queue.get(job_id)["status"] == job_queue.QUEUED
+    assert queue.run_next() is True
+    assert queue.run_next() is False
+
+    job = queue.get(job_id)
+    assert job["status"] == job_queue.SUCCEEDED and job["user_id"] == "dana"
+    assert job["total"] == 3 and job["completed"] == 3 and job["failed"] == 0
+    assert [r["index"] for r in job["results"]] == [0, 1, 2]
+
+
+def test_failed_job_keeps_its_results(tmp_path):
+    queue = job_queue.JobQueue(_runner([], fail_on="b"), store=job_queue.JobStore(str(tmp_path / "jobs.sqlite3")))
+    job_id = queue.store.create(_actions("a", "b"), "default")
+
+    queue.run_next()
+
+    job = queue.get(job_id)
+    assert job["status"] == job_queue.FAILED and job["error"] == "boom"
+    assert job["completed"] == 2 and job["failed"] == 1
+
+
+def test_abandoned_job_resumes_after_the_finished_actions(tmp_path):
+    path = str(tmp_path / "jobs.sqlite3")
+    store = job_queue.JobStore(path)
+    job_id = store.create(_actions("a", "b", "c"), "default")
+    # תהליך קודם התחיל את העבודה, סיים את הפעולה הראשונה ומת
+    assert store.claim() is not None
+    store.save_result(job_id, 0, {"ok": True, "index": 0})
+    store.heartbeat([])
+
+    calls = []
+    queue = job_queue.JobQueue(_runner(calls), store=job_queue.JobStore(path), lease=0)
+    assert queue.run_next() is True
+
+    assert calls == [["b", "c"]]
+    job = queue.get(job_id)
+    assert job["status"] == job_queue.SUCCEEDED
+    assert [r["index"] for r in job["results"]] == [0, 1, 2]
+
+
+def test_running_job_with_a_fresh_heartbeat_is_not_claimed(tmp_path):
+    store = job_queue.JobStore(str(tmp_path / "jobs.sqlite3"))
+    store.create(_actions("a"), "default")
+
+    assert store.claim() is not None
+    assert store.claim(lease=60) is None
+
+
+def test_resumed_inserts_do_not_create_duplicates(tmp_path):
+    import agent
+    from conftest import FakeCalendarService
+
+    service = FakeCalendarService()
+    path = str(tmp_path / "jobs.sqlite3")
+    store = job_queue.JobStore(path)
+    events = [{"summary": f"Lesson {i}", "start": {"dateTime": f"2025-11-0{i}T09:00:00+02:00"},
+               "end": {"dateTime": f"2025-11-0{i}T10:00:00+02:00"}} for i in (1, 2)]
+    job_id = store.create([{"command": "add_event", "events": events}], "default")
+    # תהליך קודם הוסיף את האירועים ומת לפני ששמר את התוצאה
+    job = store.claim()
+    agent.add_event(service, job["actions"][0]["events"])
+    store.heartbeat([])
+
+    run = lambda actions, user_id, collector: agent.execute_actions(actions, service, collector=collector)
+    queue = job_queue.JobQueue(run, store=job_queue.JobStore(path), lease=0)
+    assert queue.run_next() is True
+
+    job = queue.get(job_id)
+    assert job["status"] == job_queue.SUCCEEDED and job["failed"] == 0
+    assert sorted(ev["summary"] for ev in service.store["primary"].values()) == ["Lesson 1", "Lesson 2"]
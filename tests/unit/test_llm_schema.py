@@ -0,0 +1,51 @@
+import pytest
+
+import llm_schema
+
+
+def test_plan_schema_lists_every_command():
+    commands = [s["properties"]["command"]["enum"][0] for s in llm_schema.ACTION_SCHEMA["anyOf"]]
+    assert commands == ["add_event", "delete_event", "query_event", "general_answer"]
+    assert llm_schema.PLAN_RESPONSE_FORMAT["type"] == "json_schema"
+
+
+@pytest.mark.parametrize("content", [
+    '```json\n{"answer": "hi"}\n```',
+    '{"answer": "hi",}',
+    'Sure! {"answer": "hi"} hope this helps',
+    '{"answer": "hi"',
+])
+def test_parse_json_lenient_repairs_common_mistakes(content):
+    assert llm_schema.parse_json_lenient(content) == {"answer": "hi"}
+
+
+def test_parse_json_lenient_gives_up_on_prose():
+    with pytest.raises(llm_schema.PlanValidationError):
+        llm_schema.parse_json_lenient("I could not understand the request")
+
+
+def test_validate_plan_repairs_actions():
+    plan = llm_schema.validate_plan({
+        "command": "add",
+        "events": {"title": "Gym", "start": {"dateTime": "2025-11-03T09:00:00"}},
+    })
+    event = plan["actions"][0]["events"][0]
+    assert plan["actions"][0]["command"] == "add_event"
+    assert event["summary"] == "Gym"
+    assert event["start"]["timeZone"] == "Asia/Jerusalem"
+    assert event["end"]["dateTime"] == "2025-11-03T10:00:00"
+
+
+def test_validate_plan_reports_what_it_cannot_repair():
+    plan = llm_schema.validate_plan({"actions": [
+        {"command": "delete_event", "filters": {"from": "2025-11-03T00:00:00", "to": "2025-11-03T23:59:59"}},
+        {"command": "query_event", "question": "what's on?",
+         "filters": {"start": "2025-11-03T00:00:00", "end": "2025-11-03T23:59:59"}},
+    ]})
+    assert [a["command"] for a in plan["actions"]] == [llm_schema.INVALID_ACTION, "query_event"]
+    assert plan["actions"][0]["index"] == 0
+    assert plan["actions"][0]["reason"] == "delete_event without a title to match"
+    assert plan["actions"][1]["filters"]["from"] == "2025-11-03T00:00:00"
+
+    with pytest.raises(llm_schema.PlanValidationError):
+        llm_schema.validate_plan({"actions": [{"command": "fly_to_moon"}]})
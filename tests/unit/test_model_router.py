@@ -0,0 +1,43 @@
+import model_router
+
+
+def test_simple_prompts_go_to_the_small_model():
+    for prompt in ["lunch with Noa tomorrow at 13:00", "מה יש לי מחר?", "what's the capital of France"]:
+        decision = model_router.route_plan(prompt)
+        assert decision.tier == model_router.SMALL, prompt
+        assert decision.model == model_router.SMALL_MODEL
+
+
+def test_complex_prompts_go_to_the_large_model():
+    assert model_router.route_plan("add gym on sunday and then delete the dentist").reason == "multiple actions"
+    assert model_router.route_plan("תוסיף פגישה מחר וגם תמחק את הספורט").tier == model_router.LARGE
+    assert model_router.route_plan("yoga every monday until june").reason == "recurrence or condition"
+    assert model_router.route_plan("x" * 500).reason == "long prompt"
+
+
+def test_query_routing_by_size_and_question():
+    assert model_router.route_query("what do I have tomorrow?", 3).tier == model_router.SMALL
+    assert model_router.route_query("what do I have this month?", 400).tier == model_router.LARGE
+    assert model_router.route_query("compare my meetings this week", 10).tier == model_router.LARGE
+    assert model_router.route_query("any conflicts?", 400, ["conflicts"]).tier == model_router.SMALL
+
+
+def test_routing_disabled_always_uses_the_large_model(monkeypatch):
+    monkeypatch.setattr(model_router, "MODEL_ROUTING", False)
+
+    assert model_router.route_plan("lunch tomorrow").model == model_router.LARGE_MODEL
+
+
+def test_escalation_and_latency_are_recorded():
+    stats = model_router.RoutingStats()
+    small = model_router.route_plan("lunch tomorrow")
+    large = model_router.escalate(small, "invalid plan")
+
+    stats.record(small, 0.2, ok=False)
+    stats.record(large, 0.9)
+
+    assert model_router.escalate(large, "again") is None
+    snapshot = stats.stats()
+    assert snapshot["tiers"]["small"] == {"calls": 1, "errors": 1, "avg_ms": 200, "max_ms": 200}
+    assert snapshot["tiers"]["large"]["avg_ms"] == 900
+    assert snapshot["recent"][-1]["reason"] == "escalated: invalid plan"
@@ -0,0 +1,34 @@
+from plan_cache import MemoryBackend, PlanCache, SQLiteBackend
+
+PLAN = {"command": "query_event", "question": "What do I have tomorrow?",
+        "filters": {"from": "2025-11-02T00:00:00", "to": "2025-11-02T23:59:59"}}
+
+
+def test_near_identical_prompts_share_an_entry_for_the_same_day():
+    cache = PlanCache(MemoryBackend())
+    cache.set("What do I have tomorrow?", "2025-11-01", PLAN)
+
+    assert cache.get("  what do i have   TOMORROW ", "2025-11-01") == PLAN
+    assert cache.get("what do I have tomorrow?", "2025-11-02") is None
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_memory_backend_evicts_lru_and_expired():
+    backend = MemoryBackend(max_entries=2)
+    backend.set("a", "1", ttl=60)
+    backend.set("b", "2", ttl=60)
+    backend.get("a")
+    backend.set("c", "3", ttl=60)
+    assert backend.get("a") == "1"
+    assert backend.get("b") is None
+
+    backend.set("d", "4", ttl=-1)
+    assert backend.get("d") is None
+
+
+def test_sqlite_backend_is_shared_between_instances(tmp_path):
+    path = str(tmp_path / "plans.sqlite3")
+    PlanCache(SQLiteBackend(path)).set("lunch tomorrow", "2025-11-01", PLAN)
+
+    other = PlanCache(SQLiteBackend(path))
+    assert other.get("Lunch tomorrow.", "2025-11-01") == PLAN
@@ -0,0 +1,36 @@
+import agent
+import prompt_builder
+
+
+class _Obj:
+    def __init__(self, **kwargs):
+        self.__dict__.update(kwargs)
+
+
+def test_planner_prefix_is_identical_across_days(monkeypatch):
+    monkeypatch.setattr(agent, "get_today", lambda: "2025-11-03")
+    monday = agent._plan_request("lunch tomorrow")["messages"]
+    monkeypatch.setattr(agent, "get_today", lambda: "2025-11-04")
+    tuesday = agent._plan_request("lunch tomorrow")["messages"]
+
+    assert monday[0] == tuesday[0]
+    assert "2025-11-03 (Monday)" not in monday[0]["content"] and "{" in monday[0]["content"]
+    assert "2025-11-03 (Monday)" in monday[1]["content"] and "Asia/Jerusalem" in monday[1]["content"]
+    assert monday[-1] == {"role": "user", "content": "lunch tomorrow"}
+
+
+def test_stream_requests_ask_for_usage():
+    assert agent._plan_request("x", stream=True)["stream_options"] == {"include_usage": True}
+
+
+def test_record_usage_accumulates_prompt_cached_and_completion_tokens():
+    prompt_builder.get_usage().reset()
+    usage = _Obj(prompt_tokens=2000, completion_tokens=50, prompt_tokens_details=_Obj(cached_tokens=1536))
+
+    assert prompt_builder.record_usage("plan", _Obj(usage=usage))["cached_tokens"] == 1536
+    prompt_builder.record_usage("plan", _Obj(usage=_Obj(prompt_tokens=2000, completion_tokens=30)))
+    assert prompt_builder.record_usage("plan", _Obj(usage=None)) is None
+
+    assert prompt_builder.get_usage().stats()["plan"] == {
+        "calls": 2, "prompt_tokens": 4000, "cached_tokens": 1536, "completion_tokens": 80, "cache_hit_ratio": 0.384,
+    }
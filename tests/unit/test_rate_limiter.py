@@ -0,0 +1,85 @@
+import httplib2
+import pytest
+from googleapiclient.errors import HttpError
+
+from conftest import FakeCalendarService
+from rate_limiter import CallScheduler, TokenBucket, is_retryable
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+def _http_error(status, reason=""):
+    content = ('{"error": {"errors": [{"reason": "%s"}]}}' % reason).encode()
+    return HttpError(httplib2.Response({"status": status}), content)
+
+
+class Flaky:
+    """Request that fails with the given errors before succeeding (works alone and inside FakeBatch)."""
+
+    def __init__(self, errors, value="ok"):
+        self.errors = list(errors)
+        self.value = value
+        self.calls = 0
+
+    def _fn(self):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return self.value
+
+    def execute(self):
+        return self._fn()
+
+
+def test_token_bucket_paces_a_burst_to_the_rate():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=10, capacity=10, clock=clock, sleep=clock.sleep)
+
+    waits = [bucket.acquire() for _ in range(15)]
+
+    assert sum(waits[:10]) == 0
+    assert clock.now == pytest.approx(0.5)
+
+
+def test_retryable_errors():
+    assert is_retryable(_http_error(429))
+    assert is_retryable(_http_error(503))
+    assert is_retryable(_http_error(403, "userRateLimitExceeded"))
+    assert not is_retryable(_http_error(403, "forbidden"))
+    assert not is_retryable(_http_error(404))
+
+
+def test_execute_backs_off_on_rate_limits_and_gives_up_on_other_errors():
+    clock = FakeClock()
+    scheduler = CallScheduler(clock=clock, sleep=clock.sleep)
+
+    request = Flaky([_http_error(429), _http_error(403, "rateLimitExceeded")])
+    assert scheduler.execute(request) == "ok"
+    assert request.calls == 3 and scheduler.stats()["retries"] == 2
+
+    with pytest.raises(HttpError):
+        scheduler.execute(Flaky([_http_error(404)]))
+    assert scheduler.stats()["failures"] == 1
+
+
+def test_batched_requests_resend_only_the_throttled_ones():
+    clock = FakeClock()
+    scheduler = CallScheduler(user_qps=5, burst_seconds=1, clock=clock, sleep=clock.sleep)
+    service = FakeCalendarService()
+    requests = [Flaky([_http_error(403, "rateLimitExceeded")] if i % 3 == 0 else [], value=i) for i in range(12)]
+
+    results = scheduler.execute_batched(service, requests, batch_size=5)
+
+    assert [r for r, _ in results] == list(range(12))
+    assert all(e is None for _, e in results)
+    assert [r.calls for r in requests] == [2 if i % 3 == 0 else 1 for i in range(12)]
+    assert scheduler.stats()["throttled_seconds"] > 0  # 16 calls at 5/s with a burst of 5
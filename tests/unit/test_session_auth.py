@@ -0,0 +1,46 @@
+import pytest
+
+import session_auth
+
+
+def test_session_tokens_are_signed_and_expire():
+    token = session_auth.issue_session("alice")
+    assert session_auth.verify_session(token) == "alice"
+
+    user, expires, signature = token.split(".")
+    other = session_auth.issue_session("bob").split(".")[0]
+    with pytest.raises(session_auth.AuthError):
+        session_auth.verify_session(f"{other}.{expires}.{signature}")
+    with pytest.raises(session_auth.AuthError):
+        session_auth.verify_session(session_auth.issue_session("alice", ttl=-1))
+    with pytest.raises(session_auth.AuthError):
+        session_auth.verify_session("not a token")
+
+
+def test_oauth_state_is_single_use_and_shared_across_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_a, worker_b = session_auth.OAuthStateStore(path), session_auth.OAuthStateStore(path)
+
+    state = worker_a.issue("alice")
+    assert worker_b.consume(state) == "alice"
+    with pytest.raises(session_auth.AuthError):
+        worker_a.consume(state)
+
+    expired = worker_a.issue("alice", ttl=-1)
+    with pytest.raises(session_auth.AuthError):
+        worker_b.consume(expired)
+
+
+def test_sessions_required_without_a_secret_fail_at_startup(monkeypatch):
+    monkeypatch.setattr(session_auth, "REQUIRE_SESSION", True)
+    monkeypatch.setattr(session_auth, "SESSION_SECRET", "")
+    with pytest.raises(RuntimeError):
+        session_auth.check_config()
+    monkeypatch.setattr(session_auth, "SESSION_SECRET", "s3cret")
+    session_auth.check_config()
+
+
+def test_the_fallback_secret_is_shared_across_workers(tmp_path):
+    path = str(tmp_path / "sessions.sqlite3")
+    worker_a, worker_b = session_auth.OAuthStateStore(path), session_auth.OAuthStateStore(path)
+    assert worker_a.shared_secret() == worker_b.shared_secret() == worker_a.shared_secret()
@@ -0,0 +1,49 @@
+import pytest
+
+import title_matcher
+from conftest import make_event
+
+
+@pytest.mark.parametrize("text, title", [
+    ("dentist", "Dentist appointment"),
+    ("DENTIST!", "dentist"),
+    ("דנטיסט", "Dentist"),
+    ("zumba", "זומבה"),
+    ("meting", "Team meeting"),
+    ("café", "Cafe with Noa"),
+    ("team meet", "Weekly team meeting"),
+])
+def test_confident_matches(text, title):
+    assert title_matcher.score(text, title) >= title_matcher.CONFIDENT_SCORE
+
+
+@pytest.mark.parametrize("text, title", [
+    ("lunch", "Launch party"),
+    ("spam", "Spanish lesson"),
+    ("doctor", "רופא"),
+    ("run", "Brunch"),
+    ("art", "Party"),
+    ("art", "Martin"),
+    ("test", "Contest"),
+    ("call", "Recall"),
+    ("all", "Football"),
+    ("mom", "Moment"),
+])
+def test_non_matches(text, title):
+    assert title_matcher.score(text, title) < title_matcher.CONFIDENT_SCORE
+
+
+def test_match_events_returns_none_when_nothing_is_confident():
+    events = [make_event("a", "Gym", "2025-11-03T09:00:00+02:00", "2025-11-03T10:00:00+02:00")]
+
+    assert title_matcher.match_events("gym", events) == events
+    assert title_matcher.match_events("all", events) == events
+    assert title_matcher.match_events("physio", events) is None
+
+
+def test_empty_text_does_not_match_every_event():
+    events = [make_event("a", "Gym", "2025-11-03T09:00:00+02:00", "2025-11-03T10:00:00+02:00")]
+
+    assert title_matcher.match_events("", events) is None
+    assert title_matcher.match_events("  ", events) is None
+    assert title_matcher.match_events("*", events) == events
@@ -0,0 +1,99 @@
+# title_matcher.py
+import difflib
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+# התאמה מקומית בין טקסט המחיקה (filters.text) לכותרות האירועים – בלי LLM.
+# שלבים: מילים שלמות / תחילת מילה אחרי נרמול (case-folding, הסרת ניקוד/סימנים), התאמה מקורבת (difflib),
+# ו"שלד עיצורים" שמשווה בין תעתיק עברי ללטיני (דנטיסט ~ dentist).
+
+CONFIDENT_SCORE = 0.85
+# מילה חלקית נחשבת ודאית רק מהאורך הזה, ורק עם סיומת קצרה (s / ed / ing)
+MIN_PREFIX_CHARS = 4
+MAX_SUFFIX_CHARS = 3
+# טקסטים שמשמעותם "כל האירועים בטווח" ("clear my whole week")
+MATCH_ALL = {"*", "all", "everything", "all events", "any", "הכל", "הכול", "כל האירועים", "כל הפגישות"}
+
+_PUNCT_RE = re.compile(r"[^\w\s]", re.UNICODE)
+_WS_RE = re.compile(r"\s+")
+
+_HEBREW_TO_LATIN = {
+    "א": "", "ב": "b", "ג": "g", "ד": "d", "ה": "", "ו": "", "ז": "z", "ח": "k", "ט": "t",
+    "י": "", "כ": "k", "ך": "k", "ל": "l", "מ": "m", "ם": "m", "נ": "n", "ן": "n", "ס": "s",
+    "ע": "", "פ": "p", "ף": "p", "צ": "s", "ץ": "s", "ק": "k", "ר": "r", "ש": "s", "ת": "t",
+}
+_LATIN_DIGRAPHS = [("ch", "k"), ("sh", "s"), ("ph", "p"), ("th", "t"), ("tz", "s"), ("ts", "s"), ("ck", "k")]
+_LATIN_LETTERS = str.maketrans({"c": "k", "q": "k", "f": "p", "v": "b", "w": "b", "j": "g", "x": "ks"})
+_DROPPED = set("aeiouyh")
+
+
+def _is_hebrew(text: str) -> bool:
+    return any("\u0590" <= ch <= "\u05ff" for ch in text)
+
+
+def normalize(text: str) -> str:
+    """Case-fold, strip diacritics/niqqud and punctuation, collapse whitespace."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    stripped = "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+    return _WS_RE.sub(" ", _PUNCT_RE.sub(" ", stripped.casefold())).strip()
+
+
+def skeleton(text: str) -> str:
+    """Consonant skeleton shared by Hebrew and Latin spellings of the same word."""
+    text = normalize(text)
+    for digraph, repl in _LATIN_DIGRAPHS:
+        text = text.replace(digraph, repl)
+    text = text.translate(_LATIN_LETTERS)
+    text = "".join(_HEBREW_TO_LATIN.get(ch, ch) for ch in text)
+    out = []
+    for ch in text:
+        if ch in _DROPPED or not ch.isalpha():
+            continue
+        if not out or out[-1] != ch:
+            out.append(ch)
+    return "".join(out)
+
+
+def score(query: str, title: str) -> float:
+    """How well the (normalized) query matches the title, 0..1."""
+    q, t = normalize(query), normalize(title)
+    if not q or not t:
+        return 0.0
+    q_tokens, t_tokens = q.split(), t.split()
+    n = len(q_tokens)
+    # ודאות רק כשהמילים של הטקסט הן מילים שלמות בכותרת, או שהאחרונה היא תחילת מילה עם סיומת
+    # קצרה ("meet" ~ "Meeting"); תת-מחרוזת באמצע מילה ("run" ב-"Brunch", "art" ב-"Party")
+    # או מילה אחרת שרק מתחילה כך ("mom" / "Moment") עוברת לאישור ה-LLM
+    for i in range(len(t_tokens) - n + 1):
+        window, last = t_tokens[i:i + n], q_tokens[-1]
+        if window[:-1] == q_tokens[:-1] and (window[-1] == last or (
+                len(last) >= MIN_PREFIX_CHARS and window[-1].startswith(last)
+                and len(window[-1]) - len(last) <= MAX_SUFFIX_CHARS)):
+            return 1.0
+
+    windows = [" ".join(t_tokens[i:i + n]) for i in range(max(1, len(t_tokens) - n + 1))]
+    best = max(difflib.SequenceMatcher(None, q, w).ratio() for w in windows)
+    # typo tolerance only for longer queries – "lunch" must not delete "Launch party"
+    if len(q) < 6 or best < 0.9:
+        best *= 0.9
+
+    # transliteration: compare consonant skeletons only across scripts (Hebrew vs Latin)
+    q_skel = skeleton(q)
+    if q_skel and any(_is_hebrew(q) != _is_hebrew(w) and skeleton(w) == q_skel for w in windows):
+        best = max(best, 0.9 if len(q_skel) >= 3 else 0.7)
+    if q in t:
+        best = min(best, CONFIDENT_SCORE - 0.05)
+    return best
+
+
+def match_events(text: str, events: List[Dict[str, Any]],
+                 threshold: float = CONFIDENT_SCORE) -> Optional[List[Dict[str, Any]]]:
+    """
+    Events whose title confidently matches the text, or None when nothing matches confidently
+    (the caller should then escalate to the LLM).
+    """
+    if (text or "").strip() == "*" or normalize(text) in MATCH_ALL:
+        return list(events)
+    matched = [ev for ev in events if score(text, ev.get("summary") or "") >= threshold]
+    return matched or None
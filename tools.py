@@ -2,14 +2,16 @@
 import os
 import json
 import tempfile
-from typing import Optional
+import threading
+import uuid
+from typing import TYPE_CHECKING, Optional
 
-from google_auth_oauthlib.flow import Flow, InstalledAppFlow
-from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from credential_store import CREDENTIAL_STORE, DEFAULT_USER, CredentialStore, FileBackend, SQLiteBackend
 
-# אם תרצה רענון אוטומטי לטוקן:
-from google.auth.transport.requests import Request
+# ספריות Google (googleapiclient, oauthlib, google-auth) כבדות לייבוא – נטענות רק בשימוש הראשון,
+# כדי שהפעלה קרה של השרת (scale-to-zero) לא תשלם עליהן מראש
+if TYPE_CHECKING:
+    from google.oauth2.credentials import Credentials
 
 SCOPES = ["https://www.googleapis.com/auth/calendar"]
 
@@ -42,86 +44,157 @@ def _client_secrets_file_from_env() -> str:
 # -----------------------------
 # שלב 1: יצירת קישור OAuth (לשרת)
 # -----------------------------
-def get_auth_url() -> str:
+def get_auth_url(state: str) -> str:
     redirect_uri = os.getenv("GOOGLE_REDIRECT_URI")
     if not redirect_uri:
         raise ValueError("Missing GOOGLE_REDIRECT_URI")
 
     client_file = _client_secrets_file_from_env()
+    from google_auth_oauthlib.flow import Flow
     flow = Flow.from_client_secrets_file(client_file, scopes=SCOPES, redirect_uri=redirect_uri)
     auth_url, _ = flow.authorization_url(
         access_type="offline",
         include_granted_scopes="true",
         prompt="consent",
+        state=state,  # nonce חתום (session_auth.py) – חוזר ב-/oauth2callback כדי לדעת של מי הטוקן
     )
     return auth_url
 
 
 # -----------------------------
-# שלב 2: המרת code לטוקן ושמירה ל-TOKEN_PATH (לשרת)
+# שלב 2: המרת code לטוקן ושמירה במאגר האישורים (לשרת)
 # -----------------------------
-def exchange_code_for_token(code: str) -> str:
-    os.makedirs(TOKEN_DIR, exist_ok=True)
-
+def exchange_code_for_token(code: str, user_id: str = DEFAULT_USER) -> str:
+    """
+    שומר את האישורים של ההתחברות ומחזיר את המשתמש שהם שייכים לו.
+    user_id ריק = התחברות חדשה בלי session: המשתמש נקבע לפי חשבון הגוגל (ראה login_user_for).
+    """
     redirect_uri = os.getenv("GOOGLE_REDIRECT_URI")
     if not redirect_uri:
         raise ValueError("Missing GOOGLE_REDIRECT_URI")
 
     client_file = _client_secrets_file_from_env()
+    from google_auth_oauthlib.flow import Flow
     flow = Flow.from_client_secrets_file(client_file, scopes=SCOPES, redirect_uri=redirect_uri)
     flow.fetch_token(code=code)
 
-    creds = flow.credentials
-    with open(TOKEN_PATH, "w", encoding="utf-8") as f:
-        f.write(creds.to_json())
-    return TOKEN_PATH
+    if not user_id:
+        user_id = login_user_for(flow.credentials)
+    get_credential_store().put(user_id, flow.credentials)
+    return user_id
+
+
+def _calendar_account(creds) -> str:
+    """מזהה חשבון הגוגל של האישורים – ה-id של היומן הראשי שלו (כתובת המייל)."""
+    from googleapiclient.discovery import build
+    service = build("calendar", "v3", credentials=creds, cache_discovery=False)
+    return service.calendarList().get(calendarId="primary").execute()["id"]
+
+
+def login_user_for(creds) -> str:
+    """
+    המשתמש שמקבל התחברות חדשה בלי session. אם זה אותו חשבון גוגל כמו האישורים של המשתמש default
+    (שנשמרו לפני שהיו sessions), ההתחברות ממשיכה את default ולא משאירה את האישורים שלו יתומים;
+    אחרת נוצר משתמש חדש.
+    """
+    try:
+        existing = get_credential_store().get(DEFAULT_USER)
+        if existing is not None and _calendar_account(existing) == _calendar_account(creds):
+            return DEFAULT_USER
+    except Exception as e:
+        # האישורים הישנים בוטלו / לא ניתן לבדוק – משתמש חדש, כמו בלי default
+        print("LOGIN USER CHECK ERROR:", e)
+    return uuid.uuid4().hex
 
 
 # -----------------------------
-# טעינת אישורים קיימים (שרת)
+# מאגר אישורים ו-services משותף לתהליך
 # -----------------------------
-def _load_creds_from_token_file() -> Optional[Credentials]:
-    if os.path.exists(TOKEN_PATH):
-        with open(TOKEN_PATH, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        return Credentials.from_authorized_user_info(data, SCOPES)
-    return None
+# האישורים של כל משתמש נשמרים בזיכרון לפני האחסון הקבוע (credential_store.py):
+# קובץ לכל משתמש (המשתמש "default" נשאר ב-TOKEN_PATH) או SQLite, לפי CREDENTIAL_STORE.
+# לכל thread יש service משלו לכל משתמש, שנבנה מחדש רק כשאובייקט האישורים מתחלף; החיבורים עצמם
+# מגיעים ממאגר httpx משותף לכל התהליך (http_transport.py).
+CREDENTIAL_DB_PATH = os.getenv("CREDENTIAL_DB_PATH", os.path.join(TOKEN_DIR, "credentials.sqlite3"))
+
+_store_lock = threading.Lock()
+_credential_store: Optional[CredentialStore] = None
+_service_local = threading.local()
+
+
+def _creds_from_json(token_json: str) -> "Credentials":
+    from google.oauth2.credentials import Credentials
+    return Credentials.from_authorized_user_info(json.loads(token_json), SCOPES)
+
+
+def _refresh_creds(creds: "Credentials") -> None:
+    from google.auth.transport.requests import Request
+    creds.refresh(Request())
+
+
+def get_credential_store() -> CredentialStore:
+    global _credential_store
+    with _store_lock:
+        if _credential_store is None:
+            if CREDENTIAL_STORE == "sqlite":
+                backend = SQLiteBackend(CREDENTIAL_DB_PATH, legacy_path=TOKEN_PATH)
+            else:
+                backend = FileBackend(TOKEN_DIR, legacy_path=TOKEN_PATH)
+            _credential_store = CredentialStore(backend, _creds_from_json, _refresh_creds)
+        return _credential_store
+
+
+def invalidate_service_cache(user_id: Optional[str] = None) -> None:
+    """מכריח טעינה מחדש של האישורים (של משתמש אחד או של כולם) ובניית service חדש בקריאה הבאה."""
+    get_credential_store().invalidate(user_id)
+
+
+def _get_credentials(user_id: str = DEFAULT_USER) -> "Credentials":
+    """
+    בשרת (Render): האישורים של המשתמש מהמאגר (נוצרו ע"י /oauth2callback).
+    בלוקאל (רק אם LOCAL_DEV=1, ורק למשתמש default): מבצע InstalledAppFlow מקובץ credentials.json ושומר במאגר.
+    """
+    store = get_credential_store()
+    creds = store.get(user_id)
+    if creds is not None:
+        return creds
+
+    if LOCAL_DEV and user_id == DEFAULT_USER:
+        # פולבק לפיתוח מקומי (רק אם הגדרת LOCAL_DEV=1)
+        if not os.path.exists("credentials.json"):
+            raise RuntimeError(
+                "credentials.json not found for local dev flow. "
+                "Either place it locally or use the web OAuth via /oauth2/start."
+            )
+        from google_auth_oauthlib.flow import InstalledAppFlow
+        flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
+        # פתח דפדפן בלוקאל:
+        creds = flow.run_local_server(port=0)
+        store.put(user_id, creds)
+        return creds
+
+    # בשרת – אין טוקן => צריך קודם להשלים OAuth ב-/oauth2/start
+    raise RuntimeError("No token found. Complete OAuth: GET /oauth2/start and finish the login.")
 
 
 # -----------------------------
 # שירות גוגל קלנדר – מאוחד לשרת/לוקאל
 # -----------------------------
-def get_calendar_service():
+def get_calendar_service(user_id: str = DEFAULT_USER):
     """
-    בשרת (Render): קורא token.json מ-TOKEN_DIR (נוצר ע"י /oauth2callback).
-    בלוקאל (רק אם LOCAL_DEV=1): מבצע InstalledAppFlow מקובץ credentials.json ושומר token.json ל-TOKEN_DIR.
+    מחזיר service של Calendar למשתמש מהמאגר (אחד לכל thread ומשתמש), ובונה אותו רק כשהאישורים התחלפו.
     """
-    creds = _load_creds_from_token_file()
-
-    if not creds:
-        if LOCAL_DEV:
-            # פולבק לפיתוח מקומי (רק אם הגדרת LOCAL_DEV=1)
-            if not os.path.exists("credentials.json"):
-                raise RuntimeError(
-                    "credentials.json not found for local dev flow. "
-                    "Either place it locally or use the web OAuth via /oauth2/start."
-                )
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
-            # פתח דפדפן בלוקאל:
-            creds = flow.run_local_server(port=0)
-            os.makedirs(TOKEN_DIR, exist_ok=True)
-            with open(TOKEN_PATH, "w", encoding="utf-8") as f:
-                f.write(creds.to_json())
-        else:
-            # בשרת – אין טוקן => צריך קודם להשלים OAuth ב-/oauth2/start
-            raise RuntimeError("No token found. Complete OAuth: GET /oauth2/start and finish the login.")
-
-    # רענון אוטומטי אם צריך
-    if creds and creds.expired and creds.refresh_token:
-        creds.refresh(Request())
-        # עדכון הקובץ לאחר רענון
-        os.makedirs(TOKEN_DIR, exist_ok=True)
-        with open(TOKEN_PATH, "w", encoding="utf-8") as f:
-            f.write(creds.to_json())
-
-    return build("calendar", "v3", credentials=creds)
+    creds = _get_credentials(user_id)
+    services = getattr(_service_local, "services", None)
+    if services is None:
+        services = _service_local.services = {}
+    cached = services.get(user_id)
+    if cached is None or cached[0] is not creds:
+        from google_auth_httplib2 import AuthorizedHttp
+        from googleapiclient.discovery import build
+        from http_transport import new_http
+
+        http = AuthorizedHttp(creds, http=new_http())
+        service = build("calendar", "v3", http=http, cache_discovery=False)
+        service.calendar_user = user_id  # מפתח המטמון והערוצים של המשתמש (calendar_cache / calendar_watch)
+        cached = services[user_id] = (creds, service)
+    return cached[1]